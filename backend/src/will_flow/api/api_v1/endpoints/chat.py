@@ -1,8 +1,10 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
-from will_flow.models.chat import ChatRequest, ChatResponse, ChatSession, ThreadInfo
+from will_flow.core.etag import conditional_response, make_etag
+from will_flow.core.serialization import ModelResponse
+from will_flow.models.chat import ChatRequest, ChatResponse, ChatSearchResponse, ChatSession, ThreadInfo
 from will_flow.services.chat_service import ChatService
 
 router = APIRouter()
@@ -15,7 +17,7 @@ async def chat(chat_request: ChatRequest):
     Process a chat message and return a response.
     """
     try:
-        return await chat_service.process_chat(chat_request)
+        return ModelResponse(await chat_service.process_chat(chat_request))
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
@@ -23,28 +25,50 @@ async def chat(chat_request: ChatRequest):
 
 
 @router.get("/session/{session_id}", response_model=ChatSession)
-async def get_chat_session(session_id: str):
+async def get_chat_session(session_id: str, request: Request):
     """
-    Get a chat session by ID.
+    Get a chat session by ID. Answers 304 when ``If-None-Match`` has the current ETag.
     """
     session = await chat_service.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Chat session not found")
-    return session
+    # Titles and summaries are written in the background without bumping updated_at
+    etag = make_etag([(session.id, session.updated_at, len(session.messages), session.title, session.summary_message_count)])
+    return conditional_response(request, etag, lambda: ModelResponse(session))
 
 
 @router.get("/threads", response_model=List[ThreadInfo])
-async def list_threads(user_email: str, flow_id: Optional[str] = None):
+async def list_threads(request: Request, user_email: str, flow_id: Optional[str] = None):
     """
     List all threads for a user, optionally filtered by flow ID.
     """
     try:
         threads = await chat_service.list_user_threads(user_email, flow_id)
-        return threads
+        etag = make_etag((thread.id, thread.updated_at, thread.message_count, thread.title, thread.summary) for thread in threads)
+        return conditional_response(request, etag, lambda: ModelResponse(threads))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error listing threads: {str(e)}")
 
 
+@router.get("/search", response_model=ChatSearchResponse)
+async def search_chat_history(
+    user_email: str,
+    q: str = Query(..., min_length=1, description="Words to look for in messages and thread titles"),
+    flow_id: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """
+    Search a user's chat history, returning matching threads with highlighted message snippets.
+    """
+    try:
+        return await chat_service.search_messages(user_email, q, flow_id, limit, cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching chat history: {str(e)}")
+
+
 @router.put("/session/{session_id}/title", response_model=ChatSession)
 async def update_thread_title(session_id: str, title: str):
     """
@@ -0,0 +1,116 @@
+import secrets
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import PlainTextResponse, Response
+
+from will_flow.core.config import settings
+from will_flow.core.loop_monitor import loop_monitor
+from will_flow.core.profiling import profiler
+from will_flow.core.slow_log import slow_log
+from will_flow.core.tracing import render_waterfall, tracer
+from will_flow.services.ragflow_service import ragflow_service
+
+
+async def require_admin_token(x_profile_token: str = Header("")):
+    """
+    Debug endpoints expose request internals: only serve them with ``X-Profile-Token: $PROFILING_ADMIN_TOKEN``.
+    """
+    token = settings.PROFILING_ADMIN_TOKEN
+    if not token:
+        raise HTTPException(status_code=403, detail="Debug endpoints are disabled, set PROFILING_ADMIN_TOKEN")
+    if not secrets.compare_digest(x_profile_token, token):
+        raise HTTPException(status_code=403, detail="Invalid X-Profile-Token")
+
+
+router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+
+@router.get("/traces", response_model=List[Dict[str, Any]])
+async def list_traces(
+    min_duration_ms: float = Query(0.0, ge=0, description="Only requests that took at least this long"),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """
+    Recent requests, slowest first.
+    """
+    return [trace.summary() for trace in tracer.slowest(min_duration_ms, limit)]
+
+
+@router.get("/traces/{trace_id}")
+async def get_trace(trace_id: str, format: str = Query("json", pattern="^(json|text)$")):
+    """
+    Spans of a recent request. ``format=text`` renders them as a waterfall.
+    """
+    trace = tracer.find(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail=f"Trace {trace_id} not found or no longer kept")
+    
+    if format == "text":
+        return PlainTextResponse(render_waterfall(trace))
+    return trace.to_dict()
+
+
+@router.get("/slow-operations", response_model=List[Dict[str, Any]])
+async def list_slow_operations(
+    kind: Optional[str] = Query(None, pattern="^(opensearch|ragflow|openrouter)$"),
+    limit: int = Query(50, ge=1, le=200)
+):
+    """
+    Recent upstream calls that went over their slow log budget, newest first.
+    """
+    return slow_log.entries(kind)[:limit]
+
+
+@router.get("/event-loop", response_model=Dict[str, Any])
+async def get_event_loop_lag():
+    """
+    Recent event loop lag, and the stalls over the threshold with the stack that blocked the loop.
+    """
+    return loop_monitor.summary()
+
+
+@router.get("/ragflow-breakers", response_model=Dict[str, Any])
+async def get_ragflow_breakers():
+    """
+    State of the RAGFlow circuit breakers, with call counts and latencies.
+    """
+    return {
+        "api_url": ragflow_service.api_url,
+        "hedging_enabled": settings.RAGFLOW_HEDGING_ENABLED,
+        "breakers": ragflow_service.breaker_states()
+    }
+
+
+@router.get("/profiles", response_model=List[Dict[str, Any]])
+async def list_profiles():
+    """
+    Recently profiled requests, newest first.
+    """
+    return [profile.summary() for profile in profiler.recent()]
+
+
+@router.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, format: str = Query("folded", pattern="^(folded|text|pstats)$")):
+    """
+    Profile of a request. ``folded`` is the sampling profile as folded stacks for flame
+    graph tools; ``text`` and ``pstats`` are the deterministic profile as a summary and
+    as a pstats file.
+    """
+    profile = profiler.find(profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail=f"Profile {profile_id} not found or no longer kept")
+    
+    if format == "folded":
+        if profile.mode != "sampling":
+            raise HTTPException(status_code=400, detail=f"Profile {profile_id} is {profile.mode}, use format=text or pstats")
+        return PlainTextResponse(profile.folded())
+    if profile.mode != "deterministic":
+        raise HTTPException(status_code=400, detail=f"Profile {profile_id} is {profile.mode}, use format=folded")
+    if format == "text":
+        return PlainTextResponse(profile.stats_text())
+    return Response(
+        profile.pstats_data,
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{profile_id}.pstats"'}
+    )
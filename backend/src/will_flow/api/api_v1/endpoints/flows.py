@@ -1,31 +1,65 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 
-from will_flow.models.flow import Flow, FlowCreate, FlowUpdate
+from will_flow.core.etag import conditional_response, make_etag
+from will_flow.core.serialization import ModelResponse
+
+from will_flow.models.flow import Flow, FlowCreate, FlowSearchResult, FlowUpdate
 from will_flow.services.flow_service import FlowService
+from will_flow.services.kb_service import kb_service
 
 router = APIRouter()
 flow_service = FlowService()
 
 
+async def _check_kb_ids(kb_ids: Optional[List[str]]) -> None:
+    """Reject knowledge base IDs that don't exist"""
+    if not kb_ids:
+        return
+    found = {kb.id for kb in await kb_service.get_kbs(kb_ids)}
+    missing = [kb_id for kb_id in kb_ids if kb_id not in found]
+    if missing:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Knowledge bases not found: {', '.join(missing)}"
+        )
+
+
 @router.post("/", response_model=Flow)
 async def create_flow(flow: FlowCreate):
     """
     Create a new flow.
     """
+    await _check_kb_ids(flow.kb_ids)
     return await flow_service.create_flow(flow)
 
 
+@router.get("/search", response_model=List[FlowSearchResult])
+async def search_flows(
+    q: Optional[str] = Query(None, description="Words to look for in flow names and descriptions, the last one as a prefix"),
+    model: Optional[List[str]] = Query(None, description="Only flows using one of these models"),
+    creator_email: Optional[str] = None,
+    limit: int = Query(10, ge=1, le=50)
+):
+    """
+    Search flows for typeahead, returning a small projection of each match.
+    """
+    try:
+        return await flow_service.search_flows(q, model, creator_email, limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error searching flows: {str(e)}")
+
+
 @router.get("/{flow_id}", response_model=Flow)
-async def get_flow(flow_id: str):
+async def get_flow(flow_id: str, request: Request):
     """
     Get flow by ID.
     """
     flow = await flow_service.get_flow(flow_id)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
-    return flow
+    return conditional_response(request, make_etag([(flow.id, flow.updated_at)]), lambda: ModelResponse(flow))
 
 
 @router.put("/{flow_id}", response_model=Flow)
@@ -33,6 +67,7 @@ async def update_flow(flow_id: str, flow_update: FlowUpdate):
     """
     Update a flow.
     """
+    await _check_kb_ids(flow_update.kb_ids)
     flow = await flow_service.update_flow(flow_id, flow_update)
     if not flow:
         raise HTTPException(status_code=404, detail="Flow not found")
@@ -52,6 +87,7 @@ async def delete_flow(flow_id: str):
 
 @router.get("/", response_model=List[Flow])
 async def list_flows(
+    request: Request,
     creator_email: Optional[str] = None,
     limit: int = 100,
     offset: int = 0
@@ -59,4 +95,6 @@ async def list_flows(
     """
     List flows, optionally filtered by creator email.
     """
-    return await flow_service.list_flows(creator_email, limit, offset) 
\ No newline at end of file
+    flows = await flow_service.list_flows(creator_email, limit, offset)
+    etag = make_etag((flow.id, flow.updated_at) for flow in flows)
+    return conditional_response(request, etag, lambda: ModelResponse(flows)) 
\ No newline at end of file
@@ -1,14 +1,122 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query
+from typing import List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Request
+from fastapi.responses import StreamingResponse
+import asyncio
 import httpx
 import datetime
+import io
+import json
 import logging
+import mimetypes
+import os
+import tarfile
+import zipfile
 
-from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, DocumentInfo
+from will_flow.core.config import settings
+from will_flow.core.etag import conditional_response, make_etag
+from will_flow.core.serialization import ModelResponse
+from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, DocumentInfo, UploadJob, UploadResult, DocumentStatusEvent
+from will_flow.services.chat_service import ChatService
+from will_flow.services.circuit_breaker import CircuitOpenError
+from will_flow.services.content_hash import build_hash_index, hash_content, read_upload_with_hash
+from will_flow.services.document_event_service import document_event_service
+from will_flow.services.document_sync_service import document_sync_service
+from will_flow.services.kb_chat_service import kb_chat_service
 from will_flow.services.kb_service import kb_service
 from will_flow.services.ragflow_service import ragflow_service
+from will_flow.services.upload_job_service import upload_job_service
 
 router = APIRouter()
+chat_service = ChatService()
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+SSE_HEARTBEAT_SECONDS = 15.0
+
+
+def _is_hidden_member(name: str) -> bool:
+    """Skip directory entries and OS metadata files found in archives"""
+    parts = name.replace("\\", "/").split("/")
+    return any(part.startswith(".") or part == "__MACOSX" for part in parts if part)
+
+
+def _added_events(kb_id: str, doc_infos: List[DocumentInfo]) -> List[DocumentStatusEvent]:
+    """Events announcing newly uploaded documents to knowledge base watchers"""
+    return [
+        DocumentStatusEvent(kb_id=kb_id, doc_id=doc.doc_id, status=doc.status, file_name=doc.file_name)
+        for doc in doc_infos
+    ]
+
+
+async def _remove_replaced(kb_id: str, replaced: List[DocumentInfo]) -> List[str]:
+    """Delete replaced documents from RAGFlow, returning the IDs to drop from the knowledge base"""
+    doc_ids = [doc.doc_id for doc in replaced]
+    if doc_ids and not await ragflow_service.delete_documents(kb_id, doc_ids):
+        # Keep the records so the documents still in RAGFlow stay visible
+        logging.getLogger(__name__).warning(f"Could not delete replaced documents {doc_ids} from RAGFlow")
+        return []
+    return doc_ids
+
+
+class _UploadLimits:
+    """Files and bytes a batch upload may still add, checked before anything is extracted"""
+
+    def __init__(self):
+        self.files = settings.KB_UPLOAD_MAX_FILES
+        self.bytes = settings.KB_UPLOAD_MAX_BYTES
+
+    def take(self, size: int) -> None:
+        self.files -= 1
+        self.bytes -= size
+        if self.files < 0:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Too many files (maximum is {settings.KB_UPLOAD_MAX_FILES})"
+            )
+        if self.bytes < 0:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Upload too large (maximum is {settings.KB_UPLOAD_MAX_BYTES} bytes uncompressed)"
+            )
+
+
+def _member_name(names: Set[str], archive_name: str, path: str) -> str:
+    """File name of an archive member, which must be unique once directories are dropped"""
+    name = os.path.basename(path)
+    if name in names:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Archive {archive_name} contains several files named {name}"
+        )
+    names.add(name)
+    return name
+
+
+def _expand_archive(file_name: str, content: bytes, limits: _UploadLimits) -> List[Tuple[str, Optional[str], bytes]]:
+    """Return the regular files contained in a zip or tar archive
+
+    Each member's uncompressed size is charged to ``limits`` before it is
+    read, so an archive bomb is rejected without being decompressed.
+    """
+    entries = []
+    names: Set[str] = set()
+    if file_name.lower().endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or _is_hidden_member(info.filename):
+                    continue
+                name = _member_name(names, file_name, info.filename)
+                # Reads stop at file_size, so the declared size is all that can come out
+                limits.take(info.file_size)
+                entries.append((name, mimetypes.guess_type(name)[0], archive.read(info)))
+    else:
+        with tarfile.open(fileobj=io.BytesIO(content), mode="r:*") as archive:
+            for member in archive:
+                if not member.isfile() or _is_hidden_member(member.name):
+                    continue
+                name = _member_name(names, file_name, member.name)
+                limits.take(member.size)
+                entries.append((name, mimetypes.guess_type(name)[0], archive.extractfile(member).read()))
+    return entries
 
 
 @router.post("", response_model=KnowledgeBase)
@@ -43,12 +151,14 @@ async def create_knowledge_base(
 
 @router.get("", response_model=List[KnowledgeBase])
 async def list_knowledge_bases(
+    request: Request,
     user_email: str = Query(..., description="User email")
 ):
     """List knowledge bases for a user"""
     try:
         kbs = await kb_service.list_kbs_by_user(user_email)
-        return kbs
+        etag = make_etag((kb.id, kb.updated_at) for kb in kbs)
+        return conditional_response(request, etag, lambda: ModelResponse(kbs))
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -57,7 +167,7 @@ async def list_knowledge_bases(
 
 
 @router.get("/{kb_id}", response_model=KnowledgeBase)
-async def get_knowledge_base(kb_id: str):
+async def get_knowledge_base(kb_id: str, request: Request):
     """Get a knowledge base by ID"""
     kb = await kb_service.get_kb(kb_id)
     if not kb:
@@ -65,7 +175,7 @@ async def get_knowledge_base(kb_id: str):
             status_code=404,
             detail=f"Knowledge base with ID {kb_id} not found"
         )
-    return kb
+    return conditional_response(request, make_etag([(kb.id, kb.updated_at)]), lambda: ModelResponse(kb))
 
 
 @router.put("/{kb_id}", response_model=KnowledgeBase)
@@ -109,9 +219,14 @@ async def delete_knowledge_base(kb_id: str):
 @router.post("/{kb_id}/documents", response_model=DocumentInfo)
 async def upload_document(
     kb_id: str,
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    replace: bool = Query(False, description="Replace documents with the same file name if the content changed")
 ):
-    """Upload a document to a knowledge base"""
+    """Upload a document to a knowledge base
+
+    If the knowledge base already has a document with the same content, that
+    document is returned and nothing is uploaded.
+    """
     # Check if knowledge base exists
     kb = await kb_service.get_kb(kb_id)
     if not kb:
@@ -120,14 +235,31 @@ async def upload_document(
             detail=f"Knowledge base with ID {kb_id} not found"
         )
     
+    content, content_hash = await read_upload_with_hash(file)
+    existing = build_hash_index(kb.documents).get(content_hash)
+    if existing:
+        return existing
+    
     try:
         # Upload to RAGFlow
-        doc_info = await ragflow_service.upload_document(kb_id, file)
+        doc_info = await ragflow_service.upload_document_content(kb_id, file.filename, file.content_type, content)
+        doc_info.content_hash = content_hash
+        
+        removed = []
+        if replace and doc_info.status != "failed":
+            removed = await _remove_replaced(kb_id, [doc for doc in kb.documents if doc.file_name == file.filename])
         
         # Update in OpenSearch
-        await kb_service.add_document(kb_id, doc_info)
+        await kb_service.add_documents(kb_id, [doc_info], remove_doc_ids=removed)
+        await document_event_service.publish(_added_events(kb_id, [doc_info]))
+        await document_sync_service.wake()
         
         return doc_info
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"RAGFlow is unavailable: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -135,9 +267,179 @@ async def upload_document(
         )
 
 
+@router.post("/{kb_id}/documents/batch", response_model=UploadJob)
+async def upload_documents(
+    kb_id: str,
+    files: List[UploadFile] = File(...),
+    extract_archives: bool = Query(True, description="Upload the contents of zip/tar files instead of the archive itself"),
+    wait: bool = Query(True, description="Wait for all uploads to finish before responding"),
+    replace: bool = Query(False, description="Replace documents with the same file name if the content changed")
+):
+    """Upload several documents, or zip/tar archives of documents, to a knowledge base
+
+    Files whose content is already in the knowledge base, or earlier in the
+    same request, are not uploaded again and are reported as duplicates.
+    """
+    # Check if knowledge base exists
+    kb = await kb_service.get_kb(kb_id)
+    if not kb:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Knowledge base with ID {kb_id} not found"
+        )
+    
+    # Read everything up front, the uploaded files are closed once the request ends
+    entries = []
+    limits = _UploadLimits()
+    for file in files:
+        content, content_hash = await read_upload_with_hash(file)
+        if extract_archives and file.filename and file.filename.lower().endswith(ARCHIVE_SUFFIXES):
+            try:
+                members = await asyncio.to_thread(_expand_archive, file.filename, content, limits)
+                hashes = await asyncio.to_thread(lambda: [hash_content(member[2]) for member in members])
+                entries.extend(member + (member_hash,) for member, member_hash in zip(members, hashes))
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Could not read archive {file.filename}: {str(e)}"
+                )
+        else:
+            limits.take(len(content))
+            entries.append((file.filename, file.content_type, content, content_hash))
+    
+    if not entries:
+        raise HTTPException(status_code=400, detail="No files to upload")
+    
+    # Only the first file with a given content is uploaded
+    hash_index = build_hash_index(kb.documents)
+    uploads = {}
+    for file_name, content_type, content, content_hash in entries:
+        if content_hash not in hash_index and content_hash not in uploads:
+            uploads[content_hash] = (file_name, content_type, content)
+    
+    job = upload_job_service.create_job(kb_id, len(entries))
+    
+    async def run_job():
+        upload_job_service.mark_running(job)
+        try:
+            upload_results = await ragflow_service.upload_documents(
+                kb_id,
+                list(uploads.values()),
+                on_result=lambda result: upload_job_service.record_result(job, result)
+            )
+            uploaded = dict(zip(uploads, upload_results))
+            for content_hash, result in uploaded.items():
+                if result.document:
+                    result.document.content_hash = content_hash
+            
+            # Report every file in request order, pointing duplicates at the
+            # document that holds their content
+            results = []
+            pending = dict(uploaded)
+            for file_name, _, _, content_hash in entries:
+                if content_hash in pending:
+                    results.append(pending.pop(content_hash))
+                    continue
+                original = hash_index.get(content_hash) or uploaded[content_hash].document
+                duplicate = UploadResult(
+                    file_name=file_name,
+                    success=original is not None and original.status != "failed",
+                    document=original,
+                    duplicate=True
+                )
+                upload_job_service.record_result(job, duplicate)
+                results.append(duplicate)
+            job.results = results
+            
+            # Record all uploaded documents in one write
+            doc_infos = [result.document for result in upload_results if result.success and result.document]
+            removed = []
+            if replace:
+                names = {doc.file_name for doc in doc_infos}
+                new_ids = {doc.doc_id for doc in doc_infos}
+                removed = await _remove_replaced(
+                    kb_id, [doc for doc in kb.documents if doc.file_name in names and doc.doc_id not in new_ids]
+                )
+            saved = await kb_service.add_documents(kb_id, doc_infos, remove_doc_ids=removed)
+            upload_job_service.finish(job, saved)
+            if saved:
+                await document_event_service.publish(_added_events(kb_id, doc_infos))
+            await document_sync_service.wake()
+        except Exception as e:
+            logging.getLogger(__name__).error(f"Upload job {job.job_id} failed: {str(e)}", exc_info=True)
+            upload_job_service.finish(job, False)
+    
+    if wait:
+        await run_job()
+    else:
+        upload_job_service.run_in_background(run_job())
+    
+    return job
+
+
+@router.get("/{kb_id}/upload-jobs/{job_id}", response_model=UploadJob)
+async def get_upload_job(kb_id: str, job_id: str):
+    """Get the progress of a multi-file upload"""
+    job = upload_job_service.get_job(job_id)
+    if not job or job.kb_id != kb_id:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Upload job with ID {job_id} not found in knowledge base {kb_id}"
+        )
+    return job
+
+
+@router.get("/{kb_id}/events")
+async def stream_document_events(kb_id: str, request: Request):
+    """Stream document status changes for a knowledge base as server-sent events
+
+    The stream starts with a ``snapshot`` event holding the current documents,
+    followed by a ``status`` event for every upload and status transition.
+    """
+    # Subscribe before reading the snapshot, so no change can fall in between
+    queue = document_event_service.subscribe(kb_id)
+    kb = await kb_service.get_kb(kb_id)
+    if not kb:
+        document_event_service.unsubscribe(kb_id, queue)
+        raise HTTPException(
+            status_code=404,
+            detail=f"Knowledge base with ID {kb_id} not found"
+        )
+    
+    async def event_stream():
+        try:
+            snapshot = [doc.model_dump(mode="json") for doc in kb.documents]
+            yield f"event: snapshot\ndata: {json.dumps(snapshot)}\n\n"
+            
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # Comment line to keep proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: status\ndata: {event.model_dump_json()}\n\n"
+        finally:
+            document_event_service.unsubscribe(kb_id, queue)
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{kb_id}/documents/{doc_id}", response_model=DocumentInfo)
-async def get_document_status(kb_id: str, doc_id: str):
-    """Get the status of a document"""
+async def get_document_status(
+    kb_id: str,
+    doc_id: str,
+    refresh: bool = Query(False, description="Check the status in RAGFlow instead of the locally synced one")
+):
+    """Get the status of a document
+
+    Statuses are kept up to date by the background document sync, so this is
+    served from OpenSearch unless ``refresh`` is set.
+    """
     # Check if knowledge base exists
     kb = await kb_service.get_kb(kb_id)
     if not kb:
@@ -159,6 +461,9 @@ async def get_document_status(kb_id: str, doc_id: str):
             detail=f"Document with ID {doc_id} not found in knowledge base {kb_id}"
         )
     
+    if not refresh:
+        return doc_info
+    
     try:
         # Get status from RAGFlow
         status = await ragflow_service.get_document_status(kb_id, doc_id)
@@ -169,6 +474,11 @@ async def get_document_status(kb_id: str, doc_id: str):
             doc_info.status = status
         
         return doc_info
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503,
+            detail=f"RAGFlow is unavailable: {str(e)}"
+        )
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -176,12 +486,94 @@ async def get_document_status(kb_id: str, doc_id: str):
         )
 
 
+async def _chat_history(session_id: Optional[str]) -> List[dict]:
+    """Messages of an existing chat session, used as conversation history"""
+    if not session_id:
+        return []
+    session = await chat_service.get_session(session_id)
+    if not session:
+        return []
+    return [{"role": msg.role, "content": msg.content} for msg in session.messages]
+
+
+async def _answer_from_kbs(
+    kb_ids: List[str],
+    query: str,
+    history: List[dict],
+    stream: bool,
+    model: Optional[str]
+):
+    """Answer from one or more knowledge bases, optionally as server-sent events"""
+    if stream:
+        async def event_stream():
+            try:
+                async for event in kb_chat_service.stream_answer(kb_ids, query, history, model):
+                    yield f"event: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+            except Exception as e:
+                logging.getLogger(__name__).error(f"Knowledge base chat stream failed: {str(e)}")
+                yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        
+        return StreamingResponse(
+            event_stream(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+        )
+    
+    # TODO: Save conversation to chat history if needed
+    
+    return await kb_chat_service.answer(kb_ids, query, history, model)
+
+
+@router.post("/chat")
+async def chat_with_kbs(
+    kb_ids: List[str] = Form(..., description="Knowledge base IDs to search; repeat the field or separate with commas"),
+    query: str = Form(...),
+    session_id: Optional[str] = Form(None),
+    user_email: str = Form(...),
+    stream: bool = Form(False, description="Stream the answer as server-sent events"),
+    model: Optional[str] = Form(None, description="OpenRouter model used to generate the answer")
+):
+    """Chat with several knowledge bases at once
+
+    Retrieval runs against every knowledge base concurrently with a per-KB
+    timeout; knowledge bases that time out or fail are reported in the
+    response instead of failing the request.
+    """
+    # Accept both repeated fields and comma separated values, keeping order
+    kb_ids = list(dict.fromkeys(
+        kb_id.strip() for value in kb_ids for kb_id in value.split(",") if kb_id.strip()
+    ))
+    if not kb_ids:
+        raise HTTPException(status_code=400, detail="At least one knowledge base ID is required")
+    
+    # Check if knowledge bases exist
+    kbs = await kb_service.get_kbs(kb_ids)
+    missing = set(kb_ids) - {kb.id for kb in kbs}
+    if missing:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Knowledge bases not found: {', '.join(sorted(missing))}"
+        )
+    
+    try:
+        history = await _chat_history(session_id)
+        return await _answer_from_kbs(kb_ids, query, history, stream, model)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to chat with knowledge bases: {str(e)}"
+        )
+
+
 @router.post("/{kb_id}/chat")
 async def chat_with_kb(
     kb_id: str,
     query: str = Form(...),
     session_id: Optional[str] = Form(None),
-    user_email: str = Form(...)
+    user_email: str = Form(...),
+    mode: str = Form("answer", description="'answer' for an LLM answer with citations, 'excerpts' for the raw top chunks"),
+    stream: bool = Form(False, description="Stream the answer as server-sent events"),
+    model: Optional[str] = Form(None, description="OpenRouter model used to generate the answer")
 ):
     """Chat with a knowledge base"""
     # Check if knowledge base exists
@@ -192,17 +584,18 @@ async def chat_with_kb(
             detail=f"Knowledge base with ID {kb_id} not found"
         )
     
+    if mode not in ("answer", "excerpts"):
+        raise HTTPException(status_code=400, detail=f"Unknown chat mode: {mode}")
+    
     try:
         # Get history if session_id is provided
-        history = []
-        # TODO: Implement history retrieval from chat service if needed
-        
-        # Chat with RAGFlow
-        response = await ragflow_service.chat_with_knowledge_base(kb_id, query, history)
+        history = await _chat_history(session_id)
         
-        # TODO: Save conversation to chat history if needed
+        if mode == "excerpts":
+            # Chat with RAGFlow
+            return await ragflow_service.chat_with_knowledge_base(kb_id, query, history)
         
-        return response
+        return await _answer_from_kbs([kb_id], query, history, stream, model)
     except Exception as e:
         raise HTTPException(
             status_code=500,
@@ -244,4 +637,4 @@ async def test_ragflow_connection():
             "error": str(e),
             "error_type": type(e).__name__,
             "connection_time": datetime.datetime.utcnow().isoformat()
-        } 
\ No newline at end of file
+        }
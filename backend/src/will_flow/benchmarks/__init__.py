@@ -0,0 +1,4 @@
+"""Performance benchmarks for Will Flow hot paths.
+
+Each module can be run on its own, e.g. ``python -m will_flow.benchmarks.rerank``.
+"""
@@ -0,0 +1,352 @@
+"""End-to-end load test of the Will Flow API.
+
+Usage: python -m will_flow.benchmarks.load [--scenario chat_turn=4 --scenario kb_chat=1 ...]
+       [--rps 20 | --concurrency 8] [--duration 30] [--json results.json]
+
+By default the app runs in-process behind httpx's ASGI transport, with
+OpenSearch, RAGFlow and OpenRouter replaced by the fakes in
+``will_flow.testing``, so the run is fully offline and repeatable. ``--url``
+loads a running server instead, with whatever upstreams it is configured for.
+
+Scenarios are picked at random by weight: ``chat_turn`` (a message in an
+existing thread), ``new_thread``, ``thread_listing``, ``kb_upload`` and
+``kb_chat``. With ``--concurrency`` every worker sends its next request as
+soon as the last one finished (closed loop). With ``--rps`` requests start
+on a fixed schedule whether or not earlier ones finished (open loop), and
+latency is measured from the scheduled start, so queueing under overload
+shows up in the percentiles instead of lowering the request rate.
+
+Exits with status 1 when the error rate is over ``--max-error-rate``.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from collections import Counter
+from contextlib import AsyncExitStack
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+API = "/api/v1"
+QUESTIONS = [
+    "How do I rotate the API keys for the staging cluster?",
+    "Summarise the retention policy for archived invoices.",
+    "What changed in the last release of the billing service?",
+    "Which metrics should I alert on for the ingestion pipeline?",
+    "Explain the difference between the two deployment modes.",
+]
+
+
+class VirtualUser:
+    """Data one simulated user works with: a flow, a knowledge base and a thread"""
+
+    def __init__(self, email: str):
+        self.email = email
+        self.flow_id = ""
+        self.kb_id = ""
+        self.session_id = ""
+
+
+Scenario = Callable[[httpx.AsyncClient, VirtualUser, random.Random], Awaitable[httpx.Response]]
+
+
+async def chat_turn(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    return await client.post(f"{API}/chat/", json={
+        "flow_id": user.flow_id,
+        "user_email": user.email,
+        "message": rng.choice(QUESTIONS),
+        "session_id": user.session_id,
+        "delta": True  # As the frontend sends it
+    })
+
+
+async def new_thread(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    return await client.post(f"{API}/chat/", json={
+        "flow_id": user.flow_id,
+        "user_email": user.email,
+        "message": rng.choice(QUESTIONS),
+        "new_thread": True,
+        "delta": True
+    })
+
+
+async def thread_listing(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    return await client.get(f"{API}/chat/threads", params={"user_email": user.email})
+
+
+async def kb_upload(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    # Unique content, so the upload is not deduplicated away
+    content = f"Load test document {uuid.uuid4()}\n\n" + " ".join(rng.choice(QUESTIONS) for _ in range(50))
+    return await client.post(
+        f"{API}/knowledge-bases/{user.kb_id}/documents",
+        files={"file": (f"doc-{uuid.uuid4().hex[:8]}.txt", content.encode(), "text/plain")}
+    )
+
+
+async def kb_chat(client: httpx.AsyncClient, user: VirtualUser, rng: random.Random) -> httpx.Response:
+    return await client.post(
+        f"{API}/knowledge-bases/{user.kb_id}/chat",
+        data={"query": rng.choice(QUESTIONS), "user_email": user.email}
+    )
+
+
+SCENARIOS: Dict[str, Scenario] = {
+    "chat_turn": chat_turn,
+    "new_thread": new_thread,
+    "thread_listing": thread_listing,
+    "kb_upload": kb_upload,
+    "kb_chat": kb_chat,
+}
+
+DEFAULT_MIX = {"chat_turn": 5, "new_thread": 1, "thread_listing": 3, "kb_upload": 1, "kb_chat": 2}
+
+
+async def setup_users(client: httpx.AsyncClient, count: int, model: str) -> List[VirtualUser]:
+    """Create a knowledge base with a document, a flow and a thread for every user"""
+    async def setup(i: int) -> VirtualUser:
+        user = VirtualUser(f"load-{i}@example.com")
+        response = await client.post(f"{API}/users/", json={"email": user.email})
+        response.raise_for_status()
+
+        response = await client.post(
+            f"{API}/knowledge-bases", params={"user_email": user.email}, json={"name": f"Load test KB {i}"}
+        )
+        response.raise_for_status()
+        user.kb_id = response.json()["id"]
+        await kb_upload(client, user, random.Random(i))
+
+        response = await client.post(f"{API}/flows/", json={
+            "name": f"Load test flow {i}",
+            "system_prompt": "You are a helpful assistant.",
+            "model": model,
+            "creator_email": user.email
+        })
+        response.raise_for_status()
+        user.flow_id = response.json()["id"]
+
+        response = await new_thread(client, user, random.Random(i))
+        response.raise_for_status()
+        user.session_id = response.json()["session_id"]
+        return user
+
+    return list(await asyncio.gather(*(setup(i) for i in range(count))))
+
+
+class Recorder:
+    def __init__(self):
+        self.results: List[Tuple[str, float, Optional[str]]] = []  # Scenario, seconds, error
+
+    async def call(self, name: str, scenario: Scenario, client: httpx.AsyncClient, user: VirtualUser,
+                   rng: random.Random, started: Optional[float] = None) -> None:
+        start = started if started is not None else time.perf_counter()
+        error = None
+        try:
+            response = await scenario(client, user, rng)
+            if response.status_code >= 400:
+                error = str(response.status_code)
+        except Exception as e:
+            error = type(e).__name__
+        self.results.append((name, time.perf_counter() - start, error))
+
+
+def _pick(rng: random.Random, mix: Dict[str, float]) -> str:
+    return rng.choices(list(mix), weights=list(mix.values()))[0]
+
+
+async def run_closed_loop(client: httpx.AsyncClient, users: List[VirtualUser], mix: Dict[str, float],
+                          concurrency: int, duration: float, seed: int) -> Recorder:
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    async def worker(n: int) -> None:
+        rng = random.Random(seed + n)
+        while time.perf_counter() < deadline:
+            name = _pick(rng, mix)
+            await recorder.call(name, SCENARIOS[name], client, rng.choice(users), rng)
+
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    return recorder
+
+
+async def run_open_loop(client: httpx.AsyncClient, users: List[VirtualUser], mix: Dict[str, float],
+                        rps: float, duration: float, max_in_flight: int, seed: int) -> Recorder:
+    recorder = Recorder()
+    rng = random.Random(seed)
+    semaphore = asyncio.Semaphore(max_in_flight)
+    start = time.perf_counter()
+    tasks = []
+
+    async def send(name: str, user: VirtualUser, scheduled: float, request_rng: random.Random) -> None:
+        async with semaphore:
+            await recorder.call(name, SCENARIOS[name], client, user, request_rng, started=scheduled)
+
+    for i in range(int(rps * duration)):
+        scheduled = start + i / rps
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = _pick(rng, mix)
+        tasks.append(asyncio.create_task(send(name, rng.choice(users), scheduled, random.Random(rng.random()))))
+
+    await asyncio.gather(*tasks)
+    return recorder
+
+
+def _percentile(ordered: List[float], percentile: float) -> float:
+    index = max(0, min(len(ordered) - 1, int(round(percentile / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def summarize(results: List[Tuple[str, float, Optional[str]]], elapsed: float) -> Dict[str, Dict[str, Any]]:
+    """Throughput, latency percentiles (ms) and errors per scenario and overall"""
+    groups: Dict[str, List[Tuple[str, float, Optional[str]]]] = {}
+    for result in results:
+        groups.setdefault(result[0], []).append(result)
+    groups["all"] = list(results)
+
+    summary = {}
+    for name, group in groups.items():
+        latencies = sorted(seconds * 1000 for _, seconds, _ in group)
+        errors = Counter(error for _, _, error in group if error)
+        summary[name] = {
+            "requests": len(group),
+            "rps": round(len(group) / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(sum(errors.values()) / len(group), 4) if group else 0.0,
+            "errors": dict(errors),
+            **{
+                f"p{p}_ms": round(_percentile(latencies, p), 2) if latencies else None
+                for p in (50, 90, 95, 99)
+            },
+            "max_ms": round(latencies[-1], 2) if latencies else None
+        }
+    return summary
+
+
+def print_report(summary: Dict[str, Dict[str, Any]]) -> None:
+    print(f"{'scenario':<16}{'requests':>9}{'rps':>9}{'errors':>8}{'p50':>10}{'p90':>10}{'p95':>10}{'p99':>10}{'max':>10}")
+    for name in sorted(summary, key=lambda n: (n == "all", n)):
+        row = summary[name]
+        print(
+            f"{name:<16}{row['requests']:>9}{row['rps']:>9.1f}{row['error_rate']:>8.1%}"
+            + "".join(f"{row[key]:>10.1f}" for key in ("p50_ms", "p90_ms", "p95_ms", "p99_ms", "max_ms"))
+        )
+        if row["errors"]:
+            print(f"{'':<16}errors: {row['errors']}")
+
+
+async def run(args: argparse.Namespace, mix: Dict[str, float]) -> Dict[str, Dict[str, Any]]:
+    async with AsyncExitStack() as stack:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+        else:
+            client = await stack.enter_async_context(OfflineApp(args))
+        await stack.enter_async_context(client)
+
+        users = await setup_users(client, args.users, args.model)
+        print(f"Set up {len(users)} users; running for {args.duration}s")
+
+        start = time.perf_counter()
+        if args.rps:
+            recorder = await run_open_loop(client, users, mix, args.rps, args.duration, args.max_in_flight, args.seed)
+        else:
+            recorder = await run_closed_loop(client, users, mix, args.concurrency, args.duration, args.seed)
+        return summarize(recorder.results, time.perf_counter() - start)
+
+
+class OfflineApp:
+    """The app in-process, with every upstream replaced by a local fake"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.stack = AsyncExitStack()
+
+    async def __aenter__(self) -> httpx.AsyncClient:
+        from will_flow.main import app
+        from will_flow.services.openrouter_service import openrouter_service
+        from will_flow.services.ragflow_service import ragflow_service
+        from will_flow.testing import (
+            FakeOpenRouterConfig, FakeOpenRouterServer, FakeOpenSearch, FakeOpenSearchConfig,
+            FakeRAGFlowConfig, FakeRAGFlowServer,
+        )
+
+        args = self.args
+        FakeOpenSearch(FakeOpenSearchConfig(latency=args.opensearch_latency, seed=args.seed)).attach()
+        ragflow = self.stack.enter_context(FakeRAGFlowServer(FakeRAGFlowConfig(
+            latency=args.ragflow_latency, parse_seconds=1.0, seed=args.seed
+        )))
+        ragflow.attach(ragflow_service)
+        openrouter = self.stack.enter_context(FakeOpenRouterServer(FakeOpenRouterConfig(
+            ttft=args.ttft, tokens_per_second=args.tokens_per_second,
+            completion_tokens=args.completion_tokens, seed=args.seed
+        )))
+        openrouter.attach(openrouter_service)
+
+        # Background workers (document sync, thread titles) run as in production
+        await self.stack.enter_async_context(app.router.lifespan_context(app))
+        return httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://will-flow", timeout=self.args.timeout
+        )
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.stack.aclose()
+
+
+def parse_mix(values: Optional[List[str]]) -> Dict[str, float]:
+    if not values:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for value in values:
+        name, _, weight = value.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario {name}; choose from {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", action="append", metavar="NAME[=WEIGHT]",
+                        help=f"Repeat to mix scenarios; default {DEFAULT_MIX}")
+    load = parser.add_mutually_exclusive_group()
+    load.add_argument("--concurrency", type=int, default=8, help="Closed loop with this many workers")
+    load.add_argument("--rps", type=float, help="Open loop at this many requests per second")
+    parser.add_argument("--max-in-flight", type=int, default=1000, help="Cap on concurrent requests with --rps")
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--model", default="fake/model")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--url", help="Load a running server instead of the in-process app with fakes")
+    parser.add_argument("--opensearch-latency", type=float, default=0.002)
+    parser.add_argument("--ragflow-latency", type=float, default=0.02)
+    parser.add_argument("--ttft", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--completion-tokens", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the summary to this file")
+    parser.add_argument("--max-error-rate", type=float, default=0.01)
+    args = parser.parse_args(argv)
+
+    try:
+        mix = parse_mix(args.scenario)
+    except ValueError as e:
+        parser.error(str(e))
+
+    summary = asyncio.run(run(args, mix))
+    print_report(summary)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"args": vars(args), "summary": summary}, f, indent=2)
+
+    error_rate = summary["all"]["error_rate"] if "all" in summary else 0.0
+    if error_rate > args.max_error_rate:
+        print(f"Error rate {error_rate:.1%} is over the {args.max_error_rate:.1%} limit")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
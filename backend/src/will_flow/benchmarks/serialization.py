@@ -0,0 +1,288 @@
+"""Benchmark the model serialization done on every request.
+
+Usage: python -m will_flow.benchmarks.serialization [--case session] [--history PATH] [--max-regression 20]
+
+Times the conversions the services do between pydantic models and the dicts
+sent to and read from OpenSearch, at realistic sizes: chat sessions with 1,
+100 and 10k messages and a knowledge base with 1k documents. Each run is
+appended to a JSON lines history file together with the git commit, and
+compared with the previous run on the same Python and pydantic versions.
+Pairs of cases doing the same work two ways (FastAPI's default response
+rendering against ``ModelResponse``, the standard library against orjson
+for OpenSearch bodies) are also printed side by side, with the CPU time
+the faster one saves per call.
+
+Exits with status 1 when a case's median got more than ``--max-regression``
+percent slower than in the previous run.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import pydantic
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from opensearchpy.serializer import JSONSerializer
+
+from will_flow.core.serialization import ModelResponse, OpenSearchSerializer
+from will_flow.models.chat import ChatResponse, ChatSession
+from will_flow.models.knowledge_base import KnowledgeBase
+
+DEFAULT_HISTORY = os.path.join("benchmark-results", "serialization.jsonl")
+MESSAGE_COUNTS = (1, 100, 10_000)
+DOCUMENT_COUNT = 1000
+# (fast, baseline) suffixes of cases doing the same work
+COMPARISONS = (("response", "response_default"), ("dumps", "dumps_stdlib"), ("loads", "loads_stdlib"))
+OPENSEARCH_SERIALIZER = OpenSearchSerializer()
+STDLIB_SERIALIZER = JSONSerializer()
+MIN_SECONDS = 0.5  # Per case, so small cases get enough iterations to be stable
+WORDS = "the flow answers questions about deployment retention billing and release notes".split()
+
+
+def make_session_source(message_count: int) -> Dict[str, Any]:
+    """A chat session as stored in OpenSearch, with alternating user and assistant messages"""
+    start = datetime(2024, 1, 1)
+    messages = []
+    for i in range(message_count):
+        length = 20 if i % 2 == 0 else 120  # Questions are short, answers longer
+        messages.append({
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": " ".join(WORDS[(i + j) % len(WORDS)] for j in range(length)),
+            "timestamp": (start + timedelta(seconds=i)).isoformat()
+        })
+    return {
+        "flow_id": "flow-1",
+        "user_email": "bench@example.com",
+        "title": "Benchmark thread",
+        "messages": messages,
+        "created_at": start.isoformat(),
+        "updated_at": (start + timedelta(seconds=message_count)).isoformat()
+    }
+
+
+def make_kb_source(document_count: int) -> Dict[str, Any]:
+    """A knowledge base as stored in OpenSearch"""
+    start = datetime(2024, 1, 1)
+    return {
+        "id": "kb-1",
+        "name": "Benchmark knowledge base",
+        "description": "Documents for the serialization benchmark",
+        "user_email": "bench@example.com",
+        "created_at": start.isoformat(),
+        "updated_at": start.isoformat(),
+        "documents": [
+            {
+                "doc_id": f"doc-{i:05d}",
+                "file_name": f"report-{i}.pdf",
+                "file_type": "application/pdf",
+                "status": "ready",
+                "upload_time": (start + timedelta(minutes=i)).isoformat(),
+                "size_bytes": 100_000 + i,
+                "content_hash": f"{i:064x}"
+            }
+            for i in range(document_count)
+        ]
+    }
+
+
+# The conversions below mirror what the services do today
+
+def load_session(source: Dict[str, Any]) -> ChatSession:
+    """ChatService.get_session"""
+    return ChatSession.model_validate(dict(source, id="session-1"))
+
+
+def dump_session(session: ChatSession) -> Dict[str, Any]:
+    """ChatService.create_session: model_dump plus manual datetime conversion"""
+    session_dict = session.model_dump()
+    for field in ["created_at", "updated_at"]:
+        session_dict[field] = session_dict[field].isoformat()
+    session_dict["messages"] = [msg.model_dump() for msg in session.messages]
+    for msg in session_dict["messages"]:
+        if "timestamp" in msg:
+            msg["timestamp"] = msg["timestamp"].isoformat()
+    return session_dict
+
+
+def make_response(session: ChatSession) -> ChatResponse:
+    return ChatResponse(
+        session_id="session-1",
+        response=session.messages[-1].content,
+        messages=session.messages
+    )
+
+
+def render_response(response: ChatResponse) -> bytes:
+    """The chat endpoint's response body"""
+    return ModelResponse(response).body
+
+
+def render_response_default(response: ChatResponse) -> bytes:
+    """The same body the way FastAPI renders a returned model: checked against
+    ``response_model``, converted by ``jsonable_encoder``, then ``json.dumps``"""
+    return JSONResponse(jsonable_encoder(ChatResponse.model_validate(response, from_attributes=True))).body
+
+
+def load_kb(source: Dict[str, Any]) -> KnowledgeBase:
+    """KBService.get_kb"""
+    return KnowledgeBase(**source)
+
+
+def dump_documents(kb: KnowledgeBase) -> List[Dict[str, Any]]:
+    """KBService.add_documents and update_document_status"""
+    return [doc.model_dump() for doc in kb.documents]
+
+
+def build_cases(selected: Optional[str]) -> List[Tuple[str, Callable[[], Any]]]:
+    cases: List[Tuple[str, Callable[[], Any]]] = []
+    for count in MESSAGE_COUNTS:
+        source = make_session_source(count)
+        session = load_session(source)
+        response = make_response(session)
+        raw = json.dumps(source)
+        raw_with_id = json.dumps(dict(source, id="session-1"))
+        body = dump_session(session)
+        cases += [
+            (f"session.load[{count}]", lambda source=source: load_session(source)),
+            (f"session.dump[{count}]", lambda session=session: dump_session(session)),
+            (f"session.from_json[{count}]", lambda raw=raw: load_session(json.loads(raw))),
+            (f"session.validate_json[{count}]", lambda raw=raw_with_id: ChatSession.model_validate_json(raw)),
+            (f"session.response[{count}]", lambda response=response: render_response(response)),
+            (f"session.response_default[{count}]", lambda response=response: render_response_default(response)),
+            (f"opensearch.dumps[{count}]", lambda body=body: OPENSEARCH_SERIALIZER.dumps(body)),
+            (f"opensearch.dumps_stdlib[{count}]", lambda body=body: STDLIB_SERIALIZER.dumps(body)),
+            (f"opensearch.loads[{count}]", lambda raw=raw: OPENSEARCH_SERIALIZER.loads(raw)),
+            (f"opensearch.loads_stdlib[{count}]", lambda raw=raw: STDLIB_SERIALIZER.loads(raw)),
+        ]
+
+    kb_source = make_kb_source(DOCUMENT_COUNT)
+    kb = load_kb(kb_source)
+    document = kb.documents[0]
+    cases += [
+        (f"kb.load[{DOCUMENT_COUNT}]", lambda: load_kb(kb_source)),
+        (f"kb.dump_documents[{DOCUMENT_COUNT}]", lambda: dump_documents(kb)),
+        ("document.dump[1]", lambda: document.model_dump()),
+        (f"kb.response[{DOCUMENT_COUNT}]", lambda: ModelResponse(kb).body),
+        (f"kb.response_default[{DOCUMENT_COUNT}]", lambda: JSONResponse(jsonable_encoder(
+            KnowledgeBase.model_validate(kb, from_attributes=True)
+        )).body),
+    ]
+    return [(name, func) for name, func in cases if not selected or name.startswith(selected)]
+
+
+def measure(func: Callable[[], Any], min_seconds: float = MIN_SECONDS) -> Dict[str, float]:
+    # Warm up, and find how many calls fit in a batch of about 10ms
+    start = time.perf_counter()
+    func()
+    once = max(time.perf_counter() - start, 1e-7)
+    batch = max(1, int(0.01 / once))
+
+    timings = []
+    deadline = time.perf_counter() + min_seconds
+    while time.perf_counter() < deadline or len(timings) < 5:
+        start = time.perf_counter()
+        for _ in range(batch):
+            func()
+        timings.append((time.perf_counter() - start) / batch * 1000)
+
+    timings.sort()
+    return {
+        "p50_ms": statistics.median(timings),
+        "p95_ms": timings[max(0, int(len(timings) * 0.95) - 1)],
+        "calls": len(timings) * batch,
+    }
+
+
+def print_savings(results: Dict[str, Dict[str, float]]) -> None:
+    """CPU time saved per call by each fast path over its baseline"""
+    for name, result in results.items():
+        prefix, _, size = name.partition("[")
+        group, _, variant = prefix.rpartition(".")
+        for fast, baseline in COMPARISONS:
+            baseline_name = f"{group}.{baseline}[{size}"
+            if variant == fast and baseline_name in results:
+                before = results[baseline_name]["p50_ms"]
+                after = result["p50_ms"]
+                print(f"{name:<32} saves {before - after:10.4f}ms per call ({before / after:.1f}x faster)")
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_run(path: str, environment: Dict[str, str]) -> Optional[Dict[str, Any]]:
+    """The latest recorded run from the same environment, since others aren't comparable"""
+    if not os.path.exists(path):
+        return None
+    previous = None
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            run = json.loads(line)
+            if run.get("environment") == environment:
+                previous = run
+    return previous
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--case", help="Only run cases whose name starts with this, e.g. 'session.load'")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="JSON lines file results are appended to")
+    parser.add_argument("--no-record", action="store_true", help="Compare with the history without appending")
+    parser.add_argument("--min-seconds", type=float, default=MIN_SECONDS)
+    parser.add_argument("--max-regression", type=float, default=20.0, help="Percent")
+    args = parser.parse_args(argv)
+
+    environment = {
+        "python": platform.python_version(),
+        "pydantic": pydantic.VERSION,
+        "machine": platform.machine(),
+    }
+    previous = previous_run(args.history, environment)
+    previous_results = previous["results"] if previous else {}
+
+    results = {}
+    regressions = []
+    for name, func in build_cases(args.case):
+        result = measure(func, args.min_seconds)
+        results[name] = result
+        line = f"{name:<32} p50={result['p50_ms']:10.4f}ms p95={result['p95_ms']:10.4f}ms"
+        if name in previous_results:
+            change = (result["p50_ms"] / previous_results[name]["p50_ms"] - 1) * 100
+            line += f"  {change:+6.1f}% vs {previous.get('commit') or 'previous run'}"
+            if change > args.max_regression:
+                regressions.append(name)
+        print(line)
+    print_savings(results)
+
+    if not args.no_record:
+        os.makedirs(os.path.dirname(args.history) or ".", exist_ok=True)
+        with open(args.history, "a") as f:
+            f.write(json.dumps({
+                "timestamp": datetime.utcnow().isoformat(),
+                "commit": git_commit(),
+                "environment": environment,
+                "results": results,
+            }) + "\n")
+
+    if regressions:
+        print(f"Slower by more than {args.max_regression}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
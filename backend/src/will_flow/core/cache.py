@@ -0,0 +1,437 @@
+"""Cache shared by the workers of a deployment.
+
+Flows, knowledge base metadata and retrieval results are cached through
+``shared_cache``, whose backend is picked by ``CACHE_BACKEND``:
+
+- ``memory``: per worker, fine for a single worker;
+- ``redis``: any Redis-compatible server (Redis, Valkey, KeyDB...) at
+  ``CACHE_REDIS_URL``, shared by every worker and pod. Needs the ``cache``
+  extra. Each worker also keeps entries locally for ``CACHE_LOCAL_TTL``
+  seconds, and invalidations are published so the other workers drop their
+  local copies right away;
+- ``none``: nothing is cached.
+
+Without ``CACHE_BACKEND``, ``memory`` is used with a single worker and
+``none`` with several (``WEB_CONCURRENCY``). ``memory`` with several workers
+works but is incoherent: a change made through one worker is served stale
+by the others for up to the entry's TTL, so a warning is logged at startup.
+Several pods count as several workers too; only ``redis`` is coherent there.
+
+Values are bytes, models go in and out as JSON, so callers always get
+their own copy. Results that depend on a knowledge base's content (like
+retrieval) include its generation in their key; ``bump`` moves the
+generation on, which orphans every such entry without having to find them.
+``invalidate`` bumps the generation too, so a value read from the index
+before an invalidation, and stored after it, can be turned away: pass the
+generation read before fetching it to ``set``.
+
+``acquire_lease`` elects one worker of the deployment for background work,
+like the document status sync, that should not run once per worker.
+
+The cache never fails a request: backend errors are logged and treated
+as misses.
+"""
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple, Type, TypeVar
+
+from pydantic import BaseModel
+
+from will_flow.core.config import settings
+from will_flow.core.metrics import record_cache
+from will_flow.core.serialization import dumps, loads
+
+try:
+    import redis.asyncio as redis_asyncio
+    USE_REDIS = True
+except ImportError:
+    USE_REDIS = False
+
+INVALIDATION_CHANNEL = "will_flow:cache:invalidate"
+KEY_PREFIX = "will_flow:"
+
+# Take the lease if free, or renew it if this owner already holds it
+ACQUIRE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+# Store the value only while the generation counter still has the value read before fetching it
+SET_IF_GENERATION_SCRIPT = """
+if (redis.call('get', KEYS[2]) or '0') == ARGV[3] then
+    redis.call('set', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+RELEASE_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+
+class CacheBackend(ABC):
+    """Where cached values live; subclasses implement the storage"""
+
+    shared = False  # Whether other workers see the same entries
+
+    @abstractmethod
+    async def get(self, key: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        ...
+
+    @abstractmethod
+    async def delete(self, keys: List[str]) -> None:
+        ...
+
+    @abstractmethod
+    async def incr(self, key: str) -> int:
+        ...
+
+    async def set_if_generation(
+        self, key: str, value: bytes, ttl: float, generation_key: str, generation: int
+    ) -> bool:
+        """Store a value only if the counter at ``generation_key`` is still ``generation``
+
+        Must be atomic. This one is for in-process backends, whose ``get`` and
+        ``set`` never give the event loop a chance to run an invalidation in between.
+        """
+        current = await self.get(generation_key)
+        if int(current or 0) != generation:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def publish(self, channel: str, message: str) -> None:
+        """Send a message to every worker listening on ``channel``"""
+
+    async def listen(self, channel: str, handler: Callable[[str], None], on_subscribed: Callable[[], None]) -> None:
+        """Call ``handler`` with each message on ``channel`` until cancelled"""
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """Take or renew the lease ``key`` for ``owner``, unless another owner holds it"""
+        # Not shared: every worker has its own
+        return True
+
+    async def release_lease(self, key: str, owner: str) -> None:
+        """Give up the lease ``key`` if ``owner`` holds it"""
+
+    def clear(self) -> None:
+        """Forget every entry held in this process"""
+
+    async def close(self) -> None:
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """LRU cache in this process, with a TTL per entry"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self.entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        # Counters are never evicted: losing one would bring old generations back
+        self.counters: Dict[str, int] = {}
+
+    async def get(self, key: str) -> Optional[bytes]:
+        if key in self.counters:
+            return str(self.counters[key]).encode()
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        self.entries[key] = (time.monotonic() + ttl, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def delete(self, keys: List[str]) -> None:
+        for key in keys:
+            self.entries.pop(key, None)
+
+    async def incr(self, key: str) -> int:
+        self.counters[key] = self.counters.get(key, 0) + 1
+        return self.counters[key]
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.counters.clear()
+
+
+class RedisBackend(CacheBackend):
+    """Any Redis-compatible server, shared by every worker"""
+
+    shared = True
+
+    def __init__(self, url: str):
+        if not USE_REDIS:
+            raise RuntimeError("CACHE_BACKEND=redis needs the redis package (pdm install -G cache)")
+        self.client = redis_asyncio.from_url(url)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return await self.client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        await self.client.set(key, value, px=max(1, int(ttl * 1000)))
+
+    async def delete(self, keys: List[str]) -> None:
+        if keys:
+            await self.client.delete(*keys)
+
+    async def incr(self, key: str) -> int:
+        return await self.client.incr(key)
+
+    async def set_if_generation(
+        self, key: str, value: bytes, ttl: float, generation_key: str, generation: int
+    ) -> bool:
+        return bool(await self.client.eval(
+            SET_IF_GENERATION_SCRIPT, 2, key, generation_key, value, max(1, int(ttl * 1000)), str(generation)
+        ))
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self.client.publish(channel, message)
+
+    async def listen(self, channel: str, handler: Callable[[str], None], on_subscribed: Callable[[], None]) -> None:
+        pubsub = self.client.pubsub()
+        try:
+            await pubsub.subscribe(channel)
+            on_subscribed()
+            async for message in pubsub.listen():
+                if message["type"] == "message":
+                    data = message["data"]
+                    handler(data.decode() if isinstance(data, bytes) else data)
+        finally:
+            await pubsub.reset()
+
+    async def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self.client.eval(ACQUIRE_LEASE_SCRIPT, 1, key, owner, max(1, int(ttl * 1000))))
+
+    async def release_lease(self, key: str, owner: str) -> None:
+        await self.client.eval(RELEASE_LEASE_SCRIPT, 1, key, owner)
+
+    async def close(self) -> None:
+        await self.client.close()
+
+
+class NullBackend(CacheBackend):
+    """Caches nothing"""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        return None
+
+    async def set(self, key: str, value: bytes, ttl: float) -> None:
+        pass
+
+    async def delete(self, keys: List[str]) -> None:
+        pass
+
+    async def incr(self, key: str) -> int:
+        return 0
+
+
+def create_backend(name: Optional[str]) -> CacheBackend:
+    if name is None:
+        name = "memory" if settings.WEB_CONCURRENCY <= 1 else "none"
+    if name == "redis":
+        return RedisBackend(settings.CACHE_REDIS_URL)
+    if name == "none":
+        return NullBackend()
+    if name != "memory":
+        raise ValueError(f"Unknown CACHE_BACKEND {name!r}, expected 'memory', 'redis' or 'none'")
+    return MemoryBackend(settings.CACHE_MEMORY_MAX_ENTRIES)
+
+
+class SharedCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.enabled = not isinstance(backend, NullBackend)
+        # Local copies of shared entries, dropped when another worker invalidates them
+        self.local: Optional[MemoryBackend] = MemoryBackend(settings.CACHE_MEMORY_MAX_ENTRIES) if backend.shared else None
+        self.logger = logging.getLogger(__name__)
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _key(namespace: str, key: str) -> str:
+        return f"{KEY_PREFIX}{namespace}:{key}"
+
+    @staticmethod
+    def _generation_key(namespace: str, key: str) -> str:
+        return f"{KEY_PREFIX}generation:{namespace}:{key}"
+
+    async def _get(self, full_key: str) -> Optional[bytes]:
+        if self.local is not None:
+            value = await self.local.get(full_key)
+            if value is not None:
+                return value
+        try:
+            value = await self.backend.get(full_key)
+        except Exception as e:
+            self.logger.warning(f"Cache read failed: {str(e)}")
+            return None
+        if value is not None and self.local is not None:
+            await self.local.set(full_key, value, settings.CACHE_LOCAL_TTL)
+        return value
+
+    async def get(self, namespace: str, key: str) -> Optional[bytes]:
+        value = await self._get(self._key(namespace, key))
+        if self.enabled:
+            record_cache(namespace, value is not None)
+        return value
+
+    async def set(self, namespace: str, key: str, value: bytes, ttl: float, generation: Optional[int] = None) -> None:
+        """Store a value; with the ``generation`` of its key read before fetching it, only if not invalidated since"""
+        full_key = self._key(namespace, key)
+        try:
+            if generation is None:
+                await self.backend.set(full_key, value, ttl)
+            elif not await self.backend.set_if_generation(
+                full_key, value, ttl, self._generation_key(namespace, key), generation
+            ):
+                return
+        except Exception as e:
+            self.logger.warning(f"Cache write failed: {str(e)}")
+            return
+        if self.local is not None:
+            await self.local.set(full_key, value, min(ttl, settings.CACHE_LOCAL_TTL))
+
+    async def get_model(self, namespace: str, key: str, model: Type[ModelT]) -> Optional[ModelT]:
+        value = await self.get(namespace, key)
+        return model.model_validate_json(value) if value is not None else None
+
+    async def set_model(
+        self, namespace: str, key: str, value: BaseModel, ttl: float, generation: Optional[int] = None
+    ) -> None:
+        await self.set(namespace, key, value.model_dump_json().encode(), ttl, generation)
+
+    async def get_json(self, namespace: str, key: str) -> Any:
+        value = await self.get(namespace, key)
+        return loads(value) if value is not None else None
+
+    async def set_json(self, namespace: str, key: str, value: Any, ttl: float, generation: Optional[int] = None) -> None:
+        await self.set(namespace, key, dumps(value), ttl, generation)
+
+    async def _drop(self, full_keys: List[str]) -> None:
+        """Delete entries everywhere: the backend, this worker and, via pub/sub, the others"""
+        if self.local is not None:
+            await self.local.delete(full_keys)
+        try:
+            await self.backend.delete(full_keys)
+            for full_key in full_keys:
+                await self.backend.publish(INVALIDATION_CHANNEL, full_key)
+        except Exception as e:
+            self.logger.warning(f"Cache invalidation failed: {str(e)}")
+
+    async def invalidate(self, namespace: str, keys: List[str]) -> None:
+        """Drop cached entries, in every worker, and bump their generation"""
+        # Bump first: a fill that still saw the old generation has stored its value by then, and is dropped
+        await self.bump(namespace, keys)
+        await self._drop([self._key(namespace, key) for key in keys])
+
+    async def generations(self, namespace: str, keys: List[str]) -> List[int]:
+        """Current generation of each key, to include in the keys of entries depending on it"""
+        values = [await self._get(self._generation_key(namespace, key)) for key in keys]
+        return [int(value) if value is not None else 0 for value in values]
+
+    async def bump(self, namespace: str, keys: List[str]) -> None:
+        """Move the generation of each key on, orphaning every entry made with the old one"""
+        full_keys = [self._generation_key(namespace, key) for key in keys]
+        try:
+            for full_key in full_keys:
+                await self.backend.incr(full_key)
+        except Exception as e:
+            self.logger.warning(f"Cache generation bump failed: {str(e)}")
+        # Only local copies are dropped; the counter itself lives on in the backend
+        if self.local is not None:
+            await self.local.delete(full_keys)
+        try:
+            for full_key in full_keys:
+                await self.backend.publish(INVALIDATION_CHANNEL, full_key)
+        except Exception as e:
+            self.logger.warning(f"Cache invalidation failed: {str(e)}")
+
+    async def acquire_lease(self, name: str, owner: str, ttl: float) -> bool:
+        """Whether ``owner`` holds the lease ``name`` for the next ``ttl`` seconds, taking or renewing it
+
+        Other owners are refused until it expires or is released. If the
+        backend can't be reached nobody gets it.
+        """
+        try:
+            return await self.backend.acquire_lease(f"{KEY_PREFIX}lease:{name}", owner, ttl)
+        except Exception as e:
+            self.logger.warning(f"Cache lease {name} could not be taken: {str(e)}")
+            return False
+
+    async def release_lease(self, name: str, owner: str) -> None:
+        try:
+            await self.backend.release_lease(f"{KEY_PREFIX}lease:{name}", owner)
+        except Exception as e:
+            self.logger.warning(f"Cache lease {name} could not be released: {str(e)}")
+
+    def _on_invalidation(self, full_key: str) -> None:
+        if self.local is not None:
+            self.local.entries.pop(full_key, None)
+
+    def _on_subscribed(self) -> None:
+        # Invalidations may have been missed while not subscribed
+        if self.local is not None:
+            self.local.clear()
+
+    async def run(self) -> None:
+        """Apply other workers' invalidations to the local copies until cancelled"""
+        while True:
+            try:
+                await self.backend.listen(INVALIDATION_CHANNEL, self._on_invalidation, self._on_subscribed)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Cache invalidation subscription lost: {str(e)}")
+            await asyncio.sleep(1.0)
+
+    def reset(self) -> None:
+        """Forget everything cached in this process, e.g. between tests"""
+        self.backend.clear()
+        if self.local is not None:
+            self.local.clear()
+
+    def start(self) -> None:
+        """Listen for invalidations from other workers, with a shared backend"""
+        if self.enabled and not self.backend.shared and settings.WEB_CONCURRENCY > 1:
+            self.logger.warning(
+                f"CACHE_BACKEND=memory with WEB_CONCURRENCY={settings.WEB_CONCURRENCY}: every worker has its "
+                "own cache and serves changes made through the others stale until their TTL. "
+                "Use CACHE_BACKEND=redis, or none"
+            )
+        if self.backend.shared and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.backend.close()
+
+
+shared_cache = SharedCache(create_backend(settings.CACHE_BACKEND))
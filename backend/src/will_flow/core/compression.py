@@ -0,0 +1,217 @@
+"""Negotiated response compression.
+
+Responses of at least ``COMPRESSION_MINIMUM_SIZE`` bytes are compressed
+with brotli or gzip, whichever the client accepts, preferring brotli.
+Streamed responses are compressed chunk by chunk and flushed after each,
+so they keep streaming; server-sent events and already compressed media
+are left alone. Large bodies are compressed in a worker thread rather than
+on the event loop.
+
+A strong ``ETag`` names one exact representation, so compressed responses
+get the encoding appended to it (``"abc-br"``); ``will_flow.core.etag``
+ignores that suffix when comparing ``If-None-Match``. A ``304`` carries the
+validator the client holds: suffixed when it names the compressed
+representation the same negotiation would send again.
+
+``brotli`` is optional; without it only gzip is offered.
+"""
+import asyncio
+import gzip
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from will_flow.core.config import settings
+
+try:
+    import brotli
+    USE_BROTLI = True
+except ImportError:
+    USE_BROTLI = False
+
+# Not worth compressing: already compressed, or must reach the client unbuffered
+EXCLUDED_CONTENT_TYPES = (
+    "text/event-stream", "image/", "audio/", "video/",
+    "application/zip", "application/gzip", "application/x-gzip", "application/octet-stream",
+)
+THREAD_MINIMUM_SIZE = 256 * 1024  # Compress bodies this large off the event loop
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """The encoding to use for an ``Accept-Encoding`` header, or None for identity"""
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+
+    def quality_of(name: str) -> float:
+        return accepted.get(name, accepted.get("*", 0.0))
+
+    for name in (("br", "gzip") if USE_BROTLI else ("gzip",)):
+        if quality_of(name) > 0:
+            return name
+    return None
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+class StreamCompressor:
+    """Compresses a body chunk by chunk, flushing after each so it keeps streaming"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._brotli = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        else:
+            # wbits 16 + MAX_WBITS writes a gzip header and trailer
+            self._zlib = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def chunk(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.process(data) + self._brotli.flush()
+        return self._zlib.compress(data) + self._zlib.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        if self.encoding == "br":
+            return self._brotli.finish()
+        return self._zlib.flush(zlib.Z_FINISH)
+
+
+def _header(headers: List[Tuple[bytes, bytes]], name: bytes) -> Optional[bytes]:
+    for key, value in headers:
+        if key.lower() == name:
+            return value
+    return None
+
+
+def _without(headers: List[Tuple[bytes, bytes]], *names: bytes) -> List[Tuple[bytes, bytes]]:
+    return [(key, value) for key, value in headers if key.lower() not in names]
+
+
+def _add_vary(headers: List[Tuple[bytes, bytes]]) -> List[Tuple[bytes, bytes]]:
+    vary = _header(headers, b"vary")
+    if vary is None:
+        return headers + [(b"vary", b"Accept-Encoding")]
+    if b"accept-encoding" in vary.lower():
+        return headers
+    return _without(headers, b"vary") + [(b"vary", vary + b", Accept-Encoding")]
+
+
+def _compressible(headers: List[Tuple[bytes, bytes]]) -> bool:
+    if _header(headers, b"content-encoding") is not None:
+        return False
+    content_type = (_header(headers, b"content-type") or b"").decode("latin-1").lower()
+    return not content_type.startswith(EXCLUDED_CONTENT_TYPES)
+
+
+class CompressionMiddleware:
+    """ASGI middleware compressing responses with the client's preferred encoding"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not settings.COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        accept_encoding = ""
+        if_none_match = b""
+        for key, value in scope.get("headers", []):
+            if key == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+            elif key == b"if-none-match":
+                if_none_match = value
+        encoding = choose_encoding(accept_encoding)
+
+        start: Optional[Dict[str, Any]] = None
+        streamer: Optional[StreamCompressor] = None
+        passthrough = False
+
+        async def send_compressed(message: Dict[str, Any]) -> None:
+            nonlocal start, streamer, passthrough
+            if passthrough:
+                await send(message)
+                return
+
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                if message["status"] == 304:
+                    passthrough = True
+                    await send({**message, "headers": self._not_modified_headers(headers, encoding, if_none_match)})
+                    return
+                if message["status"] == 204 or not _compressible(headers):
+                    passthrough = True
+                    await send(message)
+                    return
+                # Hold the headers until the body shows whether it is worth compressing
+                start = {**message, "headers": _add_vary(headers)}
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+            if streamer is not None:
+                data = streamer.chunk(body) if more_body else streamer.chunk(body) + streamer.finish()
+                await send({"type": "http.response.body", "body": data, "more_body": more_body})
+                return
+
+            headers = start["headers"]
+            if encoding is None or (not more_body and len(body) < settings.COMPRESSION_MINIMUM_SIZE):
+                passthrough = True
+                await send(start)
+                await send(message)
+                return
+
+            headers = self._encoded_headers(headers, encoding)
+            if more_body:
+                streamer = StreamCompressor(encoding)
+                await send({**start, "headers": _without(headers, b"content-length")})
+                await send({"type": "http.response.body", "body": streamer.chunk(body), "more_body": True})
+                return
+
+            if len(body) >= THREAD_MINIMUM_SIZE:
+                data = await asyncio.to_thread(compress, body, encoding)
+            else:
+                data = compress(body, encoding)
+            headers = _without(headers, b"content-length") + [(b"content-length", str(len(data)).encode())]
+            await send({**start, "headers": headers})
+            await send({"type": "http.response.body", "body": data})
+
+        await self.app(scope, receive, send_compressed)
+
+    @staticmethod
+    def _not_modified_headers(
+        headers: List[Tuple[bytes, bytes]], encoding: Optional[str], if_none_match: bytes
+    ) -> List[Tuple[bytes, bytes]]:
+        """Headers of a ``304``, naming the compressed representation if that is what the client has"""
+        headers = _add_vary(headers)
+        etag = _header(headers, b"etag")
+        if encoding is None or etag is None or not etag.endswith(b'"') or etag.startswith(b"W/"):
+            return headers
+        encoded = etag[:-1] + b"-" + encoding.encode() + b'"'
+        candidates = {candidate.strip().removeprefix(b"W/") for candidate in if_none_match.split(b",")}
+        if encoded in candidates:
+            headers = _without(headers, b"etag") + [(b"etag", encoded)]
+        return headers
+
+    @staticmethod
+    def _encoded_headers(headers: List[Tuple[bytes, bytes]], encoding: str) -> List[Tuple[bytes, bytes]]:
+        headers = headers + [(b"content-encoding", encoding.encode())]
+        etag = _header(headers, b"etag")
+        if etag is not None and etag.endswith(b'"') and not etag.startswith(b"W/"):
+            headers = _without(headers, b"etag") + [(b"etag", etag[:-1] + b"-" + encoding.encode() + b'"')]
+        return headers
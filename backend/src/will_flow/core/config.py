@@ -21,6 +21,103 @@ class Settings(BaseSettings):
     OPENROUTER_API_KEY: Optional[str] = None
     OPENROUTER_BASE_URL: str = "https://openrouter.ai/api/v1"
 
+    # RAGFlow
+    RAGFLOW_API_URL: Optional[str] = None
+    RAGFLOW_API_KEY: Optional[str] = None
+
+    # RAGFlow circuit breakers and hedged reads
+    RAGFLOW_BREAKER_FAILURE_THRESHOLD: int = 5
+    RAGFLOW_BREAKER_RECOVERY_TIMEOUT: float = 30.0
+    RAGFLOW_HEDGING_ENABLED: bool = False
+    RAGFLOW_HEDGE_PERCENTILE: float = 95.0
+    RAGFLOW_HEDGE_MIN_SAMPLES: int = 20
+    RAGFLOW_HEDGE_MIN_DELAY: float = 0.05
+
+    # Knowledge base chat
+    KB_CHAT_MODEL: str = "openai/gpt-3.5-turbo"
+    KB_CHAT_CONTEXT_TOKENS: int = 3000
+    KB_CHAT_HISTORY_TOKENS: int = 1000
+    KB_RETRIEVAL_TIMEOUT: float = 10.0
+    KB_RETRIEVAL_CACHE_TTL: float = 60.0
+    KB_RETRIEVAL_CACHE_SIZE: int = 256
+
+    # Local reranking of retrieved chunks
+    KB_RERANK_ENABLED: bool = True
+    KB_RERANK_CANDIDATES: int = 30
+    KB_RERANK_TOP_N: int = 8
+    KB_RERANK_MIN_SCORE: float = 0.0
+    KB_RERANK_LEXICAL_WEIGHT: float = 0.5
+    KB_RERANK_MMR_LAMBDA: Optional[float] = None
+
+    # Knowledge base uploads
+    KB_UPLOAD_CONCURRENCY: int = 4
+    KB_UPLOAD_MAX_FILES: int = 5000
+    KB_UPLOAD_MAX_BYTES: int = 512 * 1024 * 1024  # Uncompressed, over all files of a batch
+
+    # Background document status sync
+    DOCUMENT_SYNC_ENABLED: bool = True
+    DOCUMENT_SYNC_MIN_INTERVAL: float = 2.0
+    DOCUMENT_SYNC_MAX_INTERVAL: float = 60.0
+    DOCUMENT_SYNC_BATCH_SIZE: int = 50
+    DOCUMENT_SYNC_CONCURRENCY: int = 4
+    # Only the worker holding this cache lease syncs; longer than DOCUMENT_SYNC_MAX_INTERVAL plus a cycle
+    DOCUMENT_SYNC_LEASE_TTL: float = 180.0
+
+    # Background thread titles and rolling summaries
+    THREAD_SUMMARY_ENABLED: bool = True
+    THREAD_SUMMARY_MODEL: str = "openai/gpt-4o-mini"
+    THREAD_ROLLING_SUMMARY: bool = False
+    THREAD_SUMMARY_EVERY: int = 10  # Messages between summary updates
+    THREAD_SUMMARY_BATCH_SIZE: int = 20
+    THREAD_SUMMARY_BATCH_DELAY: float = 2.0
+    THREAD_SUMMARY_CONCURRENCY: int = 4
+
+    # Request tracing
+    TRACING_ENABLED: bool = True
+    TRACE_EXPORTER: str = "memory"  # "memory", or "file" to also append traces to TRACE_FILE
+    TRACE_BUFFER_SIZE: int = 500
+    TRACE_FILE: str = "traces.jsonl"
+    TRACE_QUEUE_SIZE: int = 1000  # Traces waiting to be written to TRACE_FILE; more are dropped
+
+    # Slow log of upstream calls over their budget
+    SLOW_LOG_ENABLED: bool = True
+    SLOW_LOG_OPENSEARCH_MS: float = 200.0
+    SLOW_LOG_RAGFLOW_MS: float = 2000.0
+    SLOW_LOG_OPENROUTER_MS: float = 15000.0
+    SLOW_LOG_SAMPLE_RATE: float = 1.0
+    SLOW_LOG_FILE: Optional[str] = None  # JSON lines; stderr when not set
+    SLOW_LOG_QUEUE_SIZE: int = 10000
+
+    # Event loop lag monitor
+    LOOP_MONITOR_ENABLED: bool = True
+    LOOP_MONITOR_INTERVAL_MS: float = 100.0
+    LOOP_LAG_THRESHOLD_MS: float = 100.0  # Stalls longer than this are logged with the blocking stack
+    LOOP_MONITOR_BUFFER_SIZE: int = 100
+
+    # Cache shared by the workers: "memory" (per worker), "redis" (needs the cache extra) or "none".
+    # Defaults to "memory" with a single worker and "none" with several (WEB_CONCURRENCY, as read by
+    # uvicorn and gunicorn), where per-worker caches would serve each other's changes stale until their TTL
+    CACHE_BACKEND: Optional[str] = None
+    WEB_CONCURRENCY: int = 1
+    CACHE_REDIS_URL: str = "redis://localhost:6379/0"
+    CACHE_MEMORY_MAX_ENTRIES: int = 10000
+    CACHE_LOCAL_TTL: float = 5.0  # With redis, seconds each worker also keeps entries itself
+    FLOW_CACHE_TTL: float = 300.0
+    KB_CACHE_TTL: float = 60.0
+
+    # Response compression
+    COMPRESSION_ENABLED: bool = True
+    COMPRESSION_MINIMUM_SIZE: int = 1024  # Bytes; smaller responses are sent as they are
+    COMPRESSION_GZIP_LEVEL: int = 6
+    COMPRESSION_BROTLI_QUALITY: int = 4  # Brotli's higher qualities are too slow for dynamic responses
+
+    # On-demand request profiling
+    PROFILING_ENABLED: bool = True
+    PROFILING_ADMIN_TOKEN: Optional[str] = None  # Required in X-Profile-Token to profile a request by header and on /debug
+    PROFILING_SAMPLE_RATE: float = 0.0  # Fraction of all requests profiled with the sampling profiler
+    PROFILING_SAMPLE_INTERVAL_MS: float = 5.0
+    PROFILING_BUFFER_SIZE: int = 50
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True)
 
 
@@ -0,0 +1,59 @@
+"""Strong ETags and conditional GET.
+
+ETags are derived from what identifies a version of a resource (its id and
+``updated_at``, plus any field written without bumping ``updated_at``)
+rather than from the response body, so a request whose ``If-None-Match``
+still matches is answered ``304 Not Modified`` without serializing
+anything. Lists hash the versions of all their items, which also covers
+items being added or removed.
+"""
+import hashlib
+from typing import Any, Callable, Iterable
+
+from fastapi import Request, Response
+
+# Appended by CompressionMiddleware to the ETag of compressed responses
+ENCODING_SUFFIXES = ("-br", "-gzip")
+
+
+def make_etag(versions: Iterable[Any]) -> str:
+    """A strong ETag for a resource or list, from the versions of its parts"""
+    digest = hashlib.blake2b(digest_size=16)
+    for version in versions:
+        digest.update(repr(version).encode())
+        digest.update(b"\x00")
+    return f'"{digest.hexdigest()}"'
+
+
+def _opaque_tag(etag: str) -> str:
+    etag = etag.strip()
+    if etag.startswith("W/"):
+        etag = etag[2:]
+    for suffix in ENCODING_SUFFIXES:
+        if etag.endswith(suffix + '"'):
+            return etag[:-len(suffix) - 1] + '"'
+    return etag
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether ``If-None-Match`` names the current version (weak comparison, as for GET)"""
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return any(_opaque_tag(candidate) == etag for candidate in if_none_match.split(","))
+
+
+def conditional_response(request: Request, etag: str, render: Callable[[], Response]) -> Response:
+    """``304 Not Modified`` if the client has the current version, else ``render()`` with the ETag
+
+    Clients must revalidate (``Cache-Control: no-cache``), so a change is seen
+    on the very next request.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    response = render()
+    response.headers.update(headers)
+    return response
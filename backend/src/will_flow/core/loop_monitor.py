@@ -0,0 +1,145 @@
+"""Event loop lag monitor.
+
+Handlers are ``async def`` but still call synchronous code (the OpenSearch
+client, ragflow_sdk), and every such call holds up all other requests on
+the loop. The monitor measures how late the loop runs a task scheduled
+every ``LOOP_MONITOR_INTERVAL_MS``, and exports that lag as the
+``will_flow_event_loop_lag_seconds`` histogram.
+
+A watchdog thread notices when the loop has not come back for more than
+``LOOP_LAG_THRESHOLD_MS`` and captures the loop thread's stack while it is
+still stuck, so the stall is recorded with the call that blocked it rather
+than just its duration. Stalls are logged, counted in
+``will_flow_event_loop_stalls_total`` and listed by
+``GET /api/v1/debug/event-loop``.
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+import traceback
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Optional
+
+from will_flow.core.config import settings
+from will_flow.core.metrics import record_loop_lag, record_loop_stall
+
+PACKAGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Middleware and client wrappers; the call site is whatever called into them
+CORE_DIR = os.path.join(PACKAGE_DIR, "core")
+
+
+def blocking_site(stack: traceback.StackSummary) -> Optional[str]:
+    """The innermost will_flow frame outside ``core`` of a stack, as ``file:line in function``"""
+    for frame in reversed(stack):
+        filename = os.path.abspath(frame.filename)
+        if filename.startswith(PACKAGE_DIR) and not filename.startswith(CORE_DIR):
+            return f"{os.path.relpath(filename, PACKAGE_DIR)}:{frame.lineno} in {frame.name}"
+    return None
+
+
+class LoopMonitor:
+    def __init__(self, capacity: int = 100):
+        self.logger = logging.getLogger(__name__)
+        self.interval = settings.LOOP_MONITOR_INTERVAL_MS / 1000
+        self.threshold = settings.LOOP_LAG_THRESHOLD_MS / 1000
+        self.stalls: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.lags: Deque[float] = deque(maxlen=1000)  # Recent lags in seconds, for the debug summary
+        self._beat = time.monotonic()
+        self._beat_count = 0
+        self._captured_beat = -1  # Beat whose stall already has a stack
+        self._pending: Optional[Dict[str, Any]] = None  # Stall captured but not over yet
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._lock = threading.Lock()
+
+    async def run(self) -> None:
+        """Measure scheduling delay until cancelled"""
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            self.lags.append(lag)
+            record_loop_lag(lag)
+            with self._lock:
+                self._beat = now
+                self._beat_count += 1
+                stall, self._pending = self._pending, None
+            if stall is not None:
+                self._finish_stall(stall, lag)
+
+    def _watch(self) -> None:
+        """Watchdog thread: capture the loop thread's stack while it is stuck"""
+        while not self._stop_event.wait(min(self.interval, self.threshold) / 2):
+            with self._lock:
+                stuck_for = time.monotonic() - self._beat - self.interval
+                if stuck_for < self.threshold or self._captured_beat == self._beat_count:
+                    continue
+                self._captured_beat = self._beat_count
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            stall = {
+                "detected_at": datetime.now(timezone.utc).isoformat(),
+                "site": blocking_site(stack),
+                "stack": traceback.format_list(stack)
+            }
+            with self._lock:
+                self._pending = stall
+
+    def _finish_stall(self, stall: Dict[str, Any], lag: float) -> None:
+        stall["lag_ms"] = round(lag * 1000, 2)
+        self.stalls.append(stall)
+        record_loop_stall()
+        self.logger.warning(
+            f"Event loop blocked for {stall['lag_ms']}ms at {stall['site'] or 'an unknown site'}\n"
+            + "".join(stall["stack"][-8:])
+        )
+
+    def summary(self) -> Dict[str, Any]:
+        lags = sorted(self.lags)
+        return {
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "samples": len(lags),
+            "lag_p50_ms": round(statistics.median(lags) * 1000, 2) if lags else None,
+            "lag_p99_ms": round(lags[max(0, int(len(lags) * 0.99) - 1)] * 1000, 2) if lags else None,
+            "lag_max_ms": round(lags[-1] * 1000, 2) if lags else None,
+            "stalls": list(reversed(self.stalls))
+        }
+
+    def start(self) -> None:
+        """Start measuring on the running event loop"""
+        if self._task is not None and not self._task.done():
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop_event.clear()
+        self._task = asyncio.create_task(self.run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self) -> None:
+        """Stop measuring"""
+        self._stop_event.set()
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog:
+            self._watchdog.join()
+            self._watchdog = None
+
+
+loop_monitor = LoopMonitor(settings.LOOP_MONITOR_BUFFER_SIZE)
@@ -0,0 +1,265 @@
+"""Prometheus metrics for the upstream calls behind every request.
+
+Latency histograms, in-flight gauges and error counters cover every
+OpenSearch operation (by index and operation), OpenRouter completion (by
+model, with time to first token for streams) and RAGFlow call (by endpoint).
+Caches count hits and misses, so hit ratios are a PromQL division away, and
+the event loop monitor exports scheduling lag.
+``GET /metrics`` serves them in the Prometheus text format. The same timings
+feed the slow log.
+
+``prometheus_client`` is optional; without it no metrics are kept (calls are
+still timed for the slow log) and ``/metrics`` answers 503.
+"""
+import asyncio
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Tuple
+
+from will_flow.core.slow_log import PayloadSize, json_size, slow_log
+from will_flow.core.tracing import tracer
+
+try:
+    from prometheus_client import CONTENT_TYPE_LATEST, Counter, Gauge, Histogram, generate_latest
+    from prometheus_client.core import GaugeMetricFamily, REGISTRY
+    USE_PROMETHEUS = True
+except ImportError:
+    CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+    USE_PROMETHEUS = False
+
+# Seconds; fine-grained at the low end for OpenSearch, long tail for LLM calls
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Seconds; event loop lag should stay in the low milliseconds
+LOOP_LAG_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# OpenSearch client methods that are timed; everything else passes through
+OPENSEARCH_OPERATIONS = frozenset({
+    "bulk", "count", "delete", "delete_by_query", "exists", "get", "index",
+    "mget", "msearch", "search", "update", "update_by_query",
+})
+
+if USE_PROMETHEUS:
+    UPSTREAM_IN_FLIGHT = Gauge(
+        "will_flow_upstream_in_flight", "Upstream calls in progress", ["upstream"]
+    )
+    OPENSEARCH_SECONDS = Histogram(
+        "will_flow_opensearch_request_seconds", "OpenSearch call latency",
+        ["index", "operation"], buckets=LATENCY_BUCKETS
+    )
+    OPENSEARCH_ERRORS = Counter(
+        "will_flow_opensearch_errors_total", "Failed OpenSearch calls", ["index", "operation"]
+    )
+    OPENROUTER_SECONDS = Histogram(
+        "will_flow_openrouter_request_seconds", "OpenRouter completion latency, to the last token",
+        ["model", "mode"], buckets=LATENCY_BUCKETS
+    )
+    OPENROUTER_TTFT_SECONDS = Histogram(
+        "will_flow_openrouter_ttft_seconds", "OpenRouter time to first token of streamed completions",
+        ["model"], buckets=LATENCY_BUCKETS
+    )
+    OPENROUTER_ERRORS = Counter(
+        "will_flow_openrouter_errors_total", "Failed OpenRouter completions", ["model", "status"]
+    )
+    RAGFLOW_SECONDS = Histogram(
+        "will_flow_ragflow_request_seconds", "RAGFlow call latency", ["endpoint"], buckets=LATENCY_BUCKETS
+    )
+    RAGFLOW_ERRORS = Counter(
+        "will_flow_ragflow_errors_total", "Failed RAGFlow calls, including rejections by an open circuit",
+        ["endpoint"]
+    )
+    CACHE_REQUESTS = Counter(
+        "will_flow_cache_requests_total", "Cache lookups", ["cache", "result"]
+    )
+    LOOP_LAG_SECONDS = Histogram(
+        "will_flow_event_loop_lag_seconds", "How late the event loop ran a scheduled task",
+        buckets=LOOP_LAG_BUCKETS
+    )
+    LOOP_STALLS = Counter(
+        "will_flow_event_loop_stalls_total", "Times the event loop was blocked for longer than LOOP_LAG_THRESHOLD_MS"
+    )
+
+
+class CallInfo:
+    """Details of a tracked call the caller only knows once it is under way"""
+
+    __slots__ = ("payload_size",)
+
+    def __init__(self, payload_size: PayloadSize = None):
+        self.payload_size = payload_size
+
+
+@contextmanager
+def _track(kind: str, operation: str, target: Optional[str], histogram: Any, errors: Any,
+           labels: Tuple[str, ...], payload_size: PayloadSize = None) -> Iterator[CallInfo]:
+    info = CallInfo(payload_size)
+    if USE_PROMETHEUS:
+        in_flight = UPSTREAM_IN_FLIGHT.labels(kind)
+        in_flight.inc()
+    failed = False
+    start = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        failed = True
+        if USE_PROMETHEUS:
+            errors.labels(*labels).inc()
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        if USE_PROMETHEUS:
+            in_flight.dec()
+            histogram.labels(*labels).observe(elapsed)
+        slow_log.observe(kind, operation, target, elapsed, info.payload_size, failed)
+
+
+def track_opensearch(index: str, operation: str, payload_size: PayloadSize = None):
+    """Time an OpenSearch call"""
+    return _track(
+        "opensearch", operation, index,
+        OPENSEARCH_SECONDS if USE_PROMETHEUS else None,
+        OPENSEARCH_ERRORS if USE_PROMETHEUS else None,
+        (index, operation), payload_size
+    )
+
+
+def track_ragflow(endpoint: str):
+    """Time a RAGFlow call"""
+    return _track(
+        "ragflow", endpoint, None,
+        RAGFLOW_SECONDS if USE_PROMETHEUS else None,
+        RAGFLOW_ERRORS if USE_PROMETHEUS else None,
+        (endpoint,)
+    )
+
+
+def record_ragflow_error(endpoint: str) -> None:
+    """Count a failed RAGFlow call that did not raise, e.g. a 5xx response"""
+    if USE_PROMETHEUS:
+        RAGFLOW_ERRORS.labels(endpoint).inc()
+
+
+class OpenRouterTimer:
+    """Times one OpenRouter completion; see ``track_openrouter``"""
+
+    def __init__(self, model: str, mode: str):
+        self.model = model
+        self.mode = mode
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+        self.errored = False
+
+    def first_token(self) -> None:
+        """Mark the first streamed token; later calls are ignored"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            if USE_PROMETHEUS:
+                OPENROUTER_TTFT_SECONDS.labels(self.model).observe(self.first_token_at - self.start)
+
+    def error(self, status: Any) -> None:
+        """Count the completion as failed with an HTTP or upstream status"""
+        self.errored = True
+        if USE_PROMETHEUS:
+            OPENROUTER_ERRORS.labels(self.model, str(status)).inc()
+
+
+@contextmanager
+def track_openrouter(model: str, mode: str, payload: Any = None) -> Iterator[OpenRouterTimer]:
+    """Time an OpenRouter completion, ``mode`` being "complete" or "stream"
+
+    Exceptions count as errors with status "exception" unless the caller
+    already recorded one with ``timer.error(status)``. Callers going away
+    (cancellation, a stream closed early) are not errors.
+    """
+    timer = OpenRouterTimer(model, mode)
+    if USE_PROMETHEUS:
+        in_flight = UPSTREAM_IN_FLIGHT.labels("openrouter")
+        in_flight.inc()
+    try:
+        yield timer
+    except (asyncio.CancelledError, GeneratorExit):
+        raise
+    except BaseException:
+        if not timer.errored:
+            timer.error("exception")
+        raise
+    finally:
+        elapsed = time.perf_counter() - timer.start
+        if USE_PROMETHEUS:
+            in_flight.dec()
+            OPENROUTER_SECONDS.labels(model, mode).observe(elapsed)
+        slow_log.observe("openrouter", mode, model, elapsed, lambda: json_size(payload), timer.errored)
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache lookup"""
+    if USE_PROMETHEUS:
+        CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_loop_lag(seconds: float) -> None:
+    """Observe one event loop lag measurement"""
+    if USE_PROMETHEUS:
+        LOOP_LAG_SECONDS.observe(seconds)
+
+
+def record_loop_stall() -> None:
+    """Count an event loop stall"""
+    if USE_PROMETHEUS:
+        LOOP_STALLS.inc()
+
+
+class InstrumentedOpenSearch:
+    """OpenSearch client wrapper that times and traces every document and search call
+
+    Wrapping the shared client instruments every service using it (flows,
+    chat, knowledge bases, users) without touching their code. Other
+    attributes, such as ``indices``, pass through untimed.
+    """
+
+    def __init__(self, client: Any):
+        self._client = client
+
+    def use(self, client: Any) -> None:
+        """Send all calls to another client, e.g. an in-memory fake"""
+        self.__dict__.clear()
+        self._client = client
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._client, name)
+        if name not in OPENSEARCH_OPERATIONS:
+            return attr
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            index = str(kwargs.get("index", "_all"))
+            payload_size = lambda: json_size(kwargs.get("body"))  # noqa: E731, only computed for slow calls
+            with tracer.span(f"opensearch.{name}", index=index), track_opensearch(index, name, payload_size):
+                return attr(*args, **kwargs)
+
+        # Cache the wrapper, so later calls skip __getattr__
+        self.__dict__[name] = call
+        return call
+
+
+def register_breaker_collector(states: Callable[[], Any]) -> None:
+    """Export circuit breaker states, read from ``states()`` at scrape time"""
+    if not USE_PROMETHEUS:
+        return
+
+    class BreakerCollector:
+        def collect(self):
+            open_gauge = GaugeMetricFamily(
+                "will_flow_ragflow_breaker_open", "1 while a RAGFlow circuit breaker is not closed", labels=["endpoint"]
+            )
+            for state in states():
+                open_gauge.add_metric([state["name"]], 0 if state["state"] == "closed" else 1)
+            yield open_gauge
+
+    REGISTRY.register(BreakerCollector())
+
+
+def render_metrics() -> Tuple[Optional[bytes], str]:
+    """Metrics in the Prometheus text format, or None without prometheus_client"""
+    if not USE_PROMETHEUS:
+        return None, CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
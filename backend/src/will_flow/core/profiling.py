@@ -0,0 +1,220 @@
+"""Opt-in profiling of single requests.
+
+A request is profiled when it carries ``X-Profile: sampling`` (or
+``deterministic``) together with ``X-Profile-Token`` matching
+``PROFILING_ADMIN_TOKEN``, or when it is picked by ``PROFILING_SAMPLE_RATE``.
+The response then carries ``X-Profile-Id`` and the profile can be fetched
+from ``GET /api/v1/debug/profiles/{profile_id}``.
+
+Two profilers are available:
+
+- ``sampling`` (default): a background thread samples the event loop
+  thread's stack every ``PROFILING_SAMPLE_INTERVAL_MS``. Cheap enough for
+  production, and the result is in the folded stack format that
+  ``flamegraph.pl``, speedscope and most flame graph tools read.
+- ``deterministic``: ``cProfile`` around the request. Exact call counts, at
+  a large overhead; the result is a pstats file for snakeviz or flameprof
+  and a text summary.
+
+Both watch the event loop thread, so work of other requests interleaved
+with the profiled one shows up too; profile on a quiet instance for clean
+results. Only one request is profiled at a time.
+"""
+import cProfile
+import io
+import marshal
+import os
+import pstats
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from will_flow.core.config import settings
+from will_flow.core.tracing import tracer
+
+MODES = ("sampling", "deterministic")
+
+
+def _frame_name(frame: Any) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def fold_stack(frame: Any) -> str:
+    """A stack as one folded line, outermost frame first"""
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class StackSampler:
+    """Samples the stack of one thread at a fixed interval from a background thread"""
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[fold_stack(frame)] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+
+class Profile:
+    def __init__(self, mode: str, name: str, trace_id: Optional[str]):
+        self.profile_id = secrets.token_hex(8)
+        self.mode = mode
+        self.name = name
+        self.trace_id = trace_id
+        self.started_at = datetime.now(timezone.utc)
+        self.duration_ms = 0.0
+        self.stacks: Counter = Counter()  # Sampling mode: folded stack -> samples
+        self.pstats_data: Optional[bytes] = None  # Deterministic mode: marshalled pstats
+        self.running = False
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "profile_id": self.profile_id,
+            "mode": self.mode,
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 2),
+            "samples": sum(self.stacks.values())
+        }
+
+    def folded(self) -> str:
+        """Folded stacks, one ``frame;frame;frame count`` line per distinct stack"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+    def stats_text(self, limit: int = 50) -> str:
+        """Top functions by cumulative time, for deterministic profiles"""
+        if self.pstats_data is None:
+            return ""
+        stream = io.StringIO()
+        stats = pstats.Stats(_StatsSource(self.pstats_data), stream=stream)
+        stats.sort_stats("cumulative").print_stats(limit)
+        return stream.getvalue()
+
+
+class _StatsSource:
+    """Lets ``pstats.Stats`` load marshalled stats from memory"""
+
+    def __init__(self, data: bytes):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self) -> None:
+        pass
+
+
+class Profiler:
+    def __init__(self, capacity: int = 50):
+        self.profiles: Deque[Profile] = deque(maxlen=capacity)
+        self._busy = threading.Lock()
+
+    def requested_mode(self, headers: Dict[str, str]) -> Optional[str]:
+        """Profiler to run a request under, or None to not profile it"""
+        mode = headers.get("x-profile")
+        token = settings.PROFILING_ADMIN_TOKEN
+        if mode and token and secrets.compare_digest(headers.get("x-profile-token", ""), token):
+            return mode if mode in MODES else "sampling"
+        if settings.PROFILING_SAMPLE_RATE and random.random() < settings.PROFILING_SAMPLE_RATE:
+            return "sampling"
+        return None
+
+    async def run(self, profile: Profile, call: Callable[[], Awaitable[None]]) -> bool:
+        """Await ``call()`` under the profile's profiler
+
+        Runs it unprofiled and returns False when another profile is in progress.
+        """
+        if not self._busy.acquire(blocking=False):
+            await call()
+            return False
+
+        profile.running = True
+        start = time.perf_counter()
+        try:
+            if profile.mode == "deterministic":
+                cprofile = cProfile.Profile()
+                cprofile.enable()
+                try:
+                    await call()
+                finally:
+                    cprofile.disable()
+                    cprofile.create_stats()
+                    profile.pstats_data = marshal.dumps(cprofile.stats)
+            else:
+                sampler = StackSampler(threading.get_ident(), settings.PROFILING_SAMPLE_INTERVAL_MS / 1000)
+                sampler.start()
+                try:
+                    await call()
+                finally:
+                    profile.stacks = sampler.stop()
+        finally:
+            profile.duration_ms = (time.perf_counter() - start) * 1000
+            self.profiles.append(profile)
+            self._busy.release()
+        return True
+
+    def find(self, profile_id: str) -> Optional[Profile]:
+        for profile in self.profiles:
+            if profile.profile_id == profile_id:
+                return profile
+        return None
+
+    def recent(self) -> List[Profile]:
+        return list(reversed(self.profiles))
+
+
+profiler = Profiler(settings.PROFILING_BUFFER_SIZE)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware running opted-in requests under the profiler"""
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not settings.PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        headers = {key.decode("latin-1"): value.decode("latin-1") for key, value in scope.get("headers", [])}
+        mode = profiler.requested_mode(headers)
+        if mode is None:
+            await self.app(scope, receive, send)
+            return
+
+        # Created up front so its id can go out with the response headers
+        profile = Profile(mode, f"{scope['method']} {scope['path']}", tracer.current_trace_id())
+        profile_header = (b"x-profile-id", profile.profile_id.encode())
+
+        async def send_with_profile_id(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start" and profile.running:
+                message = {**message, "headers": list(message.get("headers", [])) + [profile_header]}
+            await send(message)
+
+        async def call() -> None:
+            await self.app(scope, receive, send_with_profile_id)
+
+        await profiler.run(profile, call)
@@ -0,0 +1,81 @@
+"""Fast JSON encoding for API responses and OpenSearch payloads.
+
+``ModelResponse`` renders pydantic models with pydantic-core's own JSON
+serializer. Endpoints returning large models (chat sessions with their
+messages, knowledge bases with their documents) return one directly, which
+skips FastAPI's second pass over the model: validating it against
+``response_model`` and converting it with ``jsonable_encoder``. The
+``response_model`` is still declared for the OpenAPI schema.
+
+``OpenSearchSerializer`` plugs orjson into the OpenSearch clients for
+request bodies (including every line of bulk requests) and response
+parsing, falling back to the client's own encoder for values orjson
+doesn't support.
+
+``orjson`` is optional; without it everything falls back to the standard
+library, and ``ModelResponse`` still skips the second pass.
+"""
+import json
+from typing import Any, Sequence
+
+from fastapi.responses import JSONResponse
+from opensearchpy.exceptions import SerializationError
+from opensearchpy.serializer import JSONSerializer
+from pydantic import BaseModel
+
+try:
+    import orjson
+    USE_ORJSON = True
+except ImportError:
+    USE_ORJSON = False
+
+
+def dumps(value: Any) -> bytes:
+    """Compact JSON for plain values"""
+    if USE_ORJSON:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def loads(data: Any) -> Any:
+    """Parse JSON from bytes or str"""
+    if USE_ORJSON:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dump_models(models: Sequence[BaseModel]) -> bytes:
+    """A JSON array of models, each serialized by pydantic-core"""
+    return b"[" + b",".join(model.model_dump_json().encode() for model in models) + b"]"
+
+
+class ModelResponse(JSONResponse):
+    """JSON response for a model or list of models, serialized without re-validation"""
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return content.model_dump_json().encode()
+        if isinstance(content, list) and content and all(isinstance(item, BaseModel) for item in content):
+            return dump_models(content)
+        return dumps(content)
+
+
+class OpenSearchSerializer(JSONSerializer):
+    """The OpenSearch client's JSON serializer, with orjson on the fast path"""
+
+    def dumps(self, data: Any) -> Any:
+        if isinstance(data, str) or not USE_ORJSON:
+            return super().dumps(data)
+        try:
+            return orjson.dumps(data, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # E.g. integers wider than 64 bits, which the standard library handles
+            return super().dumps(data)
+
+    def loads(self, s: str) -> Any:
+        if not USE_ORJSON:
+            return super().loads(s)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError as e:
+            raise SerializationError(s, e)
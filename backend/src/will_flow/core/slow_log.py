@@ -0,0 +1,150 @@
+"""Slow log for OpenSearch, RAGFlow and OpenRouter calls.
+
+Any call slower than the budget of its kind (``SLOW_LOG_OPENSEARCH_MS``,
+``SLOW_LOG_RAGFLOW_MS``, ``SLOW_LOG_OPENROUTER_MS``) is recorded with its
+operation, index/endpoint/model, payload size, duration and the trace id of
+the request it belongs to, as one JSON line. ``SLOW_LOG_SAMPLE_RATE`` keeps
+only a fraction of them when there are too many.
+
+Recording never blocks the caller: the check against the budget comes
+first, payload sizes are only computed for slow calls, and entries are
+handed to a background thread through a bounded queue (``QueueHandler``),
+dropping them rather than waiting when the queue is full. The thread
+writes to ``SLOW_LOG_FILE``, or to stderr when that is not set. The most
+recent entries are also kept in memory for ``GET /api/v1/debug/slow-operations``.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, List, Optional, Union
+
+from will_flow.core.config import settings
+from will_flow.core.tracing import tracer
+
+PayloadSize = Union[int, Callable[[], Optional[int]], None]
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Drops records instead of blocking or erroring when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue, on_drop: Callable[[], None]):
+        super().__init__(log_queue)
+        self.on_drop = on_drop
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The message is already a JSON line; skip the default formatting
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.on_drop()
+
+
+class SlowLog:
+    def __init__(self, capacity: int = 200):
+        self.budgets_ms = {
+            "opensearch": settings.SLOW_LOG_OPENSEARCH_MS,
+            "ragflow": settings.SLOW_LOG_RAGFLOW_MS,
+            "openrouter": settings.SLOW_LOG_OPENROUTER_MS,
+        }
+        self.enabled = settings.SLOW_LOG_ENABLED
+        self.sample_rate = settings.SLOW_LOG_SAMPLE_RATE
+        self.recent: Deque[Dict[str, Any]] = deque(maxlen=capacity)
+        self.dropped = 0
+        self.logger = logging.getLogger("will_flow.slow_log")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._lock = threading.Lock()
+
+    def _count_drop(self) -> None:
+        self.dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._listener is not None:
+            return
+        with self._lock:
+            if self._listener is not None:
+                return
+            log_queue: queue.Queue = queue.Queue(maxsize=settings.SLOW_LOG_QUEUE_SIZE)
+            if settings.SLOW_LOG_FILE:
+                handler: logging.Handler = logging.FileHandler(settings.SLOW_LOG_FILE, encoding="utf-8")
+            else:
+                handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            self.logger.addHandler(_DroppingQueueHandler(log_queue, self._count_drop))
+            self._listener = logging.handlers.QueueListener(log_queue, handler)
+            self._listener.start()
+
+    def observe(
+        self,
+        kind: str,
+        operation: str,
+        target: Optional[str],
+        seconds: float,
+        payload_size: PayloadSize = None,
+        failed: bool = False
+    ) -> None:
+        """Record a call if it went over the budget of its kind
+
+        ``payload_size`` can be a callable, so it is only computed for slow calls.
+        """
+        budget_ms = self.budgets_ms.get(kind)
+        duration_ms = seconds * 1000
+        if not self.enabled or budget_ms is None or duration_ms < budget_ms:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+
+        if callable(payload_size):
+            try:
+                payload_size = payload_size()
+            except Exception:
+                payload_size = None
+
+        entry = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "kind": kind,
+            "operation": operation,
+            "target": target,
+            "duration_ms": round(duration_ms, 2),
+            "budget_ms": budget_ms,
+            "payload_bytes": payload_size,
+            "failed": failed,
+            "trace_id": tracer.current_trace_id()
+        }
+        self.recent.append(entry)
+        self._ensure_started()
+        self.logger.info(json.dumps(entry))
+
+    def entries(self, kind: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Recent slow calls, newest first"""
+        return [entry for entry in reversed(self.recent) if kind is None or entry["kind"] == kind]
+
+    def stop(self) -> None:
+        """Write out everything still queued"""
+        with self._lock:
+            if self._listener is not None:
+                self._listener.stop()
+                self._listener = None
+                for handler in list(self.logger.handlers):
+                    self.logger.removeHandler(handler)
+
+
+def json_size(value: Any) -> Optional[int]:
+    """Bytes of ``value`` as JSON, for payload sizes"""
+    if value is None:
+        return None
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return len(json.dumps(value, default=str))
+
+
+slow_log = SlowLog()
@@ -0,0 +1,410 @@
+"""Per-request tracing across the services and their upstream calls.
+
+``TracingMiddleware`` opens a trace for every HTTP request, continuing the
+trace id of an incoming W3C ``traceparent`` header when there is one and
+returning it in ``X-Trace-Id``. Within a request, ``tracer.span()`` records
+a child of whatever span is current; the current span lives in a context
+variable, so it follows ``await``, tasks and ``asyncio.to_thread``. Service
+classes decorated with ``trace_methods`` get a span per public method, and
+the OpenSearch, RAGFlow and OpenRouter calls below them get their own.
+
+Finished traces go to an exporter: an in-memory ring buffer by default, or
+the same plus a JSON lines file written by a background thread. ``GET /api/v1/debug/traces`` lists recent
+slow traces and renders their span waterfall. Outside a request (background
+workers) spans are not recorded at all.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional
+
+from will_flow.core.config import settings
+
+TRACEPARENT = re.compile(r"^[0-9a-f]{2}-([0-9a-f]{32})-[0-9a-f]{16}-[0-9a-f]{2}$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("will_flow_span", default=None)
+
+
+class Span:
+    """One timed operation within a trace"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "start", "end", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self, error: Optional[BaseException] = None) -> None:
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.end = time.perf_counter()
+
+
+class Trace:
+    """The spans of one request"""
+
+    def __init__(self, trace_id: str, name: str):
+        self.trace_id = trace_id
+        self.name = name
+        self.started_at = datetime.now(timezone.utc)
+        self.spans: List[Span] = []  # Appended to from worker threads; list.append is atomic
+        self.root: Optional[Span] = None
+
+    def span(self, name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Span:
+        span = Span(self, name, parent.span_id if parent else None, attributes)
+        self.spans.append(span)
+        if parent is None:
+            self.root = span
+        return span
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration * 1000 if self.root else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration_ms, 2),
+            "span_count": len(self.spans),
+            "error": self.root.error if self.root else None
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The trace with its spans in start order, timed relative to the request"""
+        origin = self.root.start if self.root else 0.0
+        depths: Dict[Optional[str], int] = {None: -1}
+        spans = []
+        for span in sorted(self.spans, key=lambda s: s.start):
+            depth = depths.get(span.parent_id, -1) + 1
+            depths[span.span_id] = depth
+            spans.append({
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "name": span.name,
+                "depth": depth,
+                "offset_ms": round((span.start - origin) * 1000, 2),
+                "duration_ms": round(span.duration * 1000, 2),
+                "unfinished": span.end is None,
+                "error": span.error,
+                "attributes": span.attributes
+            })
+        return {**self.summary(), "spans": spans}
+
+
+def render_waterfall(trace: Trace, width: int = 60) -> str:
+    """Plain text waterfall of a trace, one span per line"""
+    data = trace.to_dict()
+    total = max(data["duration_ms"], max((s["offset_ms"] + s["duration_ms"] for s in data["spans"]), default=0), 0.001)
+    lines = [f"{data['name']}  trace {data['trace_id']}  {data['duration_ms']:.1f} ms"]
+    for span in data["spans"]:
+        begin = int(span["offset_ms"] / total * width)
+        length = max(1, int(span["duration_ms"] / total * width))
+        bar = " " * begin + "#" * min(length, width - begin)
+        label = "  " * span["depth"] + span["name"]
+        if span["error"]:
+            label += "  !"
+        lines.append(f"{span['offset_ms']:>9.1f} {span['duration_ms']:>9.1f}  |{bar:<{width}}|  {label}")
+    return "\n".join(lines)
+
+
+class SpanExporter:
+    """Receives every finished trace; subclasses decide where it goes"""
+
+    def export(self, trace: Trace) -> None:
+        raise NotImplementedError
+
+    def recent(self) -> List[Trace]:
+        """Traces still available for the debug endpoint, newest last"""
+        return []
+
+    def close(self) -> None:
+        """Write out anything still pending"""
+
+
+class InMemoryExporter(SpanExporter):
+    """Keeps the last ``capacity`` traces"""
+
+    def __init__(self, capacity: int = 500):
+        self.traces: Deque[Trace] = deque(maxlen=capacity)
+        self.lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        with self.lock:
+            self.traces.append(trace)
+
+    def recent(self) -> List[Trace]:
+        with self.lock:
+            return list(self.traces)
+
+
+class _TraceFormatter(logging.Formatter):
+    """Renders the trace carried by a record as a JSON line, on the writer thread"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return json.dumps(record.msg.to_dict(), default=str)
+
+
+class _TraceFileHandler(logging.FileHandler):
+    """Reports write errors through logging, at most once a minute"""
+
+    ERROR_INTERVAL = 60.0
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.last_error_at: Optional[float] = None
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self.stream is None:
+            # Opened on the first write; an error here would end the writer thread
+            try:
+                self.stream = self._open()
+            except OSError:
+                self.handleError(record)
+                return
+        super().emit(record)
+
+    def handleError(self, record: logging.LogRecord) -> None:
+        now = time.monotonic()
+        if self.last_error_at is not None and now - self.last_error_at < self.ERROR_INTERVAL:
+            return
+        self.last_error_at = now
+        logging.getLogger(__name__).warning(f"Error writing trace to {self.baseFilename}", exc_info=True)
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands traces to the writer thread as they are, dropping them when the queue is full"""
+
+    def __init__(self, trace_queue: queue.Queue, on_drop: Callable[[], None]):
+        super().__init__(trace_queue)
+        self.on_drop = on_drop
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Serialized by _TraceFormatter on the writer thread, not here
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.on_drop()
+
+
+class FileExporter(InMemoryExporter):
+    """Appends every trace to a JSON lines file, and keeps the recent ones in memory too
+
+    Traces are serialized and written by a background thread, fed through a
+    bounded queue like the slow log, so requests never wait on the file.
+    """
+
+    def __init__(self, path: str, capacity: int = 500, queue_size: int = 1000):
+        super().__init__(capacity)
+        self.path = path
+        self.queue_size = queue_size
+        self.dropped = 0
+        self.logger = logging.getLogger("will_flow.traces")
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self._listener: Optional[logging.handlers.QueueListener] = None
+        self._start_lock = threading.Lock()
+
+    def _count_drop(self) -> None:
+        self.dropped += 1
+
+    def _ensure_started(self) -> None:
+        if self._listener is not None:
+            return
+        with self._start_lock:
+            if self._listener is not None:
+                return
+            trace_queue: queue.Queue = queue.Queue(maxsize=self.queue_size)
+            handler = _TraceFileHandler(self.path, encoding="utf-8", delay=True)
+            handler.setFormatter(_TraceFormatter())
+            self.logger.addHandler(_DroppingQueueHandler(trace_queue, self._count_drop))
+            self._listener = logging.handlers.QueueListener(trace_queue, handler)
+            self._listener.start()
+
+    def export(self, trace: Trace) -> None:
+        super().export(trace)
+        self._ensure_started()
+        self.logger.info(trace)
+
+    def close(self) -> None:
+        with self._start_lock:
+            if self._listener is None:
+                return
+            self._listener.stop()
+            for handler in self._listener.handlers:
+                handler.close()
+            self._listener = None
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+
+
+class Tracer:
+    def __init__(self, exporter: Optional[SpanExporter] = None, enabled: bool = True):
+        self.exporter = exporter or InMemoryExporter()
+        self.enabled = enabled
+
+    def set_exporter(self, exporter: SpanExporter) -> None:
+        self.exporter = exporter
+
+    def stop(self) -> None:
+        """Write out every trace still queued by the exporter"""
+        self.exporter.close()
+
+    @contextmanager
+    def start_trace(self, name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Open a trace with a root span, exporting it when the block exits"""
+        if not self.enabled:
+            yield None
+            return
+
+        trace = Trace(trace_id or secrets.token_hex(16), name)
+        root = trace.span(name, None, attributes)
+        token = _current_span.set(root)
+        try:
+            yield root
+        except BaseException as e:
+            root.finish(e)
+            raise
+        else:
+            root.finish()
+        finally:
+            _current_span.reset(token)
+            self.exporter.export(trace)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+        """Record a child of the current span; does nothing outside a trace"""
+        parent = _current_span.get()
+        if parent is None:
+            yield None
+            return
+
+        span = parent.trace.span(name, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(e)
+            raise
+        else:
+            span.finish()
+        finally:
+            _current_span.reset(token)
+
+    def start_span(self, name: str, **attributes: Any) -> Optional[Span]:
+        """Record a child of the current span without making it current
+
+        For async generators, which cannot safely change the caller's context;
+        call ``finish()`` on the result.
+        """
+        parent = _current_span.get()
+        if parent is None:
+            return None
+        return parent.trace.span(name, parent, attributes)
+
+    def current_trace_id(self) -> Optional[str]:
+        span = _current_span.get()
+        return span.trace.trace_id if span else None
+
+    def find(self, trace_id: str) -> Optional[Trace]:
+        for trace in reversed(self.exporter.recent()):
+            if trace.trace_id == trace_id:
+                return trace
+        return None
+
+    def slowest(self, min_duration_ms: float = 0.0, limit: int = 20) -> List[Trace]:
+        traces = [trace for trace in self.exporter.recent() if trace.duration_ms >= min_duration_ms]
+        return sorted(traces, key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+
+def _exporter_from_settings() -> SpanExporter:
+    if settings.TRACE_EXPORTER == "file":
+        return FileExporter(settings.TRACE_FILE, settings.TRACE_BUFFER_SIZE, settings.TRACE_QUEUE_SIZE)
+    return InMemoryExporter(settings.TRACE_BUFFER_SIZE)
+
+
+tracer = Tracer(_exporter_from_settings(), enabled=settings.TRACING_ENABLED)
+
+
+def traced(name: str) -> Callable:
+    """Record a span around every call of a coroutine function"""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            if _current_span.get() is None:
+                return await func(*args, **kwargs)
+            with tracer.span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(cls: type) -> type:
+    """Class decorator recording a span, named ``Class.method``, per public coroutine method"""
+    for attr, value in list(vars(cls).items()):
+        if not attr.startswith("_") and inspect.iscoroutinefunction(value):
+            setattr(cls, attr, traced(f"{cls.__name__}.{attr}")(value))
+    return cls
+
+
+class TracingMiddleware:
+    """ASGI middleware opening a trace per HTTP request
+
+    Plain ASGI rather than ``BaseHTTPMiddleware``, so the trace context
+    reaches the endpoint and streamed responses are timed to their last byte.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http" or not tracer.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        trace_id = None
+        for key, value in scope.get("headers", []):
+            if key == b"traceparent":
+                match = TRACEPARENT.match(value.decode("latin-1").strip())
+                trace_id = match.group(1) if match else None
+                break
+
+        name = f"{scope['method']} {scope['path']}"
+        with tracer.start_trace(name, trace_id) as root:
+            async def send_with_trace_id(message: Dict[str, Any]) -> None:
+                if message["type"] == "http.response.start":
+                    root.set_attribute("status_code", message["status"])
+                    headers = list(message.get("headers", []))
+                    headers.append((b"x-trace-id", root.trace.trace_id.encode()))
+                    message = {**message, "headers": headers}
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace_id)
@@ -1,6 +1,8 @@
 from opensearchpy import OpenSearch, RequestsHttpConnection
 
 from will_flow.core.config import settings
+from will_flow.core.metrics import InstrumentedOpenSearch
+from will_flow.core.serialization import OpenSearchSerializer
 
 
 def get_opensearch_client():
@@ -18,6 +20,7 @@ def get_opensearch_client():
         use_ssl=settings.OPENSEARCH_USE_SSL,
         verify_certs=settings.OPENSEARCH_VERIFY_CERTS,
         connection_class=RequestsHttpConnection,
+        serializer=OpenSearchSerializer(),
     )
     
     return client
@@ -40,16 +43,51 @@ def initialize_indices(client: OpenSearch):
     
     # Flows index
     if not client.indices.exists(index="flows"):
+        autocomplete_field = {
+            "type": "text",
+            "analyzer": "autocomplete",
+            "search_analyzer": "autocomplete_search"
+        }
         flow_mappings = {
+            "settings": {
+                "analysis": {
+                    # Index every word prefix so typeahead is a plain term match
+                    "filter": {
+                        "autocomplete_prefixes": {"type": "edge_ngram", "min_gram": 1, "max_gram": 20}
+                    },
+                    "analyzer": {
+                        "autocomplete": {
+                            "type": "custom",
+                            "tokenizer": "standard",
+                            "filter": ["lowercase", "asciifolding", "autocomplete_prefixes"]
+                        },
+                        "autocomplete_search": {
+                            "type": "custom",
+                            "tokenizer": "standard",
+                            "filter": ["lowercase", "asciifolding"]
+                        }
+                    }
+                }
+            },
             "mappings": {
                 "properties": {
-                    "name": {"type": "text"},
-                    "description": {"type": "text"},
+                    "name": {
+                        "type": "text",
+                        "fields": {
+                            "autocomplete": autocomplete_field,
+                            "keyword": {"type": "keyword", "ignore_above": 256}
+                        }
+                    },
+                    "description": {
+                        "type": "text",
+                        "fields": {"autocomplete": autocomplete_field}
+                    },
                     "system_prompt": {"type": "text"},
                     "creator_email": {"type": "keyword"},
                     "created_at": {"type": "date"},
                     "updated_at": {"type": "date"},
                     "model": {"type": "keyword"},
+                    "kb_ids": {"type": "keyword"},
                 }
             }
         }
@@ -58,18 +96,42 @@ def initialize_indices(client: OpenSearch):
     # Chat history index
     if not client.indices.exists(index="chat_history"):
         chat_history_mappings = {
+            "settings": {
+                "analysis": {
+                    "analyzer": {
+                        # Case and accent insensitive, with English stemming so
+                        # "deploying" finds "deployed"
+                        "chat_text": {
+                            "type": "custom",
+                            "tokenizer": "standard",
+                            "filter": ["lowercase", "asciifolding", "english_possessive", "english_stemmer"]
+                        }
+                    },
+                    "filter": {
+                        "english_possessive": {"type": "stemmer", "language": "possessive_english"},
+                        "english_stemmer": {"type": "stemmer", "language": "light_english"}
+                    }
+                }
+            },
             "mappings": {
                 "properties": {
                     "flow_id": {"type": "keyword"},
                     "user_email": {"type": "keyword"},
+                    "title": {
+                        "type": "text",
+                        "analyzer": "chat_text",
+                        "fields": {"keyword": {"type": "keyword", "ignore_above": 256}}
+                    },
                     "messages": {
                         "type": "nested",
                         "properties": {
                             "role": {"type": "keyword"},
-                            "content": {"type": "text"},
+                            "content": {"type": "text", "analyzer": "chat_text"},
                             "timestamp": {"type": "date"},
                         }
                     },
+                    "summary": {"type": "text", "analyzer": "chat_text"},
+                    "summary_message_count": {"type": "integer"},
                     "created_at": {"type": "date"},
                     "updated_at": {"type": "date"},
                 }
@@ -79,7 +141,7 @@ def initialize_indices(client: OpenSearch):
 
 
 # Get the client and initialize
-opensearch_client = get_opensearch_client()
+opensearch_client = InstrumentedOpenSearch(get_opensearch_client())
 try:
     initialize_indices(opensearch_client)
 except Exception as e:
@@ -1,13 +1,54 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException, Response
 from fastapi.middleware.cors import CORSMiddleware
 
 from will_flow.api.api_v1.api import api_router
+from will_flow.core.cache import shared_cache
+from will_flow.core.compression import CompressionMiddleware
 from will_flow.core.config import settings
+from will_flow.core.loop_monitor import loop_monitor
+from will_flow.core.metrics import render_metrics
+from will_flow.core.profiling import ProfilingMiddleware
+from will_flow.core.slow_log import slow_log
+from will_flow.core.tracing import TracingMiddleware, tracer
+from will_flow.services.document_event_service import document_event_service
+from will_flow.services.document_sync_service import document_sync_service
+from will_flow.services.openrouter_service import openrouter_service
+from will_flow.services.thread_summary_service import thread_summary_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Hear about other workers' cache invalidations
+    shared_cache.start()
+    # Pass on document status events produced by other workers
+    document_event_service.start()
+    # Catch synchronous calls blocking the event loop
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    # Keep document statuses fresh in the background instead of polling RAGFlow per request
+    if settings.DOCUMENT_SYNC_ENABLED:
+        document_sync_service.start()
+    # Title and summarise threads off the chat request path
+    if settings.THREAD_SUMMARY_ENABLED:
+        thread_summary_service.start()
+    yield
+    await document_sync_service.stop()
+    await thread_summary_service.stop()
+    await loop_monitor.stop()
+    await document_event_service.stop()
+    await shared_cache.stop()
+    await openrouter_service.aclose()
+    slow_log.stop()
+    tracer.stop()
+
 
 app = FastAPI(
     title=settings.PROJECT_NAME,
     description="Flow Manager API",
     version="0.1.0",
+    lifespan=lifespan,
 )
 
 
@@ -18,8 +59,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id", "X-Profile-Id"],
 )
 
+app.add_middleware(CompressionMiddleware)
+
+app.add_middleware(ProfilingMiddleware)
+
+# Outermost, so the trace covers everything else
+app.add_middleware(TracingMiddleware)
+
 # Include API router
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -27,6 +76,13 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 async def root():
     return {"message": "Welcome to Will Flow API", "docs_url": "/docs"}
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    if body is None:
+        raise HTTPException(status_code=503, detail="Metrics need the prometheus-client package")
+    return Response(content=body, media_type=content_type)
+
 if __name__ == "__main__":
     import uvicorn
 
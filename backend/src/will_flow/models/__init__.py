@@ -1,11 +1,11 @@
 from will_flow.models.user import User, UserCreate, UserInDB
-from will_flow.models.flow import Flow, FlowCreate, FlowUpdate, FlowInDB
-from will_flow.models.chat import Message, ChatSession, ChatRequest, ChatResponse, ThreadInfo
-from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, DocumentInfo
+from will_flow.models.flow import Flow, FlowCreate, FlowUpdate, FlowInDB, FlowSearchResult
+from will_flow.models.chat import Message, ChatSession, ChatRequest, ChatResponse, ThreadInfo, ChatSearchMatch, ChatSearchHit, ChatSearchResponse
+from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, DocumentInfo, UploadResult, UploadJob, DocumentStatusEvent
 
 __all__ = [
     "User", "UserCreate", "UserInDB",
-    "Flow", "FlowCreate", "FlowUpdate", "FlowInDB",
-    "Message", "ChatSession", "ChatRequest", "ChatResponse", "ThreadInfo",
-    "KnowledgeBase", "KnowledgeBaseCreate", "KnowledgeBaseUpdate", "DocumentInfo",
+    "Flow", "FlowCreate", "FlowUpdate", "FlowInDB", "FlowSearchResult",
+    "Message", "ChatSession", "ChatRequest", "ChatResponse", "ThreadInfo", "ChatSearchMatch", "ChatSearchHit", "ChatSearchResponse",
+    "KnowledgeBase", "KnowledgeBaseCreate", "KnowledgeBaseUpdate", "DocumentInfo", "UploadResult", "UploadJob", "DocumentStatusEvent",
 ] 
\ No newline at end of file
@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -15,6 +15,8 @@ class ChatSession(BaseModel):
     user_email: EmailStr
     title: str = "New Chat"  # Title for the thread
     messages: List[Message] = Field(default_factory=list)
+    summary: Optional[str] = None  # Rolling summary, written in the background
+    summary_message_count: int = 0  # Messages covered by the summary
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
     id: Optional[str] = None
@@ -26,12 +28,17 @@ class ChatRequest(BaseModel):
     message: str
     session_id: Optional[str] = None
     new_thread: bool = False  # Flag to create a new thread
+    delta: bool = False  # Only return the messages the client doesn't have yet, not the whole thread
+    cursor: Optional[int] = None  # With delta, the cursor of the client's last response; defaults to this turn
 
 
 class ChatResponse(BaseModel):
     session_id: str
     response: str
-    messages: List[Message]
+    messages: List[Message]  # The whole thread, or with delta only the messages from offset on
+    citations: List[Dict[str, Any]] = Field(default_factory=list)  # Sources from the flow's knowledge bases
+    offset: int = 0  # Position of messages[0] in the thread
+    cursor: int = 0  # Number of messages in the thread; pass back as ``cursor`` on the next delta turn
 
 
 class ThreadInfo(BaseModel):
@@ -41,4 +48,31 @@ class ThreadInfo(BaseModel):
     flow_id: str
     created_at: datetime
     updated_at: datetime
-    message_count: int 
\ No newline at end of file
+    message_count: int
+    summary: Optional[str] = None
+
+
+class ChatSearchMatch(BaseModel):
+    """A message matching a chat history search"""
+    message_index: int  # Position of the message in its session, which also identifies it
+    role: str
+    timestamp: Optional[datetime] = None
+    snippet: str  # Matching text, with matched terms wrapped in <mark> tags
+
+
+class ChatSearchHit(BaseModel):
+    """A chat session matching a chat history search"""
+    session_id: str
+    title: str
+    flow_id: str
+    updated_at: datetime
+    score: float
+    title_snippet: Optional[str] = None
+    matches: List[ChatSearchMatch] = Field(default_factory=list)
+
+
+class ChatSearchResponse(BaseModel):
+    """A page of chat history search results"""
+    hits: List[ChatSearchHit]
+    total: int
+    next_cursor: Optional[str] = None  # Pass back as ``cursor`` to get the next page
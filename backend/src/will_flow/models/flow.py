@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel, EmailStr, Field
 
@@ -9,6 +9,7 @@ class FlowBase(BaseModel):
     description: Optional[str] = None
     system_prompt: str
     model: str
+    kb_ids: List[str] = Field(default_factory=list)  # Knowledge bases the flow's answers are grounded on
 
 
 class FlowCreate(FlowBase):
@@ -20,6 +21,7 @@ class FlowUpdate(BaseModel):
     description: Optional[str] = None
     system_prompt: Optional[str] = None
     model: Optional[str] = None
+    kb_ids: Optional[List[str]] = None
 
 
 class FlowInDB(FlowBase):
@@ -30,4 +32,15 @@ class FlowInDB(FlowBase):
 
 
 class Flow(FlowInDB):
-    pass 
\ No newline at end of file
+    pass
+
+
+class FlowSearchResult(BaseModel):
+    """Projection of a flow returned by flow search"""
+    id: str
+    name: str
+    description: Optional[str] = None
+    model: str
+    creator_email: str
+    updated_at: datetime
+    score: Optional[float] = None 
\ No newline at end of file
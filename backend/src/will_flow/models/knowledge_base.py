@@ -12,6 +12,7 @@ class DocumentInfo(BaseModel):
     status: str
     upload_time: datetime
     size_bytes: int
+    content_hash: Optional[str] = None  # SHA-256 of the uploaded content
 
 
 class KnowledgeBase(BaseModel):
@@ -34,4 +35,35 @@ class KnowledgeBaseCreate(BaseModel):
 class KnowledgeBaseUpdate(BaseModel):
     """Knowledge base update model"""
     name: Optional[str] = None
-    description: Optional[str] = None 
\ No newline at end of file
+    description: Optional[str] = None 
+
+class UploadResult(BaseModel):
+    """Result of uploading a single file as part of a batch"""
+    file_name: str
+    success: bool
+    document: Optional[DocumentInfo] = None
+    duplicate: bool = False  # Content was already in the knowledge base, nothing was uploaded
+    error: Optional[str] = None
+
+
+class UploadJob(BaseModel):
+    """Progress and results of a multi-file upload to a knowledge base"""
+    job_id: str
+    kb_id: str
+    status: str = "pending"  # "pending", "running", "completed" or "failed"
+    total: int = 0
+    completed: int = 0
+    failed: int = 0
+    results: List[UploadResult] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+class DocumentStatusEvent(BaseModel):
+    """A document status transition pushed to knowledge base watchers"""
+    kb_id: str
+    doc_id: str
+    status: str
+    previous_status: Optional[str] = None
+    file_name: Optional[str] = None
+    timestamp: datetime = Field(default_factory=datetime.utcnow)
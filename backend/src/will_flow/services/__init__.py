@@ -3,5 +3,7 @@ from will_flow.services.flow_service import FlowService
 from will_flow.services.chat_service import ChatService
 from will_flow.services.kb_service import KBService
 from will_flow.services.ragflow_service import RAGFlowService
+from will_flow.services.openrouter_service import OpenRouterService
+from will_flow.services.kb_chat_service import KBChatService
 
-__all__ = ["UserService", "FlowService", "ChatService", "KBService", "RAGFlowService"] 
\ No newline at end of file
+__all__ = ["UserService", "FlowService", "ChatService", "KBService", "RAGFlowService", "OpenRouterService", "KBChatService"] 
\ No newline at end of file
@@ -1,25 +1,58 @@
+import asyncio
+import base64
 from datetime import datetime
 import json
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-import httpx
 from opensearchpy import OpenSearch
 
-from will_flow.core.config import settings
+from will_flow.core.tracing import trace_methods
 from will_flow.db.opensearch import opensearch_client
-from will_flow.models.chat import ChatRequest, ChatResponse, ChatSession, Message, ThreadInfo
+from will_flow.models.chat import (
+    ChatRequest, ChatResponse, ChatSearchHit, ChatSearchMatch, ChatSearchResponse, ChatSession, Message, ThreadInfo
+)
+from will_flow.models.flow import Flow
 from will_flow.services.flow_service import FlowService
+from will_flow.services.kb_chat_service import FLOW_CONTEXT_PROMPT, kb_chat_service
+from will_flow.services.openrouter_service import openrouter_service
+from will_flow.services.thread_summary_service import DEFAULT_TITLE, fallback_title, thread_summary_service
 
+SEARCH_SNIPPET_CHARS = 150
+SEARCH_MATCHES_PER_SESSION = 3
 
+
+def encode_cursor(sort_values: List[Any]) -> str:
+    """Opaque pagination cursor from the sort values of the last hit"""
+    return base64.urlsafe_b64encode(json.dumps(sort_values).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    try:
+        sort_values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if not isinstance(sort_values, list):
+        raise ValueError("Invalid cursor")
+    return sort_values
+
+
+@trace_methods
 class ChatService:
     def __init__(self, client: OpenSearch = opensearch_client):
         self.client = client
         self.index = "chat_history"
         self.flow_service = FlowService(client)
     
-    async def create_session(self, flow_id: str, user_email: str, title: str = "New Chat") -> Optional[ChatSession]:
-        # Check if flow exists
-        flow = await self.flow_service.get_flow(flow_id)
+    async def create_session(
+        self,
+        flow_id: str,
+        user_email: str,
+        title: str = "New Chat",
+        flow: Optional[Flow] = None
+    ) -> Optional[ChatSession]:
+        # Check if flow exists, unless the caller already loaded it
+        if flow is None:
+            flow = await self.flow_service.get_flow(flow_id)
         if not flow:
             return None
         
@@ -44,7 +77,8 @@ class ChatService:
             if "timestamp" in msg:
                 msg["timestamp"] = msg["timestamp"].isoformat()
         
-        result = self.client.index(
+        result = await asyncio.to_thread(
+            self.client.index,
             index=self.index,
             body=session_dict,
             refresh=True
@@ -55,7 +89,8 @@ class ChatService:
     
     async def get_session(self, session_id: str) -> Optional[ChatSession]:
         try:
-            result = self.client.get(
+            result = await asyncio.to_thread(
+                self.client.get,
                 index=self.index,
                 id=session_id
             )
@@ -63,14 +98,8 @@ class ChatService:
             session_data = result["_source"]
             session_data["id"] = result["_id"]
             
-            # Convert message objects
-            messages = []
-            for msg_data in session_data.get("messages", []):
-                messages.append(Message(**msg_data))
-            
-            session_data["messages"] = messages
-            
-            return ChatSession(**session_data)
+            # One validation pass; messages are validated as part of the session
+            return ChatSession.model_validate(session_data)
         except Exception as e:
             print(f"Error fetching chat session: {e}")
             return None
@@ -78,7 +107,8 @@ class ChatService:
     async def update_session_title(self, session_id: str, title: str) -> Optional[ChatSession]:
         """Update the title of a chat session (thread)"""
         try:
-            self.client.update(
+            await asyncio.to_thread(
+                self.client.update,
                 index=self.index,
                 id=session_id,
                 body={
@@ -134,7 +164,8 @@ class ChatService:
                     flow_id=source.get("flow_id"),
                     created_at=created_at,
                     updated_at=updated_at,
-                    message_count=message_count
+                    message_count=message_count,
+                    summary=source.get("summary")
                 )
                 threads.append(thread)
             
@@ -143,6 +174,102 @@ class ChatService:
             print(f"Error listing user threads: {e}")
             return []
     
+    async def search_messages(
+        self,
+        user_email: str,
+        query: str,
+        flow_id: Optional[str] = None,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> ChatSearchResponse:
+        """Full-text search over a user's chat history
+        
+        Sessions are ranked by how well their messages (and title) match, most
+        recently updated first on ties. Each hit carries highlighted snippets of
+        its best matching messages; message content and whole sessions are never
+        loaded. ``cursor`` is the ``next_cursor`` of the previous page.
+        """
+        filters = [{"term": {"user_email": user_email}}]
+        if flow_id:
+            filters.append({"term": {"flow_id": flow_id}})
+        
+        highlight = {
+            "pre_tags": ["<mark>"],
+            "post_tags": ["</mark>"],
+            "fragment_size": SEARCH_SNIPPET_CHARS,
+            "number_of_fragments": 1,
+            "no_match_size": SEARCH_SNIPPET_CHARS
+        }
+        body = {
+            "query": {
+                "bool": {
+                    "filter": filters,
+                    "should": [
+                        {
+                            "nested": {
+                                "path": "messages",
+                                "score_mode": "max",
+                                "query": {"match": {"messages.content": {"query": query, "operator": "and"}}},
+                                "inner_hits": {
+                                    "size": SEARCH_MATCHES_PER_SESSION,
+                                    "_source": {"includes": ["messages.role", "messages.timestamp"]},
+                                    "highlight": {"fields": {"messages.content": highlight}}
+                                }
+                            }
+                        },
+                        {"match": {"title": {"query": query, "operator": "and", "boost": 0.5}}}
+                    ],
+                    "minimum_should_match": 1
+                }
+            },
+            "_source": ["title", "flow_id", "updated_at"],
+            "highlight": {"fields": {"title": {**highlight, "no_match_size": 0}}},
+            "sort": [
+                {"_score": {"order": "desc"}},
+                {"updated_at": {"order": "desc"}},
+                {"_id": {"order": "asc"}}
+            ],
+            "size": limit,
+            "track_total_hits": True
+        }
+        if cursor:
+            body["search_after"] = decode_cursor(cursor)
+        
+        result = await asyncio.to_thread(self.client.search, index=self.index, body=body)
+        
+        hits = []
+        for hit in result["hits"]["hits"]:
+            source = hit["_source"]
+            matches = []
+            for inner in hit.get("inner_hits", {}).get("messages", {}).get("hits", {}).get("hits", []):
+                message = inner.get("_source", {})
+                snippets = inner.get("highlight", {}).get("messages.content", [])
+                matches.append(ChatSearchMatch(
+                    message_index=inner["_nested"]["offset"],
+                    role=message.get("role", ""),
+                    timestamp=message.get("timestamp"),
+                    snippet=snippets[0] if snippets else ""
+                ))
+        
+            title_snippets = hit.get("highlight", {}).get("title", [])
+            hits.append(ChatSearchHit(
+                session_id=hit["_id"],
+                title=source.get("title", "Untitled Chat"),
+                flow_id=source.get("flow_id"),
+                updated_at=datetime.fromisoformat(source.get("updated_at")),
+                score=hit.get("_score") or 0.0,
+                title_snippet=title_snippets[0] if title_snippets else None,
+                matches=matches
+            ))
+        
+        raw_hits = result["hits"]["hits"]
+        next_cursor = encode_cursor(raw_hits[-1]["sort"]) if len(raw_hits) == limit else None
+        return ChatSearchResponse(
+            hits=hits,
+            total=result["hits"]["total"]["value"],
+            next_cursor=next_cursor
+        )
+
     async def delete_thread(self, thread_id: str) -> bool:
         """Delete a chat thread by ID"""
         try:
@@ -175,7 +302,8 @@ class ChatService:
                 message_dict["timestamp"] = message_dict["timestamp"].isoformat()
             
             # Update session
-            self.client.update(
+            await asyncio.to_thread(
+                self.client.update,
                 index=self.index,
                 id=session_id,
                 body={
@@ -191,90 +319,98 @@ class ChatService:
                 refresh=True
             )
             
-            # Auto-name the thread if it's the first message and has default title
             session = await self.get_session(session_id)
-            if session.title == "New Chat" and len(session.messages) == 1:
-                # Use the first part of the user's message as the title
-                first_message = session.messages[0].content
-                title = first_message[:30] + "..." if len(first_message) > 30 else first_message
-                await self.update_session_title(session_id, title)
-                session = await self.get_session(session_id)
+            
+            # Titles and summaries are generated in the background
+            if session and thread_summary_service.needs_update(session):
+                queued = thread_summary_service.enqueue(session_id)
+                if not queued and session.title == DEFAULT_TITLE:
+                    # No worker to title the thread: name it after the first message
+                    title = fallback_title(session.messages[0].content)
+                    session = await self.update_session_title(session_id, title) or session
             
             return session
         except Exception as e:
             print(f"Error adding message: {e}")
             return None
     
-    async def process_chat(self, chat_request: ChatRequest) -> ChatResponse:
-        # Get or create session
-        session = None
-        
-        # Check if we should create a new thread
-        if chat_request.new_thread:
-            session = await self.create_session(
-                chat_request.flow_id, 
-                chat_request.user_email
-            )
-        # Use existing thread if session_id is provided
-        elif chat_request.session_id:
-            session = await self.get_session(chat_request.session_id)
-        
-        # If no session yet, create a new one
-        if not session:
-            session = await self.create_session(
-                chat_request.flow_id, 
-                chat_request.user_email
-            )
-        
-        if not session:
-            raise ValueError(f"Flow with ID {chat_request.flow_id} not found")
+    async def _flow_context(self, flow_task: "asyncio.Task[Optional[Flow]]", query: str) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """Sources from the flow's knowledge bases for a message, and their citations"""
+        flow = await flow_task
+        if not flow or not flow.kb_ids:
+            return None, []
         
-        # Get flow
-        flow = await self.flow_service.get_flow(chat_request.flow_id)
-        if not flow:
-            raise ValueError(f"Flow with ID {chat_request.flow_id} not found")
+        try:
+            chunks, _ = await kb_chat_service.retrieve_cached(flow.kb_ids, query)
+        except Exception as e:
+            # Answer without grounding rather than failing the chat
+            print(f"Error retrieving knowledge base context: {e}")
+            return None, []
         
-        # Ensure session has an id
-        if not hasattr(session, 'id') or not session.id:
-            raise ValueError("Chat session is missing an ID")
+        if not chunks:
+            return None, []
+        return kb_chat_service.build_context(query, chunks)
+    
+    async def process_chat(self, chat_request: ChatRequest) -> ChatResponse:
+        # Load the flow and, as soon as it is there, retrieve from its knowledge
+        # bases while the session is loaded and updated
+        flow_task = asyncio.ensure_future(self.flow_service.get_flow(chat_request.flow_id))
+        context_task = asyncio.ensure_future(self._flow_context(flow_task, chat_request.message))
         
-        # Add user message to session
-        user_message = Message(role="user", content=chat_request.message)
-        session = await self.add_message(session.id, user_message)
-        if not session:
-            raise ValueError("Failed to add message to chat session")
+        try:
+            # Get or create session
+            session = None
+            
+            # Use existing thread if session_id is provided
+            if chat_request.session_id and not chat_request.new_thread:
+                session = await self.get_session(chat_request.session_id)
+            
+            # Get flow
+            flow = await flow_task
+            if not flow:
+                raise ValueError(f"Flow with ID {chat_request.flow_id} not found")
+            
+            # Create a new thread if asked to or if there is no session yet
+            if not session:
+                session = await self.create_session(
+                    chat_request.flow_id, 
+                    chat_request.user_email,
+                    flow=flow
+                )
+            
+            if not session:
+                raise ValueError(f"Flow with ID {chat_request.flow_id} not found")
+            
+            # Ensure session has an id
+            if not hasattr(session, 'id') or not session.id:
+                raise ValueError("Chat session is missing an ID")
+            
+            # Add user message to session
+            user_message = Message(role="user", content=chat_request.message)
+            session = await self.add_message(session.id, user_message)
+            if not session:
+                raise ValueError("Failed to add message to chat session")
+            
+            sources, citations = await context_task
+        finally:
+            # On errors, leave neither task running nor its exception unretrieved
+            flow_task.cancel()
+            context_task.cancel()
+            await asyncio.gather(flow_task, context_task, return_exceptions=True)
         
-        # Prepare messages for API call
-        messages = [{"role": "system", "content": flow.system_prompt}]
+        # Prepare messages for API call, with the knowledge base sources (already
+        # cut down to the context budget) after the flow's own prompt
+        system_prompt = flow.system_prompt
+        if sources:
+            system_prompt = f"{system_prompt}\n\n{FLOW_CONTEXT_PROMPT.format(sources=sources)}"
+        messages = [{"role": "system", "content": system_prompt}]
         
         # Add conversation history
         for msg in session.messages:
             messages.append({"role": msg.role, "content": msg.content})
         
         # Call OpenRouter API
-        async with httpx.AsyncClient() as client:
-            headers = {
-                "Authorization": f"Bearer {settings.OPENROUTER_API_KEY}",
-                "Content-Type": "application/json"
-            }
-            
-            payload = {
-                "model": flow.model,
-                "messages": messages
-            }
-            
-            response = await client.post(
-                f"{settings.OPENROUTER_BASE_URL}/chat/completions",
-                headers=headers,
-                json=payload
-            )
-            
-            if response.status_code != 200:
-                print(f"OpenRouter API error: {response.text}")
-                raise Exception(f"OpenRouter API error: {response.status_code}")
-            
-            response_data = response.json()
-            assistant_message_content = response_data["choices"][0]["message"]["content"]
+        assistant_message_content = await openrouter_service.complete(flow.model, messages)
         
         # Add assistant message to session
         assistant_message = Message(role="assistant", content=assistant_message_content)
@@ -282,9 +418,19 @@ class ChatService:
         if not session:
             raise ValueError("Failed to add assistant message to chat session")
         
-        # Return response
+        # Return the whole thread, or with delta just what the client is missing:
+        # by default this turn's user and assistant messages
+        offset = 0
+        if chat_request.delta:
+            offset = len(session.messages) - 2
+            if chat_request.cursor is not None and 0 <= chat_request.cursor < offset:
+                offset = chat_request.cursor
+        
         return ChatResponse(
             session_id=session.id,
             response=assistant_message_content,
-            messages=session.messages
+            messages=session.messages[offset:],
+            citations=citations,
+            offset=offset,
+            cursor=len(session.messages)
         ) 
\ No newline at end of file
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+
+class CircuitBreaker:
+    """Circuit breaker for one upstream endpoint
+
+    After ``failure_threshold`` consecutive failures the circuit opens and calls
+    fail fast with ``CircuitOpenError``. Once ``recovery_timeout`` seconds have
+    passed a single probe call is let through (half-open); its outcome closes
+    the circuit again or re-opens it. Latencies of successful calls are kept so
+    hedged requests can be sent after a latency percentile.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        recovery_timeout: float = 30.0,
+        latency_window: int = 200
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at: Optional[float] = None
+        self.probe_in_flight = False
+        self.latencies = deque(maxlen=latency_window)
+        self.total_calls = 0
+        self.total_failures = 0
+        self.rejected_calls = 0
+        self.hedged_calls = 0
+
+    def before_call(self) -> None:
+        """Check whether a call may go out, raising ``CircuitOpenError`` if not"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                self.rejected_calls += 1
+                raise CircuitOpenError(f"RAGFlow {self.name} circuit is open")
+            self.state = self.HALF_OPEN
+
+        if self.state == self.HALF_OPEN:
+            # Only one probe at a time while half-open
+            if self.probe_in_flight:
+                self.rejected_calls += 1
+                raise CircuitOpenError(f"RAGFlow {self.name} circuit is half-open")
+            self.probe_in_flight = True
+
+        self.total_calls += 1
+
+    def record_success(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        self.state = self.CLOSED
+        self.opened_at = None
+
+    def record_failure(self) -> None:
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        self.probe_in_flight = False
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def record_cancelled(self) -> None:
+        """A call was cancelled by its caller; neither a success nor a failure"""
+        self.probe_in_flight = False
+
+    def record_hedge(self) -> None:
+        self.hedged_calls += 1
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """Latency (seconds) at the given percentile of recent successful calls"""
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(int(len(ordered) * percentile / 100), len(ordered) - 1)
+        return ordered[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        p50 = self.latency_percentile(50)
+        p95 = self.latency_percentile(95)
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_calls": self.total_calls,
+            "total_failures": self.total_failures,
+            "rejected_calls": self.rejected_calls,
+            "hedged_calls": self.hedged_calls,
+            "latency_p50_ms": p50 * 1000 if p50 is not None else None,
+            "latency_p95_ms": p95 * 1000 if p95 is not None else None,
+        }
+
+
+async def hedged(
+    operation: Callable[[], Awaitable[T]],
+    delay: float,
+    on_hedge: Optional[Callable[[], None]] = None
+) -> T:
+    """Run ``operation``, starting a second attempt if the first takes longer than ``delay``
+
+    The first attempt to succeed wins and the other one is cancelled. Only use
+    this for idempotent calls. ``on_hedge`` is called when the second attempt
+    is started.
+    """
+    first = asyncio.ensure_future(operation())
+    pending = {first}
+    error: Optional[BaseException] = None
+    # Whatever is still running when this returns or is cancelled gets cancelled too
+    try:
+        done, _ = await asyncio.wait(pending, timeout=delay)
+        if done:
+            return first.result()
+
+        if on_hedge:
+            on_hedge()
+        pending.add(asyncio.ensure_future(operation()))
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,40 @@
+import hashlib
+from typing import Dict, List, Tuple
+
+from fastapi import UploadFile
+
+from will_flow.models.knowledge_base import DocumentInfo
+
+# Read uploads in 1 MiB chunks so hashing overlaps with reading the body
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+async def read_upload_with_hash(file: UploadFile) -> Tuple[bytes, str]:
+    """Read an uploaded file, hashing it with SHA-256 as it streams in"""
+    digest = hashlib.sha256()
+    chunks = []
+    while True:
+        chunk = await file.read(HASH_CHUNK_SIZE)
+        if not chunk:
+            break
+        digest.update(chunk)
+        chunks.append(chunk)
+    return b"".join(chunks), digest.hexdigest()
+
+
+def hash_content(content: bytes) -> str:
+    """SHA-256 hex digest of document content"""
+    return hashlib.sha256(content).hexdigest()
+
+
+def build_hash_index(documents: List[DocumentInfo]) -> Dict[str, DocumentInfo]:
+    """Map content hashes to the documents of a knowledge base
+
+    Failed uploads are left out so the same content can be uploaded again, as
+    are documents uploaded before hashes were recorded.
+    """
+    return {
+        doc.content_hash: doc
+        for doc in documents
+        if doc.content_hash and doc.status != "failed"
+    }
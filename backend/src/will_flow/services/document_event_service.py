@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import secrets
+from collections import OrderedDict, defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from will_flow.core.cache import SharedCache, shared_cache
+from will_flow.core.serialization import dumps, loads
+from will_flow.models.knowledge_base import DocumentStatusEvent
+
+EVENTS_CHANNEL = "will_flow:document_events"
+
+
+class DocumentEventService:
+    """Fans document status events out to everyone watching a knowledge base
+
+    Events are produced once, by the background document sync or an upload,
+    and copied to an in-memory queue per subscriber, so the cost of watching
+    does not grow with the number of open clients.
+
+    The worker producing an event is not necessarily the one a client is
+    connected to. With a shared cache backend (``CACHE_BACKEND=redis``),
+    events are also published on its pub/sub channel and delivered by every
+    other worker to its own subscribers. With the per-worker backends only
+    subscribers of the producing worker see them.
+
+    Status transitions come from the worker holding the document sync
+    lease only. A transition seen twice anyway, e.g. while the lease moves
+    between workers, is delivered once: events repeating a document's last
+    status are dropped.
+    """
+
+    def __init__(self, cache: SharedCache = shared_cache, queue_size: int = 100, max_statuses: int = 10000):
+        self.cache = cache
+        self.queue_size = queue_size
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        # Last status delivered per (kb_id, doc_id), oldest first
+        self.statuses: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.max_statuses = max_statuses
+        self.logger = logging.getLogger(__name__)
+        # Tells this worker's own messages apart when they come back over pub/sub
+        self.origin = secrets.token_hex(8)
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, kb_id: str) -> asyncio.Queue:
+        """Start receiving events for a knowledge base"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self.subscribers[kb_id].add(queue)
+        return queue
+
+    def unsubscribe(self, kb_id: str, queue: asyncio.Queue) -> None:
+        """Stop receiving events for a knowledge base"""
+        queues = self.subscribers.get(kb_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[kb_id]
+
+    def watcher_count(self, kb_id: str) -> int:
+        return len(self.subscribers.get(kb_id, ()))
+
+    def _is_repeat(self, event: DocumentStatusEvent) -> bool:
+        key = (event.kb_id, event.doc_id)
+        if self.statuses.get(key) == event.status:
+            return True
+        self.statuses[key] = event.status
+        self.statuses.move_to_end(key)
+        while len(self.statuses) > self.max_statuses:
+            self.statuses.popitem(last=False)
+        return False
+
+    def _deliver(self, events: Iterable[DocumentStatusEvent]) -> None:
+        """Hand events to the subscribers in this worker"""
+        for event in events:
+            if self._is_repeat(event):
+                continue
+            for queue in self.subscribers.get(event.kb_id, ()):
+                if queue.full():
+                    # Slow consumer: drop its oldest event rather than block the watcher
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    async def publish(self, events: Iterable[DocumentStatusEvent]) -> None:
+        """Deliver events to the subscribers of their knowledge base, in every worker"""
+        events = list(events)
+        if not events:
+            return
+        self._deliver(events)
+        if not self.cache.backend.shared:
+            return
+        message = dumps({"origin": self.origin, "events": [event.model_dump(mode="json") for event in events]})
+        try:
+            await self.cache.backend.publish(EVENTS_CHANNEL, message.decode())
+        except Exception as e:
+            self.logger.warning(f"Could not publish document events to other workers: {str(e)}")
+
+    def _on_message(self, message: str) -> None:
+        data = loads(message)
+        if data.get("origin") == self.origin:
+            return
+        self._deliver(DocumentStatusEvent(**event) for event in data.get("events", []))
+
+    async def run(self) -> None:
+        """Deliver events published by other workers until cancelled"""
+        while True:
+            try:
+                await self.cache.backend.listen(EVENTS_CHANNEL, self._on_message, lambda: None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Document event subscription lost: {str(e)}")
+            await asyncio.sleep(1.0)
+
+    def start(self) -> None:
+        """Listen for other workers' events, with a shared cache backend"""
+        if self.cache.backend.shared and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+document_event_service = DocumentEventService()
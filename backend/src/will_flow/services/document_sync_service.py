@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import secrets
+from typing import Any, Dict, List, Optional
+
+from will_flow.core.cache import SharedCache, shared_cache
+from will_flow.core.config import settings
+from will_flow.models.knowledge_base import DocumentStatusEvent
+from will_flow.services.document_event_service import DocumentEventService, document_event_service
+from will_flow.services.kb_service import KBService, kb_service
+from will_flow.services.ragflow_service import RAGFlowService, ragflow_service
+
+SYNC_LEASE = "document_sync"
+WAKE_CHANNEL = "will_flow:document_sync:wake"
+
+
+class DocumentSyncService:
+    """Background reconciler that refreshes the status of processing documents
+
+    Every cycle picks up a batch of knowledge bases with documents still in
+    ``processing``, lists each dataset once in RAGFlow and writes all status
+    changes back in a single bulk request. The interval between cycles starts
+    at ``DOCUMENT_SYNC_MIN_INTERVAL`` and backs off towards
+    ``DOCUMENT_SYNC_MAX_INTERVAL`` while nothing changes; ``wake()`` resets it,
+    e.g. after new uploads. Status transitions are published to the
+    ``DocumentEventService`` so clients can be notified without polling.
+
+    The reconciler is started in every worker, but only the one holding the
+    ``document_sync`` cache lease runs cycles; the others take over when it
+    stops renewing it. With a shared cache backend ``wake()`` reaches the
+    holder whichever worker it is called in. With the per-worker backends
+    every worker holds its own lease, so run a single worker there.
+    """
+
+    def __init__(
+        self,
+        kb: KBService = kb_service,
+        ragflow: RAGFlowService = ragflow_service,
+        events: DocumentEventService = document_event_service,
+        cache: SharedCache = shared_cache
+    ):
+        self.kb_service = kb
+        self.ragflow_service = ragflow
+        self.event_service = events
+        self.cache = cache
+        self.logger = logging.getLogger(__name__)
+        self.interval = settings.DOCUMENT_SYNC_MIN_INTERVAL
+        self._search_after: Optional[List[Any]] = None
+        self._wake_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._listener: Optional[asyncio.Task] = None
+        self.owner = secrets.token_hex(8)
+
+    async def sync_once(self) -> Dict[str, Dict[str, str]]:
+        """Run a single reconciliation cycle and return the changes that were written"""
+        batch_size = settings.DOCUMENT_SYNC_BATCH_SIZE
+        kbs, last_sort = await self.kb_service.list_kbs_with_document_status(
+            "processing", limit=batch_size, search_after=self._search_after
+        )
+        
+        # Walk through the remaining knowledge bases on later cycles, starting
+        # over once the end is reached
+        self._search_after = last_sort if len(kbs) == batch_size else None
+        if not kbs:
+            return {}
+        
+        semaphore = asyncio.Semaphore(settings.DOCUMENT_SYNC_CONCURRENCY)
+        
+        async def reconcile(kb) -> Dict[str, str]:
+            async with semaphore:
+                try:
+                    remote = await self.ragflow_service.list_document_statuses(kb.id)
+                except Exception as e:
+                    self.logger.warning(f"Could not list documents for knowledge base {kb.id}: {str(e)}")
+                    return {}
+            
+            return {
+                doc.doc_id: remote[doc.doc_id]
+                for doc in kb.documents
+                if doc.status == "processing"
+                and doc.doc_id in remote
+                and remote[doc.doc_id] != doc.status
+            }
+        
+        results = await asyncio.gather(*(reconcile(kb) for kb in kbs))
+        changes = {kb.id: statuses for kb, statuses in zip(kbs, results) if statuses}
+        
+        if changes and not await self.kb_service.update_document_statuses(changes):
+            self.logger.error("Failed to write document status changes")
+            return {}
+        
+        # Push the transitions to anyone watching these knowledge bases
+        await self.event_service.publish(
+            DocumentStatusEvent(
+                kb_id=kb.id,
+                doc_id=doc.doc_id,
+                status=changes[kb.id][doc.doc_id],
+                previous_status=doc.status,
+                file_name=doc.file_name
+            )
+            for kb in kbs if kb.id in changes
+            for doc in kb.documents if doc.doc_id in changes[kb.id]
+        )
+        
+        return changes
+
+    def _wake_local(self) -> None:
+        self.interval = settings.DOCUMENT_SYNC_MIN_INTERVAL
+        if self._wake_event:
+            self._wake_event.set()
+
+    async def wake(self) -> None:
+        """Reset the backoff and run the next cycle as soon as possible, in whichever worker holds the lease"""
+        self._wake_local()
+        if not self.cache.backend.shared:
+            return
+        try:
+            await self.cache.backend.publish(WAKE_CHANNEL, self.owner)
+        except Exception as e:
+            self.logger.warning(f"Could not wake the document sync in other workers: {str(e)}")
+
+    async def run(self) -> None:
+        """Reconcile document statuses until cancelled"""
+        self._wake_event = asyncio.Event()
+        while True:
+            try:
+                if await self.cache.acquire_lease(SYNC_LEASE, self.owner, settings.DOCUMENT_SYNC_LEASE_TTL):
+                    changes = await self.sync_once()
+                else:
+                    changes = {}
+            except Exception as e:
+                self.logger.error(f"Document status sync failed: {str(e)}")
+                changes = {}
+            
+            if changes:
+                self.interval = settings.DOCUMENT_SYNC_MIN_INTERVAL
+            else:
+                self.interval = min(self.interval * 2, settings.DOCUMENT_SYNC_MAX_INTERVAL)
+            
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake_event.clear()
+
+    async def listen(self) -> None:
+        """Wake up when another worker asks for a cycle, until cancelled"""
+        while True:
+            try:
+                await self.cache.backend.listen(WAKE_CHANNEL, lambda message: self._wake_local(), lambda: None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.warning(f"Document sync wake subscription lost: {str(e)}")
+            await asyncio.sleep(1.0)
+
+    def start(self) -> None:
+        """Start the reconciler on the running event loop"""
+        if not self.cache.backend.shared and settings.WEB_CONCURRENCY > 1:
+            self.logger.warning(
+                f"Every one of the WEB_CONCURRENCY={settings.WEB_CONCURRENCY} workers runs the document sync; "
+                "set CACHE_BACKEND=redis to run it in one, or DOCUMENT_SYNC_ENABLED=false in all but one"
+            )
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self.run())
+        if self.cache.backend.shared and (self._listener is None or self._listener.done()):
+            self._listener = asyncio.create_task(self.listen())
+
+    async def stop(self) -> None:
+        """Stop the reconciler, and hand the lease over to another worker"""
+        for task in (self._task, self._listener):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self._task:
+            await self.cache.release_lease(SYNC_LEASE, self.owner)
+        self._task = None
+        self._listener = None
+
+
+document_sync_service = DocumentSyncService()
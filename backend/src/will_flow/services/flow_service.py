@@ -1,12 +1,20 @@
+import asyncio
 from datetime import datetime
 from typing import List, Optional
 
 from opensearchpy import OpenSearch
 
+from will_flow.core.cache import shared_cache
+from will_flow.core.config import settings
+from will_flow.core.tracing import trace_methods
 from will_flow.db.opensearch import opensearch_client
-from will_flow.models.flow import Flow, FlowCreate, FlowUpdate
+from will_flow.models.flow import Flow, FlowCreate, FlowSearchResult, FlowUpdate
 
+# Only what a search result list shows is read from the index
+FLOW_SEARCH_FIELDS = ["name", "description", "model", "creator_email", "updated_at"]
 
+
+@trace_methods
 class FlowService:
     def __init__(self, client: OpenSearch = opensearch_client):
         self.client = client
@@ -27,14 +35,23 @@ class FlowService:
         return Flow(**flow_dict)
     
     async def get_flow(self, flow_id: str) -> Optional[Flow]:
+        cached = await shared_cache.get_model("flow", flow_id, Flow)
+        if cached:
+            return cached
+        
+        # Read before fetching: an update in between must not be undone by caching what we read
+        [generation] = await shared_cache.generations("flow", [flow_id])
         try:
-            result = self.client.get(
+            result = await asyncio.to_thread(
+                self.client.get,
                 index=self.index,
                 id=flow_id
             )
             flow_data = result["_source"]
             flow_data["id"] = result["_id"]
-            return Flow(**flow_data)
+            flow = Flow(**flow_data)
+            await shared_cache.set_model("flow", flow_id, flow, settings.FLOW_CACHE_TTL, generation)
+            return flow
         except Exception as e:
             print(f"Error fetching flow: {e}")
             return None
@@ -57,6 +74,7 @@ class FlowService:
                 body={"doc": update_data},
                 refresh=True
             )
+            await shared_cache.invalidate("flow", [flow_id])
             
             # Get updated flow
             return await self.get_flow(flow_id)
@@ -71,6 +89,7 @@ class FlowService:
                 id=flow_id,
                 refresh=True
             )
+            await shared_cache.invalidate("flow", [flow_id])
             return True
         except Exception as e:
             print(f"Error deleting flow: {e}")
@@ -108,4 +127,57 @@ class FlowService:
             return flows
         except Exception as e:
             print(f"Error listing flows: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    async def search_flows(
+        self,
+        query: Optional[str] = None,
+        models: Optional[List[str]] = None,
+        creator_email: Optional[str] = None,
+        limit: int = 10
+    ) -> List[FlowSearchResult]:
+        """Search flows by name and description as the user types
+
+        Every word of ``query`` must match, the last one as a prefix. Matches in
+        the name rank above matches in the description. Without a query the
+        most recently updated flows are returned.
+        """
+        filters = []
+        if models:
+            filters.append({"terms": {"model": models}})
+        if creator_email:
+            filters.append({"term": {"creator_email": creator_email}})
+        
+        if query and query.strip():
+            must = [{
+                "multi_match": {
+                    "query": query,
+                    "type": "bool_prefix",
+                    "operator": "and",
+                    # The plain fields keep prefix search working on indices
+                    # created before the autocomplete subfields existed
+                    "fields": ["name.autocomplete^3", "name^2", "description.autocomplete", "description"]
+                }
+            }]
+            sort = [{"_score": {"order": "desc"}}, {"updated_at": {"order": "desc"}}]
+        else:
+            must = [{"match_all": {}}]
+            sort = [{"updated_at": {"order": "desc"}}]
+        
+        result = await asyncio.to_thread(
+            self.client.search,
+            index=self.index,
+            body={
+                "query": {"bool": {"must": must, "filter": filters}},
+                "_source": FLOW_SEARCH_FIELDS,
+                "sort": sort,
+                "size": limit,
+                "track_total_hits": False
+            }
+        )
+        
+        flows = []
+        for hit in result["hits"]["hits"]:
+            flows.append(FlowSearchResult(id=hit["_id"], score=hit.get("_score"), **hit["_source"]))
+        
+        return flows
@@ -0,0 +1,275 @@
+import asyncio
+import hashlib
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from will_flow.core.cache import shared_cache
+from will_flow.core.config import settings
+from will_flow.core.metrics import record_cache
+from will_flow.core.tracing import trace_methods
+from will_flow.services.openrouter_service import OpenRouterService, openrouter_service
+from will_flow.services.prompt_builder import format_sources, select_chunks, trim_history
+from will_flow.services.ragflow_service import RAGFlowService, ragflow_service
+from will_flow.services.reranker import rerank_chunks
+
+RAG_SYSTEM_PROMPT = (
+    "You are a helpful assistant that answers questions using the numbered sources below. "
+    "Cite the sources you use with their number in square brackets, e.g. [1]. "
+    "If the sources do not contain the answer, say that you don't know.\n\n"
+    "Sources:\n{sources}"
+)
+
+FLOW_CONTEXT_PROMPT = (
+    "Use the numbered sources below from the attached knowledge bases when they are relevant "
+    "and cite them with their number in square brackets, e.g. [1].\n\n"
+    "Sources:\n{sources}"
+)
+
+# Knowledge base IDs, normalized query, and the generations of the knowledge bases
+RetrievalKey = Tuple[Tuple[str, ...], str, Tuple[int, ...]]
+
+NO_RESULTS_ANSWER = "Sorry, I couldn't find relevant information in the knowledge base for your question."
+
+
+def merge_chunks(chunk_lists: List[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """Merge retrieval results, keeping the best scoring copy of duplicate chunks
+
+    Chunks are considered duplicates when their content is the same once
+    whitespace is normalized (e.g. the same file uploaded to two knowledge
+    bases). Chunks without content are compared by ID instead, and chunks
+    with neither are dropped.
+    """
+    best: Dict[str, Dict[str, Any]] = {}
+    for chunks in chunk_lists:
+        for chunk in chunks:
+            key = " ".join(chunk.get("content", "").split()) or chunk.get("id", "")
+            if not key:
+                continue
+            current = best.get(key)
+            if current is None or chunk.get("similarity", 0) > current.get("similarity", 0):
+                best[key] = chunk
+    
+    return sorted(best.values(), key=lambda chunk: chunk.get("similarity", 0), reverse=True)
+
+
+@trace_methods
+class KBChatService:
+    """Answers questions about a knowledge base with an LLM grounded on retrieved chunks"""
+
+    def __init__(self, ragflow: RAGFlowService = ragflow_service, openrouter: OpenRouterService = openrouter_service):
+        self.ragflow_service = ragflow
+        self.openrouter_service = openrouter
+        self.logger = logging.getLogger(__name__)
+        # (kb_ids, query, kb generations) -> (expires_at, retrieval task)
+        self._retrieval_cache: "OrderedDict[RetrievalKey, Tuple[float, asyncio.Future]]" = OrderedDict()
+
+    async def retrieve(self, kb_ids: List[str], query: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Retrieve chunks from one or more knowledge bases concurrently
+
+        Each knowledge base gets ``KB_RETRIEVAL_TIMEOUT`` seconds; slow or failing
+        ones are reported in the returned stats and their chunks left out, so a
+        partial result is returned instead of an error unless every knowledge
+        base failed. Chunks are merged,
+        deduplicated and ordered by similarity.
+        """
+        start = time.perf_counter()
+        # Over-fetch when reranking locally, the rerank decides what is kept
+        top_k = settings.KB_RERANK_CANDIDATES if settings.KB_RERANK_ENABLED else 10
+        
+        async def retrieve_one(kb_id: str) -> List[Dict[str, Any]]:
+            chunks = await asyncio.wait_for(
+                self.ragflow_service.retrieve_chunks(kb_id, query, top_k=top_k),
+                timeout=settings.KB_RETRIEVAL_TIMEOUT
+            )
+            return [{**chunk, "kb_id": kb_id} for chunk in chunks]
+        
+        results = await asyncio.gather(*(retrieve_one(kb_id) for kb_id in kb_ids), return_exceptions=True)
+        
+        sources = {}
+        chunk_lists = []
+        for kb_id, result in zip(kb_ids, results):
+            if isinstance(result, asyncio.TimeoutError):
+                self.logger.warning(f"Retrieval from knowledge base {kb_id} timed out")
+                sources[kb_id] = "timeout"
+            elif isinstance(result, Exception):
+                self.logger.warning(f"Retrieval from knowledge base {kb_id} failed: {str(result)}")
+                sources[kb_id] = "error"
+            else:
+                sources[kb_id] = "ok"
+                chunk_lists.append(result)
+        
+        if not chunk_lists and kb_ids:
+            raise Exception("Failed to retrieve chunks from any knowledge base")
+        
+        stats = {
+            "retrieval_ms": (time.perf_counter() - start) * 1000,
+            "knowledge_bases": sources,
+            "partial": any(status != "ok" for status in sources.values())
+        }
+        return merge_chunks(chunk_lists), stats
+
+    async def retrieve_cached(self, kb_ids: List[str], query: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Like ``retrieve``, but shares results for the same knowledge bases and query
+
+        Concurrent callers wait on the same retrieval and later ones reuse its
+        result for ``KB_RETRIEVAL_CACHE_TTL`` seconds, so a turn (and its
+        retries) only hits RAGFlow once. Results are also kept in the shared
+        cache for the other workers. Partial and failed results are not kept,
+        and a change to any of the knowledge bases orphans them.
+        """
+        sorted_ids = tuple(sorted(set(kb_ids)))
+        generations = tuple(await shared_cache.generations("kb", list(sorted_ids)))
+        key = (sorted_ids, " ".join(query.lower().split()), generations)
+        now = time.monotonic()
+        
+        cached = self._retrieval_cache.get(key)
+        if cached and cached[0] > now:
+            self._retrieval_cache.move_to_end(key)
+            task = cached[1]
+            record_cache("kb_retrieval", True)
+        else:
+            record_cache("kb_retrieval", False)
+            task = asyncio.ensure_future(self._retrieve_shared(key, query))
+            self._retrieval_cache[key] = (now + settings.KB_RETRIEVAL_CACHE_TTL, task)
+            while len(self._retrieval_cache) > settings.KB_RETRIEVAL_CACHE_SIZE:
+                self._retrieval_cache.popitem(last=False)
+        
+        try:
+            # Shielded so one caller going away doesn't cancel it for the others
+            chunks, stats = await asyncio.shield(task)
+        except Exception:
+            self._evict(key, task)
+            raise
+        
+        # With the cache turned off, only concurrent callers share a retrieval
+        if stats["partial"] or not shared_cache.enabled:
+            self._evict(key, task)
+        return chunks, stats
+
+    async def _retrieve_shared(self, key: RetrievalKey, query: str) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """``retrieve``, through the cache shared with the other workers"""
+        cache_key = hashlib.sha256(repr(key).encode()).hexdigest()
+        cached = await shared_cache.get_json("retrieval", cache_key)
+        if cached:
+            return cached["chunks"], cached["stats"]
+        
+        chunks, stats = await self.retrieve(list(key[0]), query)
+        if not stats["partial"]:
+            await shared_cache.set_json("retrieval", cache_key, {"chunks": chunks, "stats": stats}, settings.KB_RETRIEVAL_CACHE_TTL)
+        return chunks, stats
+
+    def _evict(self, key: RetrievalKey, task: asyncio.Future) -> None:
+        cached = self._retrieval_cache.get(key)
+        if cached and cached[1] is task:
+            del self._retrieval_cache[key]
+
+    def build_context(self, query: str, chunks: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+        """Rerank and cut chunks down to the context budget
+
+        Returns the numbered sources block for the prompt and the matching citations.
+        """
+        if settings.KB_RERANK_ENABLED:
+            chunks = rerank_chunks(
+                query,
+                chunks,
+                top_n=settings.KB_RERANK_TOP_N,
+                min_score=settings.KB_RERANK_MIN_SCORE,
+                max_tokens=settings.KB_CHAT_CONTEXT_TOKENS,
+                lexical_weight=settings.KB_RERANK_LEXICAL_WEIGHT,
+                mmr_lambda=settings.KB_RERANK_MMR_LAMBDA
+            )
+        selected = select_chunks(chunks, settings.KB_CHAT_CONTEXT_TOKENS)
+        return format_sources(selected)
+
+    def build_messages(
+        self,
+        query: str,
+        chunks: List[Dict[str, Any]],
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> Tuple[List[Dict[str, str]], List[Dict[str, Any]]]:
+        """Build the prompt for an answer, keeping sources and history within budget"""
+        sources, citations = self.build_context(query, chunks)
+        
+        messages = [{"role": "system", "content": RAG_SYSTEM_PROMPT.format(sources=sources)}]
+        messages.extend(trim_history(history or [], settings.KB_CHAT_HISTORY_TOKENS))
+        messages.append({"role": "user", "content": query})
+        return messages, citations
+
+    async def answer(
+        self,
+        kb_ids: List[str],
+        query: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Answer a question about one or more knowledge bases"""
+        chunks, stats = await self.retrieve(kb_ids, query)
+        retrieval_ms = stats["retrieval_ms"]
+        if not chunks:
+            return {
+                "answer": NO_RESULTS_ANSWER,
+                "citations": [],
+                "knowledge_bases": stats["knowledge_bases"],
+                "partial": stats["partial"],
+                "timings": {"retrieval_ms": retrieval_ms, "generation_ms": 0.0}
+            }
+        
+        messages, citations = self.build_messages(query, chunks, history)
+        
+        start = time.perf_counter()
+        answer = await self.openrouter_service.complete(model or settings.KB_CHAT_MODEL, messages)
+        generation_ms = (time.perf_counter() - start) * 1000
+        
+        return {
+            "answer": answer,
+            "citations": citations,
+            "knowledge_bases": stats["knowledge_bases"],
+            "partial": stats["partial"],
+            "timings": {"retrieval_ms": retrieval_ms, "generation_ms": generation_ms}
+        }
+
+    async def stream_answer(
+        self,
+        kb_ids: List[str],
+        query: str,
+        history: Optional[List[Dict[str, str]]] = None,
+        model: Optional[str] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Answer a question about one or more knowledge bases as a sequence of events
+
+        Yields a ``citations`` event once retrieval is done, a ``token`` event for
+        every piece of generated text and a final ``done`` event with timings.
+        """
+        chunks, stats = await self.retrieve(kb_ids, query)
+        retrieval_ms = stats["retrieval_ms"]
+        if not chunks:
+            yield {"event": "citations", "data": {"citations": [], **stats}}
+            yield {"event": "token", "data": {"content": NO_RESULTS_ANSWER}}
+            yield {"event": "done", "data": {"timings": {"retrieval_ms": retrieval_ms, "generation_ms": 0.0}}}
+            return
+        
+        messages, citations = self.build_messages(query, chunks, history)
+        yield {"event": "citations", "data": {"citations": citations, **stats}}
+        
+        start = time.perf_counter()
+        first_token_ms = None
+        async for content in self.openrouter_service.stream(model or settings.KB_CHAT_MODEL, messages):
+            if first_token_ms is None:
+                first_token_ms = (time.perf_counter() - start) * 1000
+            yield {"event": "token", "data": {"content": content}}
+        
+        yield {
+            "event": "done",
+            "data": {
+                "timings": {
+                    "retrieval_ms": retrieval_ms,
+                    "first_token_ms": first_token_ms,
+                    "generation_ms": (time.perf_counter() - start) * 1000
+                }
+            }
+        }
+
+
+kb_chat_service = KBChatService()
@@ -1,32 +1,47 @@
+import asyncio
 import json
 import logging
 import uuid
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 from datetime import datetime
 
 from opensearchpy import OpenSearch
 from opensearchpy.exceptions import NotFoundError
 
 from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, KnowledgeBaseUpdate, DocumentInfo
+from will_flow.core.cache import shared_cache
 from will_flow.core.config import settings
+from will_flow.core.metrics import InstrumentedOpenSearch
+from will_flow.core.serialization import OpenSearchSerializer
+from will_flow.core.tracing import trace_methods
 
 
+@trace_methods
 class KBService:
     """Service for managing knowledge bases in OpenSearch"""
 
     def __init__(self):
-        self.client = OpenSearch(
+        auth = None
+        if settings.OPENSEARCH_USER and settings.OPENSEARCH_PASSWORD:
+            auth = (settings.OPENSEARCH_USER, settings.OPENSEARCH_PASSWORD)
+        
+        self.client = InstrumentedOpenSearch(OpenSearch(
             hosts=[{'host': settings.OPENSEARCH_HOST, 'port': settings.OPENSEARCH_PORT}],
-            http_auth=(settings.OPENSEARCH_USER, settings.OPENSEARCH_PASSWORD),
+            http_auth=auth,
             use_ssl=settings.OPENSEARCH_USE_SSL,
             verify_certs=settings.OPENSEARCH_VERIFY_CERTS,
             ssl_show_warn=False,
-        )
+            serializer=OpenSearchSerializer(),
+        ))
         self.index = "knowledge_bases"
         self.logger = logging.getLogger(__name__)
         
         # Ensure index exists
-        self._create_index_if_not_exists()
+        try:
+            self._create_index_if_not_exists()
+        except Exception as e:
+            # Same as the other indices: keep going if OpenSearch is not available yet
+            self.logger.error(f"Error initializing index {self.index}: {e}")
 
     def _create_index_if_not_exists(self):
         """Create the knowledge_bases index if it doesn't exist"""
@@ -49,7 +64,8 @@ class KBService:
                                 "file_type": {"type": "keyword"},
                                 "status": {"type": "keyword"},
                                 "upload_time": {"type": "date"},
-                                "size_bytes": {"type": "long"}
+                                "size_bytes": {"type": "long"},
+                                "content_hash": {"type": "keyword"}
                             }
                         }
                     }
@@ -74,15 +90,57 @@ class KBService:
         
         return kb
 
-    async def get_kb(self, kb_id: str) -> Optional[KnowledgeBase]:
-        """Get a knowledge base by ID"""
+    async def _invalidate(self, kb_ids: List[str]) -> None:
+        """Drop cached copies of knowledge bases, and retrieval results from them (keyed by generation)"""
+        await shared_cache.invalidate("kb", kb_ids)
+
+    async def _fetch_kb(self, kb_id: str) -> Optional[KnowledgeBase]:
+        """Read a knowledge base from the index, bypassing the cache, before changing it"""
         try:
-            response = self.client.get(index=self.index, id=kb_id)
+            response = await asyncio.to_thread(self.client.get, index=self.index, id=kb_id)
             kb_data = response["_source"]
             return KnowledgeBase(**kb_data)
         except NotFoundError:
             return None
 
+    async def get_kb(self, kb_id: str) -> Optional[KnowledgeBase]:
+        """Get a knowledge base by ID"""
+        cached = await shared_cache.get_model("kb", kb_id, KnowledgeBase)
+        if cached:
+            return cached
+        
+        # Read before fetching: an update in between must not be undone by caching what we read
+        [generation] = await shared_cache.generations("kb", [kb_id])
+        kb = await self._fetch_kb(kb_id)
+        if kb:
+            await shared_cache.set_model("kb", kb_id, kb, settings.KB_CACHE_TTL, generation)
+        return kb
+
+    async def get_kbs(self, kb_ids: List[str]) -> List[KnowledgeBase]:
+        """Get several knowledge bases in one request, skipping missing ones"""
+        if not kb_ids:
+            return []
+        
+        found: Dict[str, KnowledgeBase] = {}
+        for kb_id in kb_ids:
+            cached = await shared_cache.get_model("kb", kb_id, KnowledgeBase)
+            if cached:
+                found[kb_id] = cached
+        
+        missing = [kb_id for kb_id in kb_ids if kb_id not in found]
+        if missing:
+            generations = dict(zip(missing, await shared_cache.generations("kb", missing)))
+            response = await asyncio.to_thread(self.client.mget, index=self.index, body={"ids": missing})
+            for doc in response["docs"]:
+                if doc.get("found"):
+                    kb_data = doc["_source"]
+                    kb_data["id"] = doc["_id"]
+                    kb = KnowledgeBase(**kb_data)
+                    found[kb.id] = kb
+                    await shared_cache.set_model("kb", kb.id, kb, settings.KB_CACHE_TTL, generations[kb.id])
+        
+        return [found[kb_id] for kb_id in kb_ids if kb_id in found]
+
     async def list_kbs_by_user(self, user_email: str) -> List[KnowledgeBase]:
         """List knowledge bases for a user"""
         query = {
@@ -114,7 +172,7 @@ class KBService:
         """Update a knowledge base"""
         try:
             # Get current KB
-            current_kb = await self.get_kb(kb_id)
+            current_kb = await self._fetch_kb(kb_id)
             if not current_kb:
                 return None
             
@@ -134,6 +192,7 @@ class KBService:
                 body=update_body,
                 refresh=True
             )
+            await self._invalidate([kb_id])
             
             # Get updated KB
             return await self.get_kb(kb_id)
@@ -149,6 +208,7 @@ class KBService:
                 id=kb_id,
                 refresh=True
             )
+            await self._invalidate([kb_id])
             return True
         except NotFoundError:
             return False
@@ -159,8 +219,8 @@ class KBService:
     async def add_document(self, kb_id: str, doc_info: DocumentInfo) -> Optional[KnowledgeBase]:
         """Add a document to a knowledge base"""
         try:
-            # Get current KB
-            current_kb = await self.get_kb(kb_id)
+            # Get current KB; not from the cache, as the whole document list is written back
+            current_kb = await self._fetch_kb(kb_id)
             if not current_kb:
                 return None
             
@@ -182,17 +242,67 @@ class KBService:
                 body=update_body,
                 refresh=True
             )
+            await self._invalidate([kb_id])
             
             return current_kb
         except Exception as e:
             self.logger.error(f"Error adding document to knowledge base: {e}")
             return None
 
+    async def add_documents(
+        self,
+        kb_id: str,
+        doc_infos: List[DocumentInfo],
+        remove_doc_ids: Optional[List[str]] = None
+    ) -> bool:
+        """Append several documents to a knowledge base in a single write
+
+        Documents listed in ``remove_doc_ids`` are dropped in the same write, which
+        is how replaced documents are swapped out.
+        """
+        if not doc_infos and not remove_doc_ids:
+            return True
+        
+        try:
+            # Append in place with a script so the existing document list is
+            # neither read back nor rewritten
+            await asyncio.to_thread(
+                self.client.update,
+                index=self.index,
+                id=kb_id,
+                body={
+                    "script": {
+                        "source": (
+                            "if (ctx._source.documents == null) { ctx._source.documents = []; } "
+                            "if (!params.remove_doc_ids.isEmpty()) { "
+                            "ctx._source.documents.removeIf(doc -> params.remove_doc_ids.contains(doc.doc_id)); "
+                            "} "
+                            "ctx._source.documents.addAll(params.documents); "
+                            "ctx._source.updated_at = params.updated_at"
+                        ),
+                        "lang": "painless",
+                        "params": {
+                            "documents": [doc.model_dump() for doc in doc_infos],
+                            "remove_doc_ids": remove_doc_ids or [],
+                            "updated_at": datetime.utcnow()
+                        }
+                    }
+                },
+                refresh=True
+            )
+            await self._invalidate([kb_id])
+            return True
+        except NotFoundError:
+            return False
+        except Exception as e:
+            self.logger.error(f"Error adding documents to knowledge base: {e}")
+            return False
+
     async def update_document_status(self, kb_id: str, doc_id: str, status: str) -> Optional[KnowledgeBase]:
         """Update a document's status in a knowledge base"""
         try:
-            # Get current KB
-            current_kb = await self.get_kb(kb_id)
+            # Get current KB; not from the cache, as the whole document list is written back
+            current_kb = await self._fetch_kb(kb_id)
             if not current_kb:
                 return None
             
@@ -218,10 +328,97 @@ class KBService:
                 body=update_body,
                 refresh=True
             )
+            await self._invalidate([kb_id])
             
             return current_kb
         except Exception as e:
             self.logger.error(f"Error updating document status: {e}")
             return None
 
+    async def list_kbs_with_document_status(
+        self, status: str, limit: int = 100, search_after: Optional[List[Any]] = None
+    ) -> Tuple[List[KnowledgeBase], Optional[List[Any]]]:
+        """List knowledge bases that contain at least one document with the given status
+
+        Returns a page in a stable order along with the sort values of its last
+        hit; pass those as ``search_after`` to get the next page. Unlike an
+        offset, this doesn't skip knowledge bases when earlier ones stop
+        matching between pages.
+        """
+        query = {
+            "query": {
+                "nested": {
+                    "path": "documents",
+                    "query": {
+                        "term": {
+                            "documents.status": status
+                        }
+                    }
+                }
+            },
+            "sort": [
+                {"created_at": {"order": "asc"}},
+                {"_id": {"order": "asc"}}
+            ]
+        }
+        if search_after:
+            query["search_after"] = search_after
+        
+        response = await asyncio.to_thread(
+            self.client.search,
+            index=self.index,
+            body=query,
+            size=limit
+        )
+        
+        kbs = []
+        hits = response["hits"]["hits"]
+        for hit in hits:
+            kb_data = hit["_source"]
+            kb_data["id"] = hit["_id"]
+            kbs.append(KnowledgeBase(**kb_data))
+        
+        return kbs, (hits[-1]["sort"] if hits else None)
+
+    async def update_document_statuses(self, changes: Dict[str, Dict[str, str]]) -> bool:
+        """Apply document status changes to several knowledge bases in one bulk request
+
+        ``changes`` maps a knowledge base ID to a ``{doc_id: status}`` mapping.
+        """
+        if not changes:
+            return True
+        
+        updated_at = datetime.utcnow()
+        actions = []
+        for kb_id, statuses in changes.items():
+            actions.append({"update": {"_index": self.index, "_id": kb_id}})
+            actions.append({
+                "script": {
+                    "source": (
+                        "if (ctx._source.documents != null) { "
+                        "for (def doc : ctx._source.documents) { "
+                        "if (params.statuses.containsKey(doc.doc_id)) { doc.status = params.statuses.get(doc.doc_id); } "
+                        "} } "
+                        "ctx._source.updated_at = params.updated_at"
+                    ),
+                    "lang": "painless",
+                    "params": {
+                        "statuses": statuses,
+                        "updated_at": updated_at
+                    }
+                }
+            })
+        
+        try:
+            # No refresh: status reads come from the cache or a get, which see the write anyway
+            response = await asyncio.to_thread(self.client.bulk, body=actions)
+            await self._invalidate(list(changes))
+            if response.get("errors"):
+                self.logger.error(f"Some document status updates failed: {response}")
+                return False
+            return True
+        except Exception as e:
+            self.logger.error(f"Error updating document statuses: {e}")
+            return False
+
 kb_service = KBService() 
\ No newline at end of file
@@ -0,0 +1,121 @@
+import logging
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import httpx
+
+from will_flow.core.config import settings
+from will_flow.core.metrics import track_openrouter
+from will_flow.core.serialization import loads
+from will_flow.core.tracing import tracer
+
+
+class OpenRouterService:
+    """Service for calling the OpenRouter chat completions API"""
+
+    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None, timeout: float = 120.0):
+        self.base_url = base_url or settings.OPENROUTER_BASE_URL
+        self.api_key = api_key or settings.OPENROUTER_API_KEY
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        # One pooled client for all calls, so connections to OpenRouter are reused
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(timeout=self.timeout)
+        return self._client
+
+    def _headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json"
+        }
+
+    async def complete(self, model: str, messages: List[Dict[str, str]], **options: Any) -> str:
+        """Return the assistant message for a chat completion"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            **options
+        }
+        
+        with tracer.span("openrouter.complete", model=model), track_openrouter(model, "complete", payload) as timer:
+            response = await self.client.post(
+                f"{self.base_url}/chat/completions",
+                headers=self._headers(),
+                json=payload
+            )
+            
+            if response.status_code != 200:
+                timer.error(response.status_code)
+                self.logger.error(f"OpenRouter API error: {response.text}")
+                raise Exception(f"OpenRouter API error: {response.status_code}")
+            
+            response_data = loads(response.content)
+            return response_data["choices"][0]["message"]["content"]
+
+    async def stream(self, model: str, messages: List[Dict[str, str]], **options: Any) -> AsyncIterator[str]:
+        """Yield the assistant message of a chat completion as it is generated"""
+        payload = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            **options
+        }
+        
+        # Not made current: an async generator runs in its consumer's context
+        span = tracer.start_span("openrouter.stream", model=model)
+        error: Optional[BaseException] = None
+        try:
+            with track_openrouter(model, "stream", payload) as timer:
+                async with self.client.stream(
+                    "POST",
+                    f"{self.base_url}/chat/completions",
+                    headers=self._headers(),
+                    json=payload
+                ) as response:
+                    if response.status_code != 200:
+                        timer.error(response.status_code)
+                        body = await response.aread()
+                        self.logger.error(f"OpenRouter API error: {body.decode(errors='replace')}")
+                        raise Exception(f"OpenRouter API error: {response.status_code}")
+                    
+                    async for line in response.aiter_lines():
+                        # Skip blank lines and SSE comments (OpenRouter sends keep-alive comments)
+                        if not line.startswith("data:"):
+                            continue
+                        
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        
+                        chunk = loads(data)
+                        if "error" in chunk:
+                            timer.error("stream")
+                            raise Exception(f"OpenRouter API error: {chunk['error']}")
+                        
+                        choices = chunk.get("choices") or []
+                        if choices:
+                            content = (choices[0].get("delta") or {}).get("content")
+                            if content:
+                                timer.first_token()
+                                if span and "ttft_ms" not in span.attributes:
+                                    span.set_attribute("ttft_ms", round(span.duration * 1000, 2))
+                                yield content
+        except GeneratorExit:
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if span:
+                span.finish(error)
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+openrouter_service = OpenRouterService()
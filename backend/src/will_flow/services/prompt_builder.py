@@ -0,0 +1,75 @@
+"""Helpers for fitting retrieved context and chat history into a prompt budget."""
+from typing import Any, Dict, List, Tuple
+
+# Rough average for English text with the tokenizers used by OpenRouter models
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate, good enough for budgeting prompts"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text down to roughly ``max_tokens`` tokens"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + "..."
+
+
+def select_chunks(chunks: List[Dict[str, Any]], max_tokens: int) -> List[Dict[str, Any]]:
+    """Keep chunks, in order, until their content would exceed the budget"""
+    selected = []
+    used = 0
+    for chunk in chunks:
+        content = chunk.get("content", "")
+        if not content:
+            continue
+        
+        cost = estimate_tokens(content)
+        if used + cost > max_tokens:
+            # Always include at least one (truncated) chunk
+            if not selected:
+                selected.append({**chunk, "content": truncate_to_tokens(content, max_tokens)})
+            break
+        
+        selected.append(chunk)
+        used += cost
+    return selected
+
+
+def trim_history(history: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
+    """Keep the most recent messages that fit in the budget"""
+    kept = []
+    used = 0
+    for message in reversed(history):
+        cost = estimate_tokens(message.get("content", ""))
+        if used + cost > max_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    return kept
+
+
+def format_sources(chunks: List[Dict[str, Any]]) -> Tuple[str, List[Dict[str, Any]]]:
+    """Number the chunks as citable sources
+
+    Returns the sources block for the prompt and the matching citations.
+    """
+    parts = []
+    citations = []
+    for i, chunk in enumerate(chunks, start=1):
+        content = chunk.get("content", "").strip()
+        document_name = chunk.get("document_keyword", "") or chunk.get("docnm_kwd", "")
+        parts.append(f"[{i}] ({document_name})\n{content}" if document_name else f"[{i}]\n{content}")
+        citations.append({
+            "index": i,
+            "text": content,
+            "document_id": chunk.get("document_id", "") or chunk.get("id", ""),
+            "document_name": document_name,
+            "kb_id": chunk.get("kb_id"),
+            "similarity": chunk.get("similarity", 0)
+        })
+    return "\n\n".join(parts), citations
@@ -1,15 +1,21 @@
-import os
-import json
+import asyncio
+import contextvars
+import functools
 import logging
+import time
 import uuid
-from typing import List, Dict, Any, Optional
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
 from datetime import datetime
 
 import httpx
 from fastapi import UploadFile
 
-from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, DocumentInfo
+from will_flow.models.knowledge_base import KnowledgeBase, KnowledgeBaseCreate, DocumentInfo, UploadResult
 from will_flow.core.config import settings
+from will_flow.core.metrics import record_ragflow_error, register_breaker_collector, track_ragflow
+from will_flow.core.serialization import loads
+from will_flow.core.tracing import trace_methods, tracer
+from will_flow.services.circuit_breaker import CircuitBreaker, CircuitOpenError, hedged
 
 # Import RAGFlow SDK if available, otherwise use direct API calls
 try:
@@ -18,14 +24,106 @@ try:
 except ImportError:
     USE_SDK = False
 
+READY_RUN_STATUSES = {"done", "complete", "completed", "success", "indexed", "2"}
+PROCESSING_RUN_STATUSES = {"running", "processing", "in_progress", "parsing", "indexing", "unstart", "0", "1"}
+FAILED_RUN_STATUSES = {"failed", "error", "failure", "cancel", "fail", "-1"}
 
+# RAGFlow endpoints that get their own circuit breaker
+BREAKER_ENDPOINTS = ("retrieval", "upload", "status", "list", "delete")
+
+T = TypeVar("T")
+
+
+class RAGFlowNotConfiguredError(RuntimeError):
+    """Raised when RAGFlow is used without ``RAGFLOW_API_URL`` and ``RAGFLOW_API_KEY``"""
+
+
+class _LogicalCall:
+    """The attempts making up one call to RAGFlow, e.g. the SDK and then the direct API"""
+
+    def __init__(self, breaker: CircuitBreaker):
+        self.breaker = breaker
+        self.admitted = False  # The breaker let the first attempt through
+        self.failed = False  # The last attempt failed, not recorded yet
+
+
+_logical_call: contextvars.ContextVar[Optional[_LogicalCall]] = contextvars.ContextVar(
+    "will_flow_ragflow_call", default=None
+)
+
+
+def logical_call(endpoint: str) -> Callable:
+    """Count the ``_call``s to ``endpoint`` made by a method as a single call to its breaker
+
+    The breaker is checked by the first attempt only, and a failure is
+    recorded once, when the method returns without any later attempt having
+    succeeded. An SDK failure followed by a successful direct API fallback is
+    therefore not a failure, and a failing fallback does not count twice.
+    """
+    def decorator(method: Callable[..., Awaitable[T]]) -> Callable[..., Awaitable[T]]:
+        @functools.wraps(method)
+        async def wrapper(self: "RAGFlowService", *args: Any, **kwargs: Any) -> T:
+            call = _LogicalCall(self.breakers[endpoint])
+            token = _logical_call.set(call)
+            try:
+                return await method(self, *args, **kwargs)
+            finally:
+                _logical_call.reset(token)
+                if call.failed:
+                    call.breaker.record_failure()
+
+        return wrapper
+
+    return decorator
+
+
+def map_document_status(run: Any) -> str:
+    """Map a RAGFlow document ``run`` value to our status terms"""
+    if run is None:
+        return "unknown"
+    
+    status = str(run).lower()
+    if status in READY_RUN_STATUSES:
+        return "ready"
+    elif status in PROCESSING_RUN_STATUSES:
+        return "processing"
+    elif status in FAILED_RUN_STATUSES:
+        return "failed"
+    return "unknown"
+
+
+@trace_methods
 class RAGFlowService:
     """Service for interacting with RAGFlow API"""
 
     def __init__(self):
-        self.api_url = "http://10.147.19.152:8080"
-        self.api_key = "ragflow-ViN2Y0NDI2MzlmODExZjA5YmNlMDI0Mm"
         self.logger = logging.getLogger(__name__)
+        self.breakers = {
+            endpoint: CircuitBreaker(
+                endpoint,
+                failure_threshold=settings.RAGFLOW_BREAKER_FAILURE_THRESHOLD,
+                recovery_timeout=settings.RAGFLOW_BREAKER_RECOVERY_TIMEOUT
+            )
+            for endpoint in BREAKER_ENDPOINTS
+        }
+        self.api_url: Optional[str] = None
+        self.api_key: Optional[str] = None
+        self.client = None
+        if settings.RAGFLOW_API_URL and settings.RAGFLOW_API_KEY:
+            self.connect(settings.RAGFLOW_API_URL, settings.RAGFLOW_API_KEY)
+        else:
+            self.logger.warning("RAGFLOW_API_URL and RAGFLOW_API_KEY are not set, knowledge base calls will fail")
+
+    def _require_connection(self) -> None:
+        if self.api_url is None or self.api_key is None:
+            raise RAGFlowNotConfiguredError(
+                "RAGFlow is not configured: set RAGFLOW_API_URL and RAGFLOW_API_KEY"
+            )
+
+    def connect(self, api_url: str, api_key: str) -> None:
+        """Point the service at a RAGFlow server, e.g. a local stand-in in tests"""
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
         
         # Initialize SDK client if available
         if USE_SDK:
@@ -38,8 +136,77 @@ class RAGFlowService:
             self.client = None
             self.logger.warning("RAGFlow SDK not available, using direct API calls")
 
+    async def _call(self, endpoint: str, operation: Callable[[], Awaitable[T]], hedge: bool = False) -> T:
+        """Call RAGFlow through the circuit breaker of ``endpoint``
+
+        Raises ``CircuitOpenError`` without calling RAGFlow while the circuit is
+        open. Exceptions, timeouts and 5xx responses count as failures;
+        cancellation (a client disconnecting, a caller's timeout) does not. With
+        ``hedge`` set (idempotent calls only) a second request is sent when the
+        first one is slower than the configured latency percentile. Inside a
+        method decorated with ``logical_call``, the outcome is settled once for
+        all of its attempts.
+        """
+        self._require_connection()
+        breaker = self.breakers[endpoint]
+        logical = _logical_call.get()
+        if logical is not None and logical.breaker is not breaker:
+            logical = None
+        if logical is None or not logical.admitted:
+            try:
+                breaker.before_call()
+            except CircuitOpenError:
+                record_ragflow_error(endpoint)
+                raise
+            if logical is not None:
+                logical.admitted = True
+        
+        def failed() -> None:
+            if logical is None:
+                breaker.record_failure()
+            else:
+                logical.failed = True
+        
+        start = time.perf_counter()
+        with tracer.span(f"ragflow.{endpoint}"), track_ragflow(endpoint) as call:
+            try:
+                delay = self._hedge_delay(breaker) if hedge else None
+                if delay is None:
+                    result = await operation()
+                else:
+                    result = await hedged(operation, delay, on_hedge=breaker.record_hedge)
+                if isinstance(result, httpx.Response):
+                    call.payload_size = len(result.content)
+            except asyncio.CancelledError:
+                # The caller gave up, which says nothing about RAGFlow
+                breaker.record_cancelled()
+                raise
+            except Exception:
+                failed()
+                raise
+        
+        if isinstance(result, httpx.Response) and result.status_code >= 500:
+            failed()
+            record_ragflow_error(endpoint)
+        else:
+            breaker.record_success(time.perf_counter() - start)
+            if logical is not None:
+                logical.failed = False
+        return result
+
+    def _hedge_delay(self, breaker: CircuitBreaker) -> Optional[float]:
+        """Seconds to wait before hedging a call, or None to not hedge"""
+        if not settings.RAGFLOW_HEDGING_ENABLED or len(breaker.latencies) < settings.RAGFLOW_HEDGE_MIN_SAMPLES:
+            return None
+        return max(breaker.latency_percentile(settings.RAGFLOW_HEDGE_PERCENTILE), settings.RAGFLOW_HEDGE_MIN_DELAY)
+
+    def breaker_states(self) -> List[Dict[str, Any]]:
+        """Snapshot of every RAGFlow circuit breaker"""
+        return [breaker.snapshot() for breaker in self.breakers.values()]
+
     async def create_knowledge_base(self, user_email: str, kb_create: KnowledgeBaseCreate) -> KnowledgeBase:
         """Create a new knowledge base in RAGFlow"""
+        self._require_connection()
         try:
             if USE_SDK:
                 try:
@@ -137,71 +304,62 @@ class RAGFlowService:
 
     async def upload_document(self, kb_id: str, file: UploadFile) -> DocumentInfo:
         """Upload a document to a knowledge base"""
-        temp_file_path = f"/tmp/{uuid.uuid4()}_{file.filename}"
+        content = await file.read()
+        return await self.upload_document_content(kb_id, file.filename, file.content_type, content)
+
+    async def upload_documents(
+        self,
+        kb_id: str,
+        files: List[Tuple[str, Optional[str], bytes]],
+        concurrency: Optional[int] = None,
+        on_result: Optional[Callable[[UploadResult], None]] = None
+    ) -> List[UploadResult]:
+        """Upload several documents to a knowledge base with bounded concurrency
+
+        ``files`` is a list of ``(file_name, content_type, content)`` tuples. Results
+        are returned in the same order as the input; ``on_result`` is called as each
+        file finishes so callers can track progress.
+        """
+        semaphore = asyncio.Semaphore(concurrency or settings.KB_UPLOAD_CONCURRENCY)
+
+        async def upload_one(file_name: str, content_type: Optional[str], content: bytes) -> UploadResult:
+            async with semaphore:
+                try:
+                    doc_info = await self.upload_document_content(kb_id, file_name, content_type, content)
+                    if doc_info.status == "failed":
+                        result = UploadResult(file_name=file_name, success=False, document=doc_info,
+                                              error="Upload to RAGFlow failed")
+                    else:
+                        result = UploadResult(file_name=file_name, success=True, document=doc_info)
+                except Exception as e:
+                    self.logger.error(f"Error uploading {file_name}: {str(e)}")
+                    result = UploadResult(file_name=file_name, success=False, error=str(e))
+
+            if on_result:
+                on_result(result)
+            return result
+
+        return await asyncio.gather(*(upload_one(*f) for f in files))
+
+    @logical_call("upload")
+    async def upload_document_content(
+        self,
+        kb_id: str,
+        file_name: str,
+        content_type: Optional[str],
+        content: bytes
+    ) -> DocumentInfo:
+        """Upload raw document content to a knowledge base"""
+        size_bytes = len(content)
         try:
-            # Save the uploaded file temporarily
-            with open(temp_file_path, "wb") as temp_file:
-                content = await file.read()
-                temp_file.write(content)
-            
             if USE_SDK:
                 try:
-                    # Get the dataset (knowledge base) from RAGFlow
-                    datasets = self.client.list_datasets(id=kb_id)
-                    if not datasets:
-                        raise Exception(f"Knowledge base with ID {kb_id} not found")
-                    
-                    dataset = datasets[0]
-                    
-                    # Read file content for SDK upload
-                    with open(temp_file_path, "rb") as f:
-                        file_content = f.read()
-                    
-                    # Use SDK to upload document - follows the correct pattern from docs
-                    document_list = [{
-                        "display_name": file.filename,
-                        "blob": file_content
-                    }]
-                    
-                    self.logger.info(f"Uploading document using SDK to KB {kb_id}: {file.filename}")
-                    
-                    # Upload documents using SDK method
-                    upload_result = dataset.upload_documents(document_list)
-                    self.logger.info(f"SDK upload result: {upload_result}")
-                    
-                    # List documents to get the uploaded one
-                    docs = dataset.list_documents()
-                    
-                    # Find the newly uploaded document (most recent one)
-                    if docs:
-                        # Get document that matches our filename
-                        matching_docs = [doc for doc in docs if hasattr(doc, 'name') and doc.name == file.filename]
-                        if matching_docs:
-                            doc = matching_docs[0]
-                            doc_info = DocumentInfo(
-                                doc_id=doc.id,
-                                file_name=file.filename,
-                                file_type=file.content_type,
-                                status="processing",  # Default status
-                                upload_time=datetime.utcnow(),
-                                size_bytes=os.path.getsize(temp_file_path)
-                            )
-                            self.logger.info(f"Document uploaded successfully using SDK: {doc_info.doc_id}")
-                            return doc_info
-                    
-                    # If we couldn't find the document, create a placeholder
-                    doc_id = str(uuid.uuid4())
-                    doc_info = DocumentInfo(
-                        doc_id=doc_id,
-                        file_name=file.filename,
-                        file_type=file.content_type,
-                        status="processing",
-                        upload_time=datetime.utcnow(),
-                        size_bytes=os.path.getsize(temp_file_path)
-                    )
-                    
-                    return doc_info
-                    
+                    # The SDK is synchronous, so run it off the event loop
+                    return await self._call("upload", lambda: asyncio.to_thread(
+                        self._sdk_upload_document, kb_id, file_name, content_type, content
+                    ))
+                except CircuitOpenError:
+                    raise
                 except Exception as sdk_error:
                     # Log SDK error and fall back to direct API
                     self.logger.warning(f"SDK upload method failed, falling back to direct API: {str(sdk_error)}")
@@ -212,18 +370,17 @@ class RAGFlowService:
                 # Use the correct endpoint from documentation
                 endpoint = f"{self.api_url}/api/v1/datasets/{kb_id}/documents"
                 
-                with open(temp_file_path, "rb") as f:
-                    # RAGFlow expects a specific file field name: "file"
-                    files = {"file": (file.filename, f, file.content_type)}
-                    
-                    # Log request details for debugging
-                    self.logger.info(f"Uploading file to {endpoint}")
-                    
-                    response = await client.post(
-                        endpoint,
-                        headers={"Authorization": f"Bearer {self.api_key}"},
-                        files=files
-                    )
+                # RAGFlow expects a specific file field name: "file"
+                files = {"file": (file_name, content, content_type)}
+                
+                # Log request details for debugging
+                self.logger.info(f"Uploading file to {endpoint}")
+                
+                response = await self._call("upload", lambda: client.post(
+                    endpoint,
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    files=files
+                ))
                 
                 if response.status_code != 200:
                     self.logger.error(f"Failed to upload document: {response.text}")
@@ -231,11 +388,11 @@ class RAGFlowService:
                     doc_id = str(uuid.uuid4())
                     doc_info = DocumentInfo(
                         doc_id=doc_id,
-                        file_name=file.filename,
-                        file_type=file.content_type,
+                        file_name=file_name,
+                        file_type=content_type,
                         status="failed",
                         upload_time=datetime.utcnow(),
-                        size_bytes=os.path.getsize(temp_file_path)
+                        size_bytes=size_bytes
                     )
                     return doc_info
                 
@@ -258,11 +415,11 @@ class RAGFlowService:
                 # Create document info
                 doc_info = DocumentInfo(
                     doc_id=doc_id,
-                    file_name=file.filename,
-                    file_type=file.content_type,
+                    file_name=file_name,
+                    file_type=content_type,
                     status="processing",
                     upload_time=datetime.utcnow(),
-                    size_bytes=os.path.getsize(temp_file_path)
+                    size_bytes=size_bytes
                 )
                 
                 # Start document parsing
@@ -289,55 +446,113 @@ class RAGFlowService:
                 
                 return doc_info
                 
+        except CircuitOpenError:
+            # Not a failure of this file: let the caller fail fast
+            raise
         except Exception as e:
             self.logger.error(f"Exception during file upload: {str(e)}")
             # Create document info with failed status
             doc_id = str(uuid.uuid4())
             doc_info = DocumentInfo(
                 doc_id=doc_id,
-                file_name=file.filename,
-                file_type=file.content_type,
+                file_name=file_name,
+                file_type=content_type,
                 status="failed",
                 upload_time=datetime.utcnow(),
-                size_bytes=os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else 0
+                size_bytes=size_bytes
             )
             return doc_info
-        finally:
-            # Clean up temp file
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
 
+    def _sdk_upload_document(
+        self,
+        kb_id: str,
+        file_name: str,
+        content_type: Optional[str],
+        content: bytes
+    ) -> DocumentInfo:
+        """Upload raw document content using the (blocking) RAGFlow SDK"""
+        size_bytes = len(content)
+        # Get the dataset (knowledge base) from RAGFlow
+        datasets = self.client.list_datasets(id=kb_id)
+        if not datasets:
+            raise Exception(f"Knowledge base with ID {kb_id} not found")
+        
+        dataset = datasets[0]
+        
+        # Use SDK to upload document - follows the correct pattern from docs
+        document_list = [{
+            "display_name": file_name,
+            "blob": content
+        }]
+        
+        self.logger.info(f"Uploading document using SDK to KB {kb_id}: {file_name}")
+        
+        # Upload documents using SDK method
+        upload_result = dataset.upload_documents(document_list)
+        self.logger.info(f"SDK upload result: {upload_result}")
+        
+        # List documents to get the uploaded one
+        docs = dataset.list_documents()
+        
+        # Find the newly uploaded document (most recent one)
+        if docs:
+            # Get document that matches our filename
+            matching_docs = [doc for doc in docs if hasattr(doc, 'name') and doc.name == file_name]
+            if matching_docs:
+                doc = matching_docs[0]
+                doc_info = DocumentInfo(
+                    doc_id=doc.id,
+                    file_name=file_name,
+                    file_type=content_type,
+                    status="processing",  # Default status
+                    upload_time=datetime.utcnow(),
+                    size_bytes=size_bytes
+                )
+                self.logger.info(f"Document uploaded successfully using SDK: {doc_info.doc_id}")
+                return doc_info
+        
+        # If we couldn't find the document, create a placeholder
+        doc_id = str(uuid.uuid4())
+        doc_info = DocumentInfo(
+            doc_id=doc_id,
+            file_name=file_name,
+            file_type=content_type,
+            status="processing",
+            upload_time=datetime.utcnow(),
+            size_bytes=size_bytes
+        )
+        
+        return doc_info
+
+    @logical_call("status")
     async def get_document_status(self, kb_id: str, doc_id: str) -> str:
         """Get the status of a document"""
         try:
             if USE_SDK:
                 try:
-                    # Get the dataset (knowledge base) from RAGFlow
-                    datasets = self.client.list_datasets(id=kb_id)
-                    if not datasets:
-                        raise Exception(f"Knowledge base with ID {kb_id} not found")
-                    
-                    dataset = datasets[0]
-                    
-                    # List documents to find the one we want
-                    docs = dataset.list_documents(id=doc_id)
-                    if not docs:
-                        self.logger.warning(f"Document with ID {doc_id} not found in knowledge base {kb_id}")
-                        return "failed"
-                    
-                    doc = docs[0]
-                    
-                    # Map RAGFlow document status to our status terms
-                    status = doc.run.lower() if hasattr(doc, 'run') else "unknown"
+                    def status_with_sdk() -> str:
+                        # Get the dataset (knowledge base) from RAGFlow
+                        datasets = self.client.list_datasets(id=kb_id)
+                        if not datasets:
+                            raise Exception(f"Knowledge base with ID {kb_id} not found")
+                        
+                        dataset = datasets[0]
+                        
+                        # List documents to find the one we want
+                        docs = dataset.list_documents(id=doc_id)
+                        if not docs:
+                            self.logger.warning(f"Document with ID {doc_id} not found in knowledge base {kb_id}")
+                            return "failed"
+                        
+                        doc = docs[0]
+                        
+                        # Map RAGFlow document status to our status terms
+                        return map_document_status(getattr(doc, 'run', None))
                     
-                    if status in ["done", "complete", "completed", "success", "indexed"]:
-                        return "ready"
-                    elif status in ["running", "processing", "in_progress", "parsing", "indexing", "unstart"]:
-                        return "processing"
-                    elif status in ["failed", "error", "failure", "cancel", "fail"]:
-                        return "failed"
-                    else:
-                        return "unknown"
+                    # The SDK is synchronous, so run it off the event loop
+                    return await self._call("status", lambda: asyncio.to_thread(status_with_sdk))
+                except CircuitOpenError:
+                    raise
                 except Exception as sdk_error:
                     # Log SDK error and fall back to direct API
                     self.logger.warning(f"SDK status method failed, falling back to direct API: {str(sdk_error)}")
@@ -348,10 +563,10 @@ class RAGFlowService:
                 # Use the correct endpoint from documentation
                 endpoint = f"{self.api_url}/api/v1/datasets/{kb_id}/documents/{doc_id}"
                 
-                response = await client.get(
+                response = await self._call("status", lambda: client.get(
                     endpoint,
                     headers={"Authorization": f"Bearer {self.api_key}"}
-                )
+                ), hedge=True)
                 
                 if response.status_code != 200:
                     self.logger.error(f"Failed to get document status: {response.text}")
@@ -374,27 +589,82 @@ class RAGFlowService:
                         status = result.get("run", "")
                 
                 # Map RAGFlow status to our status terms
-                if isinstance(status, str):
-                    status = status.lower()
-                    if status in ["done", "complete", "completed", "success", "indexed", "2"]:
-                        return "ready"
-                    elif status in ["running", "processing", "in_progress", "parsing", "indexing", "unstart", "0", "1"]:
-                        return "processing"
-                    elif status in ["failed", "error", "failure", "cancel", "fail", "-1"]:
-                        return "failed"
-                
-                return "unknown"
+                return map_document_status(status)
+        except CircuitOpenError:
+            # RAGFlow is unavailable, which says nothing about the document
+            raise
         except Exception as e:
             self.logger.error(f"Error getting document status: {str(e)}")
             return "failed"
 
+    @logical_call("list")
+    async def list_document_statuses(self, kb_id: str, page_size: int = 100) -> Dict[str, str]:
+        """Get the status of every document in a knowledge base with one paged list call"""
+        statuses = {}
+        
+        if USE_SDK:
+            try:
+                def list_with_sdk() -> Dict[str, str]:
+                    datasets = self.client.list_datasets(id=kb_id)
+                    if not datasets:
+                        raise Exception(f"Knowledge base with ID {kb_id} not found")
+                    
+                    found = {}
+                    page = 1
+                    while True:
+                        docs = datasets[0].list_documents(page=page, page_size=page_size)
+                        for doc in docs:
+                            found[doc.id] = map_document_status(getattr(doc, 'run', None))
+                        if len(docs) < page_size:
+                            return found
+                        page += 1
+                
+                # The SDK is synchronous, so run it off the event loop
+                return await self._call("list", lambda: asyncio.to_thread(list_with_sdk))
+            except CircuitOpenError:
+                raise
+            except Exception as sdk_error:
+                # Log SDK error and fall back to direct API
+                self.logger.warning(f"SDK document list failed, falling back to direct API: {str(sdk_error)}")
+        
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            endpoint = f"{self.api_url}/api/v1/datasets/{kb_id}/documents"
+            page = 1
+            while True:
+                response = await self._call("list", lambda: client.get(
+                    endpoint,
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    params={"page": page, "page_size": page_size}
+                ), hedge=True)
+                
+                if response.status_code != 200:
+                    raise Exception(f"Failed to list documents: {response.text}")
+                
+                result = response.json()
+                
+                # Handle different response formats
+                docs = []
+                if isinstance(result, dict) and isinstance(result.get("data"), dict):
+                    docs = result["data"].get("docs", [])
+                elif isinstance(result, dict) and isinstance(result.get("data"), list):
+                    docs = result["data"]
+                
+                for doc in docs:
+                    if doc.get("id"):
+                        statuses[doc["id"]] = map_document_status(doc.get("run"))
+                
+                if len(docs) < page_size:
+                    return statuses
+                page += 1
+
+    @logical_call("list")
     async def list_knowledge_bases(self) -> List[Dict[str, Any]]:
         """List all knowledge bases in RAGFlow"""
         try:
             if USE_SDK:
                 try:
-                    # Use SDK to list datasets (knowledge bases)
-                    datasets = self.client.list_datasets()
+                    # Use SDK to list datasets (knowledge bases), off the event loop
+                    datasets = await self._call("list", lambda: asyncio.to_thread(self.client.list_datasets))
                     
                     # Convert SDK dataset objects to dictionaries
                     result = []
@@ -408,6 +678,8 @@ class RAGFlowService:
                         })
                     
                     return result
+                except CircuitOpenError:
+                    raise
                 except Exception as sdk_error:
                     # Log SDK error and fall back to direct API
                     self.logger.warning(f"SDK list method failed, falling back to direct API: {str(sdk_error)}")
@@ -418,10 +690,10 @@ class RAGFlowService:
                 # Use the correct endpoint from documentation
                 endpoint = f"{self.api_url}/api/v1/datasets"
                 
-                response = await client.get(
+                response = await self._call("list", lambda: client.get(
                     endpoint,
                     headers={"Authorization": f"Bearer {self.api_key}"}
-                )
+                ), hedge=True)
                 
                 if response.status_code != 200:
                     self.logger.error(f"Failed to list knowledge bases: {response.text}")
@@ -437,12 +709,15 @@ class RAGFlowService:
                     datasets = result
                 
                 return datasets
+        except CircuitOpenError:
+            raise
         except Exception as e:
             self.logger.error(f"Error listing knowledge bases: {str(e)}")
             raise Exception(f"Failed to list knowledge bases: {str(e)}")
 
     async def delete_knowledge_base(self, kb_id: str) -> bool:
         """Delete a knowledge base"""
+        self._require_connection()
         try:
             if USE_SDK:
                 # Use SDK to delete dataset (knowledge base)
@@ -465,8 +740,96 @@ class RAGFlowService:
             self.logger.error(f"Error deleting knowledge base: {str(e)}")
             raise Exception(f"Failed to delete knowledge base: {str(e)}")
 
+    @logical_call("delete")
+    async def delete_documents(self, kb_id: str, doc_ids: List[str]) -> bool:
+        """Delete documents from a knowledge base"""
+        if not doc_ids:
+            return True
+
+        try:
+            if USE_SDK:
+                try:
+                    def delete_with_sdk() -> None:
+                        datasets = self.client.list_datasets(id=kb_id)
+                        if not datasets:
+                            raise Exception(f"Knowledge base with ID {kb_id} not found")
+                        datasets[0].delete_documents(ids=doc_ids)
+
+                    # The SDK is synchronous, so run it off the event loop
+                    await self._call("delete", lambda: asyncio.to_thread(delete_with_sdk))
+                    return True
+                except CircuitOpenError:
+                    raise
+                except Exception as sdk_error:
+                    # Log SDK error and fall back to direct API
+                    self.logger.warning(f"SDK delete method failed, falling back to direct API: {str(sdk_error)}")
+
+            async with httpx.AsyncClient(timeout=30.0) as client:
+                response = await self._call("delete", lambda: client.request(
+                    "DELETE",
+                    f"{self.api_url}/api/v1/datasets/{kb_id}/documents",
+                    headers={"Authorization": f"Bearer {self.api_key}"},
+                    json={"ids": doc_ids}
+                ))
+
+                if response.status_code != 200:
+                    self.logger.error(f"Failed to delete documents: {response.text}")
+                    return False
+
+                return True
+        except Exception as e:
+            self.logger.error(f"Error deleting documents: {str(e)}")
+            return False
+
+    async def retrieve_chunks(
+        self,
+        kb_id: str,
+        query: str,
+        top_k: int = 10,
+        similarity_threshold: float = 0.2,
+        vector_similarity_weight: float = 0.3
+    ) -> List[Dict[str, Any]]:
+        """Retrieve the chunks of a knowledge base most relevant to a query"""
+        self.logger.info(f"Retrieving chunks for query: '{query}' from knowledge base {kb_id}")
+        retrieval_payload = {
+            "question": query,
+            "dataset_ids": [kb_id],
+            "similarity_threshold": similarity_threshold,
+            "vector_similarity_weight": vector_similarity_weight,
+            "top_k": top_k,
+            "highlight": True  # Get highlighted text if possible
+        }
+        
+        async with httpx.AsyncClient(timeout=30.0) as client:
+            retrieval_response = await self._call("retrieval", lambda: client.post(
+                f"{self.api_url}/api/v1/retrieval",
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                json=retrieval_payload
+            ), hedge=True)
+        
+        if retrieval_response.status_code != 200:
+            self.logger.error(f"Failed to retrieve chunks: {retrieval_response.text}")
+            raise Exception(f"Failed to retrieve chunks: {retrieval_response.status_code}")
+        
+        retrieval_result = loads(retrieval_response.content)
+        # Log the raw body rather than re-encoding the parsed result on every retrieval
+        self.logger.info(f"Retrieval result: {retrieval_response.text[:500]}...")
+        
+        # Extract chunks from retrieval response
+        chunks = []
+        if isinstance(retrieval_result, dict):
+            if "data" in retrieval_result and "chunks" in retrieval_result["data"]:
+                chunks = retrieval_result["data"]["chunks"]
+            elif "chunks" in retrieval_result:
+                chunks = retrieval_result["chunks"]
+        
+        return chunks
+
     async def chat_with_knowledge_base(self, kb_id: str, query: str, history: List[Dict[str, str]] = None) -> Dict[str, Any]:
-        """Chat with a knowledge base using retrieval"""
+        """Chat with a knowledge base using retrieval, answering with the top excerpts"""
         if history is None:
             history = []
         
@@ -474,99 +837,69 @@ class RAGFlowService:
             # First check if the knowledge base exists
             kb_list = await self.list_knowledge_bases()
             kb_exists = any(kb.get('id') == kb_id for kb in kb_list)
-            
+
             if not kb_exists:
                 self.logger.warning(f"Knowledge base with ID {kb_id} not found")
                 return {
                     "answer": "Sorry, the specified knowledge base does not exist.",
                     "citations": []
                 }
-            
+
             # Use retrieval to get relevant chunks - this is working reliably
-            self.logger.info(f"Retrieving chunks for query: '{query}' from knowledge base {kb_id}")
-            retrieval_payload = {
-                "question": query,
-                "dataset_ids": [kb_id],
-                "similarity_threshold": 0.2,  # Lower threshold to get more results
-                "vector_similarity_weight": 0.3,
-                "top_k": 10,
-                "highlight": True  # Get highlighted text if possible
-            }
+            try:
+                chunks = await self.retrieve_chunks(kb_id, query)
+            except Exception:
+                return {
+                    "answer": "Sorry, I couldn't retrieve information from the knowledge base.",
+                    "citations": []
+                }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                retrieval_response = await client.post(
-                    f"{self.api_url}/api/v1/retrieval",
-                    headers={
-                        "Authorization": f"Bearer {self.api_key}",
-                        "Content-Type": "application/json"
-                    },
-                    json=retrieval_payload
-                )
-                
-                if retrieval_response.status_code != 200:
-                    self.logger.error(f"Failed to retrieve chunks: {retrieval_response.text}")
-                    return {
-                        "answer": "Sorry, I couldn't retrieve information from the knowledge base.",
-                        "citations": []
-                    }
-                
-                retrieval_result = retrieval_response.json()
-                self.logger.info(f"Retrieval result: {json.dumps(retrieval_result)[:500]}...")
-                
-                # Extract chunks from retrieval response
-                chunks = []
-                if isinstance(retrieval_result, dict):
-                    if "data" in retrieval_result and "chunks" in retrieval_result["data"]:
-                        chunks = retrieval_result["data"]["chunks"]
-                    elif "chunks" in retrieval_result:
-                        chunks = retrieval_result["chunks"]
-                
-                if not chunks:
-                    self.logger.warning(f"No chunks found for query: '{query}' in knowledge base {kb_id}")
-                    return {
-                        "answer": "Sorry, I couldn't find relevant information in the knowledge base for your question.",
-                        "citations": []
-                    }
-                
-                self.logger.info(f"Found {len(chunks)} relevant chunks")
+            if not chunks:
+                self.logger.warning(f"No chunks found for query: '{query}' in knowledge base {kb_id}")
+                return {
+                    "answer": "Sorry, I couldn't find relevant information in the knowledge base for your question.",
+                    "citations": []
+                }
+            
+            self.logger.info(f"Found {len(chunks)} relevant chunks")
+            
+            # Process the chunks into context and citations
+            citations = []
+            context_parts = []
+            
+            for i, chunk in enumerate(chunks[:5]):  # Use top 5 chunks
+                content = chunk.get("content", "")
+                if not content:
+                    continue
+                    
+                # Add to context parts
+                context_parts.append(content)
+                
+                # Create a citation
+                citations.append({
+                    "text": content,
+                    "document_id": chunk.get("document_id", "") or chunk.get("id", ""),
+                    "document_name": chunk.get("document_keyword", "") or chunk.get("docnm_kwd", ""),
+                    "similarity": chunk.get("similarity", 0)
+                })
+            
+            # Create a simple answer based on the retrieved chunks
+            if context_parts:
+                # Format the chunks into a response
+                answer = f"Here's what I found in the knowledge base:\n\n"
                 
-                # Process the chunks into context and citations
-                citations = []
-                context_parts = []
+                for i, part in enumerate(context_parts):
+                    answer += f"Excerpt {i+1}:\n{part.strip()}\n\n"
                 
-                for i, chunk in enumerate(chunks[:5]):  # Use top 5 chunks
-                    content = chunk.get("content", "")
-                    if not content:
-                        continue
-                        
-                    # Add to context parts
-                    context_parts.append(content)
-                    
-                    # Create a citation
-                    citations.append({
-                        "text": content,
-                        "document_id": chunk.get("document_id", "") or chunk.get("id", ""),
-                        "document_name": chunk.get("document_keyword", "") or chunk.get("docnm_kwd", ""),
-                        "similarity": chunk.get("similarity", 0)
-                    })
-                
-                # Create a simple answer based on the retrieved chunks
-                if context_parts:
-                    # Format the chunks into a response
-                    answer = f"Here's what I found in the knowledge base:\n\n"
-                    
-                    for i, part in enumerate(context_parts):
-                        answer += f"Excerpt {i+1}:\n{part.strip()}\n\n"
-                    
-                    return {
-                        "answer": answer,
-                        "citations": citations
-                    }
-                else:
-                    return {
-                        "answer": "Sorry, I couldn't find relevant information in the knowledge base for your question.",
-                        "citations": []
-                    }
+                return {
+                    "answer": answer,
+                    "citations": citations
+                }
+            else:
+                return {
+                    "answer": "Sorry, I couldn't find relevant information in the knowledge base for your question.",
+                    "citations": []
+                }
         
         except Exception as e:
             self.logger.error(f"Error in chat_with_knowledge_base: {str(e)}")
@@ -575,4 +908,5 @@ class RAGFlowService:
                 "citations": []
             }
 
-ragflow_service = RAGFlowService() 
\ No newline at end of file
+ragflow_service = RAGFlowService()
+register_breaker_collector(ragflow_service.breaker_states) 
\ No newline at end of file
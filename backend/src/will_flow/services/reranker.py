@@ -0,0 +1,186 @@
+"""Local reranking of retrieved chunks.
+
+RAGFlow returns candidates ordered by its hybrid similarity. Before they are
+put into a prompt they are rescored here against the query with BM25, blended
+with RAGFlow's similarity, optionally diversified with maximal marginal
+relevance (MMR) and cut by score, count and token budget. All scoring is done
+in batch over the whole candidate set with NumPy.
+"""
+import string
+from typing import Any, Dict, List, Optional
+
+from will_flow.services.prompt_builder import estimate_tokens
+
+# NumPy is optional; without it chunks keep RAGFlow's order
+try:
+    import numpy as np
+    USE_NUMPY = True
+except ImportError:
+    USE_NUMPY = False
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MMR_DIMENSIONS = 512  # Must be a power of two
+
+# Punctuation and whitespace all become plain spaces, so a term can be
+# matched by searching for " term " in the normalized text
+_SEPARATORS = string.punctuation + "\n\t\r\x0b\x0c"
+_NORMALIZE = str.maketrans(_SEPARATORS, " " * len(_SEPARATORS))
+_DOC_SEPARATOR = " \x00 "
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "do", "does", "for", "from",
+    "how", "i", "in", "is", "it", "me", "my", "of", "on", "or", "that", "the",
+    "this", "to", "was", "what", "when", "where", "which", "who", "why", "with",
+})
+
+
+def query_terms(query: str) -> List[str]:
+    """Unique, normalized query terms without stopwords"""
+    terms = list(dict.fromkeys(query.lower().translate(_NORMALIZE).split()))
+    return [term for term in terms if term not in STOPWORDS] or terms
+
+
+def bm25_scores(query: str, texts: List[str]) -> "np.ndarray":
+    """BM25 score of every text against the query, treating the texts as the corpus
+
+    Texts are normalized in one pass over their concatenation and term
+    frequencies are counted with substring search, so the cost is dominated by
+    a few C-level scans rather than per-token Python work. Document length is
+    measured in characters, which is proportional to token count for BM25's
+    length normalization.
+    """
+    n = len(texts)
+    terms = query_terms(query)
+    m = len(terms)
+    if n == 0 or m == 0:
+        return np.zeros(n, dtype=np.float32)
+
+    text = " " + _DOC_SEPARATOR.join(texts) + " "
+    if text.isascii():
+        text = text.lower()
+    else:
+        # Lowercasing can change the length of some non-ASCII characters
+        texts = [t.lower() for t in texts]
+        text = " " + _DOC_SEPARATOR.join(texts) + " "
+    # translate maps single characters, so offsets are unchanged
+    text = text.translate(_NORMALIZE)
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=n)
+    # Each text starts after the leading space and the previous separators
+    starts = np.cumsum(lengths + len(_DOC_SEPARATOR)) - lengths - len(_DOC_SEPARATOR) + 1
+
+    positions = []
+    term_ids = []
+    find = text.find
+    for j, term in enumerate(terms):
+        pattern = f" {term} "
+        step = len(pattern) - 1  # Matches may share the separating space
+        i = find(pattern)
+        while i != -1:
+            positions.append(i)
+            term_ids.append(j)
+            i = find(pattern, i + step)
+
+    if positions:
+        docs = np.searchsorted(starts, np.asarray(positions) + 1, side="right") - 1
+        tf = np.bincount(docs * m + np.asarray(term_ids), minlength=n * m)
+        tf = tf.reshape(n, m).astype(np.float32)
+    else:
+        tf = np.zeros((n, m), dtype=np.float32)
+
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+    doc_len = lengths.astype(np.float32)
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len / max(float(doc_len.mean()), 1.0))
+    return (tf * (BM25_K1 + 1) / (tf + norm[:, None])) @ idf
+
+
+def similarity_matrix(texts: List[str]) -> "np.ndarray":
+    """Cosine similarity between texts using hashed character trigram vectors"""
+    n = len(texts)
+    encoded = [text.lower().encode("utf-8", errors="ignore") for text in texts]
+    data = np.frombuffer(b"".join(encoded), dtype=np.uint8).astype(np.uint16)
+    if data.size < 3:
+        return np.eye(n, dtype=np.float32)
+
+    # Which text each trigram starts in; trigrams spanning two texts are
+    # rare enough to be left in
+    docs = np.repeat(np.arange(n, dtype=np.int32), [len(e) for e in encoded])[:-2]
+    trigrams = ((data[:-2] << 6) ^ (data[1:-1] << 3) ^ data[2:]) & (MMR_DIMENSIONS - 1)
+
+    vectors = np.bincount(
+        docs * MMR_DIMENSIONS + trigrams, minlength=n * MMR_DIMENSIONS
+    ).reshape(n, MMR_DIMENSIONS).astype(np.float32)
+    vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-9)
+    return vectors @ vectors.T
+
+
+def mmr_order(relevance: "np.ndarray", similarity: "np.ndarray", count: int, mmr_lambda: float) -> List[int]:
+    """Greedy maximal marginal relevance selection"""
+    n = relevance.size
+    selected = []
+    max_similarity = np.zeros(n, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    for _ in range(min(count, n)):
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * max_similarity
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        max_similarity = np.maximum(max_similarity, similarity[best])
+    return selected
+
+
+def rerank_chunks(
+    query: str,
+    chunks: List[Dict[str, Any]],
+    top_n: Optional[int] = None,
+    min_score: float = 0.0,
+    max_tokens: Optional[int] = None,
+    lexical_weight: float = 0.5,
+    mmr_lambda: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Rescore chunks against the query and cut them down
+
+    The rerank score blends max-normalized BM25 with RAGFlow's ``similarity``
+    using ``lexical_weight``. Chunks below ``min_score`` are dropped, then the
+    best ``top_n`` are kept (picked with MMR when ``mmr_lambda`` is set) as long
+    as they fit in ``max_tokens``. Every returned chunk carries its
+    ``rerank_score``.
+    """
+    chunks = [chunk for chunk in chunks if chunk.get("content")]
+    if not chunks:
+        return []
+
+    if not USE_NUMPY:
+        return chunks[:top_n] if top_n else chunks
+
+    texts = [chunk["content"] for chunk in chunks]
+    lexical = bm25_scores(query, texts)
+    peak = float(lexical.max())
+    if peak > 0:
+        lexical /= peak
+
+    similarity = np.fromiter(
+        (float(chunk.get("similarity") or 0) for chunk in chunks), dtype=np.float32, count=len(chunks)
+    )
+    relevance = lexical_weight * lexical + (1 - lexical_weight) * similarity
+
+    candidates = np.flatnonzero(relevance >= min_score)
+    count = min(top_n or candidates.size, candidates.size)
+    if count == 0:
+        return []
+
+    if mmr_lambda is not None:
+        pairwise = similarity_matrix([texts[i] for i in candidates])
+        order = candidates[mmr_order(relevance[candidates], pairwise, count, mmr_lambda)]
+    else:
+        order = candidates[np.argsort(-relevance[candidates], kind="stable")[:count]]
+
+    if max_tokens is not None:
+        # Keep the prefix that fits the budget, but always at least one chunk
+        tokens = np.cumsum([estimate_tokens(texts[i]) for i in order])
+        order = order[:max(int(np.searchsorted(tokens, max_tokens, side="right")), 1)]
+
+    return [{**chunks[i], "rerank_score": float(relevance[i])} for i in order]
@@ -0,0 +1,232 @@
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional
+
+from opensearchpy import OpenSearch
+
+from will_flow.core.config import settings
+from will_flow.db.opensearch import opensearch_client
+from will_flow.models.chat import ChatSession
+from will_flow.services.openrouter_service import OpenRouterService, openrouter_service
+
+DEFAULT_TITLE = "New Chat"
+TITLE_MAX_CHARS = 80
+# Characters of each message shown to the model, so long pastes stay cheap
+PROMPT_MESSAGE_CHARS = 1000
+
+TITLE_PROMPT = (
+    "Write a short title, at most six words, for the conversation below. "
+    "Reply with the title only, without quotes or punctuation at the end."
+)
+
+SUMMARY_PROMPT = (
+    "You keep a running summary of a conversation. Update the summary below "
+    "with the new messages. Keep facts, decisions and open questions, drop "
+    "pleasantries, and stay under 150 words. Reply with the summary only."
+)
+
+# Never overwrites a title the user set while the update was being generated
+UPDATE_SCRIPT = """
+if (params.title != null && ctx._source.title == params.default_title) {
+    ctx._source.title = params.title;
+}
+if (params.summary != null) {
+    ctx._source.summary = params.summary;
+    ctx._source.summary_message_count = params.summary_message_count;
+}
+"""
+
+
+def fallback_title(content: str) -> str:
+    """Title from the start of the first message, for when the model is unavailable"""
+    return content[:30] + "..." if len(content) > 30 else content
+
+
+def _transcript(messages: List[Dict[str, Any]]) -> str:
+    return "\n\n".join(
+        f"{message.get('role', 'user')}: {str(message.get('content') or '')[:PROMPT_MESSAGE_CHARS]}"
+        for message in messages
+    )
+
+
+class ThreadSummaryService:
+    """Background worker that titles chat threads and keeps rolling summaries
+
+    ``enqueue()`` only records the session id, so chat requests never wait on
+    it. The worker waits ``THREAD_SUMMARY_BATCH_DELAY`` after the first id
+    arrives (letting the assistant reply of the same turn land), reads the
+    queued sessions in one request, generates titles and summaries with the
+    cheap ``THREAD_SUMMARY_MODEL`` and writes them back in one bulk request.
+    Threads still called "New Chat" get a title; with
+    ``THREAD_ROLLING_SUMMARY`` on, threads get their summary updated every
+    ``THREAD_SUMMARY_EVERY`` messages.
+    """
+
+    def __init__(self, client: OpenSearch = opensearch_client, openrouter: OpenRouterService = openrouter_service):
+        self.client = client
+        self.openrouter = openrouter
+        self.index = "chat_history"
+        self.logger = logging.getLogger(__name__)
+        self._pending: Dict[str, None] = {}  # Insertion ordered, so repeated ids are coalesced
+        self._wake_event: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def needs_update(self, session: ChatSession) -> bool:
+        """Whether the thread is due a title or a summary"""
+        if session.title == DEFAULT_TITLE and session.messages:
+            return True
+        if not settings.THREAD_ROLLING_SUMMARY:
+            return False
+        return len(session.messages) - session.summary_message_count >= settings.THREAD_SUMMARY_EVERY
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def enqueue(self, session_id: str) -> bool:
+        """Queue a thread for titling and summarising, without waiting for it
+
+        Returns False when the worker isn't running (``THREAD_SUMMARY_ENABLED``
+        off, or outside the app's lifespan) and nothing was queued.
+        """
+        if not self.running:
+            return False
+        self._pending[session_id] = None
+        self._wake_event.set()
+        return True
+
+    async def _title(self, messages: List[Dict[str, Any]]) -> str:
+        first = str(messages[0].get("content") or "")
+        try:
+            title = await self.openrouter.complete(
+                settings.THREAD_SUMMARY_MODEL,
+                [
+                    {"role": "system", "content": TITLE_PROMPT},
+                    {"role": "user", "content": _transcript(messages[:2])}
+                ],
+                max_tokens=20,
+                temperature=0.2
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not generate thread title: {str(e)}")
+            return fallback_title(first)
+
+        lines = title.strip().splitlines()
+        title = lines[0].strip().strip("\"'").rstrip(".") if lines else ""
+        return title[:TITLE_MAX_CHARS] if title else fallback_title(first)
+
+    async def _summary(self, previous: Optional[str], messages: List[Dict[str, Any]]) -> Optional[str]:
+        try:
+            summary = await self.openrouter.complete(
+                settings.THREAD_SUMMARY_MODEL,
+                [
+                    {"role": "system", "content": SUMMARY_PROMPT},
+                    {
+                        "role": "user",
+                        "content": f"Summary so far:\n{previous or '(none)'}\n\nNew messages:\n{_transcript(messages)}"
+                    }
+                ],
+                max_tokens=300,
+                temperature=0.2
+            )
+        except Exception as e:
+            self.logger.warning(f"Could not generate thread summary: {str(e)}")
+            return None
+        return summary.strip() or None
+
+    async def process_batch(self, session_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Title and summarise a batch of threads and return the updates that were written"""
+        result = await asyncio.to_thread(
+            self.client.mget,
+            index=self.index,
+            body={"ids": session_ids},
+            _source_includes=["title", "messages", "summary", "summary_message_count"]
+        )
+
+        semaphore = asyncio.Semaphore(settings.THREAD_SUMMARY_CONCURRENCY)
+
+        async def update_for(source: Dict[str, Any]) -> Dict[str, Any]:
+            messages = source.get("messages") or []
+            update: Dict[str, Any] = {}
+            async with semaphore:
+                if source.get("title") == DEFAULT_TITLE and messages:
+                    update["title"] = await self._title(messages)
+
+                summarised = source.get("summary_message_count") or 0
+                if settings.THREAD_ROLLING_SUMMARY and len(messages) - summarised >= settings.THREAD_SUMMARY_EVERY:
+                    summary = await self._summary(source.get("summary"), messages[summarised:])
+                    if summary:
+                        update["summary"] = summary
+                        update["summary_message_count"] = len(messages)
+            return update
+
+        docs = [doc for doc in result["docs"] if doc.get("found")]
+        results = await asyncio.gather(*(update_for(doc["_source"]) for doc in docs))
+        updates = {doc["_id"]: update for doc, update in zip(docs, results) if update}
+        if not updates:
+            return {}
+
+        actions: List[Dict[str, Any]] = []
+        for session_id, update in updates.items():
+            actions.append({"update": {"_index": self.index, "_id": session_id, "retry_on_conflict": 3}})
+            actions.append({
+                "script": {
+                    "source": UPDATE_SCRIPT,
+                    "lang": "painless",
+                    "params": {
+                        "default_title": DEFAULT_TITLE,
+                        "title": update.get("title"),
+                        "summary": update.get("summary"),
+                        "summary_message_count": update.get("summary_message_count")
+                    }
+                }
+            })
+
+        response = await asyncio.to_thread(self.client.bulk, body=actions)
+        if response.get("errors"):
+            failed = [
+                item["update"]["_id"] for item in response.get("items", [])
+                if item.get("update", {}).get("error")
+            ]
+            self.logger.error(f"Failed to write thread titles or summaries for {failed}")
+            for session_id in failed:
+                updates.pop(session_id, None)
+
+        return updates
+
+    async def run(self) -> None:
+        """Process queued threads until cancelled"""
+        while True:
+            await self._wake_event.wait()
+            # Let the rest of the turn land before reading the threads
+            await asyncio.sleep(settings.THREAD_SUMMARY_BATCH_DELAY)
+            self._wake_event.clear()
+
+            while self._pending:
+                batch = list(self._pending)[:settings.THREAD_SUMMARY_BATCH_SIZE]
+                for session_id in batch:
+                    del self._pending[session_id]
+                try:
+                    await self.process_batch(batch)
+                except Exception as e:
+                    self.logger.error(f"Thread titling failed: {str(e)}")
+
+    def start(self) -> None:
+        """Start the worker on the running event loop"""
+        if self._task is None or self._task.done():
+            self._wake_event = asyncio.Event()
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        """Stop the worker, dropping anything still queued"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self._pending.clear()
+
+
+thread_summary_service = ThreadSummaryService()
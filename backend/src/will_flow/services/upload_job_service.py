@@ -0,0 +1,59 @@
+import asyncio
+import logging
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Optional, Set
+
+from will_flow.models.knowledge_base import UploadJob, UploadResult
+
+
+class UploadJobService:
+    """Tracks progress of multi-file knowledge base uploads in memory"""
+
+    def __init__(self, max_jobs: int = 1000):
+        self.jobs: "OrderedDict[str, UploadJob]" = OrderedDict()
+        self.max_jobs = max_jobs
+        self.tasks: Set[asyncio.Task] = set()
+        self.logger = logging.getLogger(__name__)
+
+    def create_job(self, kb_id: str, total: int) -> UploadJob:
+        """Register a new upload job"""
+        job = UploadJob(job_id=str(uuid.uuid4()), kb_id=kb_id, total=total)
+        self.jobs[job.job_id] = job
+        
+        # Forget the oldest jobs once the registry is full
+        while len(self.jobs) > self.max_jobs:
+            self.jobs.popitem(last=False)
+        
+        return job
+
+    def get_job(self, job_id: str) -> Optional[UploadJob]:
+        """Get an upload job by ID"""
+        return self.jobs.get(job_id)
+
+    def run_in_background(self, coro: Awaitable[None]) -> None:
+        """Run a job without blocking the request, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    def mark_running(self, job: UploadJob) -> None:
+        job.status = "running"
+        job.updated_at = datetime.utcnow()
+
+    def record_result(self, job: UploadJob, result: UploadResult) -> None:
+        """Record the outcome of a single file in the job"""
+        if result.success:
+            job.completed += 1
+        else:
+            job.failed += 1
+        job.results.append(result)
+        job.updated_at = datetime.utcnow()
+
+    def finish(self, job: UploadJob, success: bool = True) -> None:
+        job.status = "completed" if success else "failed"
+        job.updated_at = datetime.utcnow()
+
+
+upload_job_service = UploadJobService()
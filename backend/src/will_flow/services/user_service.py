@@ -3,10 +3,12 @@ from typing import Optional
 
 from opensearchpy import OpenSearch
 
+from will_flow.core.tracing import trace_methods
 from will_flow.db.opensearch import opensearch_client
 from will_flow.models.user import User, UserCreate, UserInDB
 
 
+@trace_methods
 class UserService:
     def __init__(self, client: OpenSearch = opensearch_client):
         self.client = client
@@ -0,0 +1,15 @@
+"""Local stand-ins for the upstream services, for tests, benchmarks and load tests"""
+from will_flow.testing.fake_openrouter import FakeOpenRouter, FakeOpenRouterConfig, FakeOpenRouterServer
+from will_flow.testing.fake_opensearch import FakeOpenSearch, FakeOpenSearchConfig
+from will_flow.testing.fake_ragflow import FakeRAGFlow, FakeRAGFlowConfig, FakeRAGFlowServer
+
+__all__ = [
+    "FakeOpenRouter",
+    "FakeOpenRouterConfig",
+    "FakeOpenRouterServer",
+    "FakeOpenSearch",
+    "FakeOpenSearchConfig",
+    "FakeRAGFlow",
+    "FakeRAGFlowConfig",
+    "FakeRAGFlowServer",
+]
@@ -0,0 +1,247 @@
+"""In-process stand-in for the OpenRouter (OpenAI-compatible) chat API.
+
+Serves ``POST /api/v1/chat/completions``, streaming and non-streaming, with a
+tunable time to first token, token rate, error rate and 429 rate limiting.
+Answers are deterministic filler text of a configurable length.
+
+In pytest::
+
+    @pytest.fixture
+    def fake_openrouter():
+        with FakeOpenRouterServer(FakeOpenRouterConfig(tokens_per_second=200)) as server:
+            server.attach(openrouter_service)
+            yield server
+
+For load tests, run it standalone and set ``OPENROUTER_BASE_URL`` to
+``http://<host>:<port>/api/v1``::
+
+    python -m will_flow.testing.fake_openrouter --port 9381 --ttft 0.3 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+import zlib
+from collections import Counter
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+
+from will_flow.testing.server import BackgroundServer
+
+WORDS = (
+    "the a of to and in that it is for on with as this by be at from are which "
+    "answer question context result system flow model user value process data "
+    "based following example because however therefore first second finally"
+).split()
+
+
+class FakeOpenRouterConfig(BaseModel):
+    """Behaviour of the fake OpenRouter server"""
+    api_key: Optional[str] = None  # Require this bearer token when set
+    ttft: float = 0.2  # Seconds before the first token
+    ttft_jitter: float = 0.0  # Up to this many extra seconds, uniformly distributed
+    tokens_per_second: float = 100.0
+    completion_tokens: int = 100  # Length of every answer
+    error_rate: float = 0.0  # Fraction of requests answered with ``error_status``
+    error_status: int = 500
+    rate_limit_rate: float = 0.0  # Fraction of requests answered with 429
+    max_concurrent_requests: Optional[int] = None  # Requests beyond this get 429
+    retry_after: int = 1  # Retry-After seconds sent with 429s
+    stream_error_rate: float = 0.0  # Fraction of streams that fail halfway through
+    seed: int = 0
+
+
+def _count_tokens(messages: List[Dict[str, Any]]) -> int:
+    # Same rough estimate as the prompt builder: about four characters per token
+    return sum(len(str(message.get("content") or "")) for message in messages) // 4 + 1
+
+
+class FakeOpenRouter:
+    """State and routes of the fake OpenRouter API"""
+
+    def __init__(self, config: Optional[FakeOpenRouterConfig] = None):
+        self.config = config or FakeOpenRouterConfig()
+        self.requests: Counter = Counter()  # Keyed by outcome: ok, error, rate_limited, stream_error
+        self.in_flight = 0
+        self.random = random.Random(self.config.seed)
+        self.app = self._create_app()
+
+    def reset(self) -> None:
+        self.requests.clear()
+
+    def _tokens(self, messages: List[Dict[str, Any]]) -> List[str]:
+        """Deterministic answer tokens for a conversation"""
+        last = str(messages[-1].get("content") or "") if messages else ""
+        rng = random.Random(zlib.crc32(last.encode("utf-8")) ^ self.config.seed)
+        return [rng.choice(WORDS) + " " for _ in range(self.config.completion_tokens)]
+
+    def _rejection(self, request: Request) -> Optional[JSONResponse]:
+        """Auth failure, injected error or rate limit response, if any"""
+        config = self.config
+        if config.api_key and request.headers.get("authorization") != f"Bearer {config.api_key}":
+            return JSONResponse({"error": {"message": "No auth credentials found", "code": 401}}, status_code=401)
+
+        over_capacity = config.max_concurrent_requests is not None and self.in_flight >= config.max_concurrent_requests
+        if over_capacity or (config.rate_limit_rate and self.random.random() < config.rate_limit_rate):
+            self.requests["rate_limited"] += 1
+            return JSONResponse(
+                {"error": {"message": "Rate limit exceeded", "code": 429}},
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)}
+            )
+
+        if config.error_rate and self.random.random() < config.error_rate:
+            self.requests["error"] += 1
+            return JSONResponse(
+                {"error": {"message": "Injected upstream error", "code": config.error_status}},
+                status_code=config.error_status
+            )
+        return None
+
+    async def _pace(self, start: float, index: int, ttft: float) -> None:
+        """Sleep until token ``index`` is due, so the rate holds regardless of sleep granularity"""
+        due = start + ttft + index / self.config.tokens_per_second
+        delay = due - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI(title="Fake OpenRouter")
+
+        @app.get("/api/v1/models")
+        async def list_models():
+            return {"data": [{"id": "fake/model", "name": "Fake model", "context_length": 128000}]}
+
+        @app.post("/api/v1/chat/completions")
+        async def chat_completions(request: Request):
+            rejection = self._rejection(request)
+            if rejection:
+                return rejection
+
+            payload = await request.json()
+            model = payload.get("model", "fake/model")
+            messages = payload.get("messages") or []
+            tokens = self._tokens(messages)
+            usage = {
+                "prompt_tokens": _count_tokens(messages),
+                "completion_tokens": len(tokens),
+                "total_tokens": _count_tokens(messages) + len(tokens)
+            }
+            completion_id = f"gen-{uuid.uuid4().hex}"
+            created = int(time.time())
+            ttft = self.config.ttft + self.random.uniform(0, self.config.ttft_jitter)
+            start = time.perf_counter()
+
+            if not payload.get("stream"):
+                self.in_flight += 1
+                try:
+                    await self._pace(start, len(tokens), ttft)
+                finally:
+                    self.in_flight -= 1
+                self.requests["ok"] += 1
+                return {
+                    "id": completion_id,
+                    "object": "chat.completion",
+                    "created": created,
+                    "model": model,
+                    "choices": [{
+                        "index": 0,
+                        "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                        "finish_reason": "stop"
+                    }],
+                    "usage": usage
+                }
+
+            fail_at = None
+            if self.config.stream_error_rate and self.random.random() < self.config.stream_error_rate:
+                fail_at = len(tokens) // 2
+
+            def chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None, **extra: Any) -> str:
+                body = {
+                    "id": completion_id,
+                    "object": "chat.completion.chunk",
+                    "created": created,
+                    "model": model,
+                    "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                    **extra
+                }
+                return f"data: {json.dumps(body)}\n\n"
+
+            async def events() -> AsyncIterator[str]:
+                self.in_flight += 1
+                try:
+                    # OpenRouter sends comments while the model is warming up
+                    yield ": OPENROUTER PROCESSING\n\n"
+                    for i, token in enumerate(tokens):
+                        if i == fail_at:
+                            self.requests["stream_error"] += 1
+                            error = {"error": {"message": "Injected stream error", "code": 502}}
+                            yield f"data: {json.dumps(error)}\n\n"
+                            return
+                        await self._pace(start, i, ttft)
+                        delta = {"role": "assistant", "content": token} if i == 0 else {"content": token}
+                        yield chunk(delta)
+                    yield chunk({}, "stop", usage=usage)
+                    yield "data: [DONE]\n\n"
+                    self.requests["ok"] += 1
+                finally:
+                    self.in_flight -= 1
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return app
+
+
+class FakeOpenRouterServer(BackgroundServer):
+    """Serves a ``FakeOpenRouter`` from a background thread"""
+
+    def __init__(self, config: Optional[FakeOpenRouterConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.fake = FakeOpenRouter(config)
+        super().__init__(self.fake.app, host=host, port=port, name="fake-openrouter")
+
+    @property
+    def config(self) -> FakeOpenRouterConfig:
+        return self.fake.config
+
+    @property
+    def base_url(self) -> str:
+        """Value for ``OPENROUTER_BASE_URL``"""
+        return f"{self.url}/api/v1"
+
+    def attach(self, service) -> None:
+        """Point an ``OpenRouterService`` at this server"""
+        service.base_url = self.base_url
+        service.api_key = self.config.api_key or "fake-openrouter-key"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake OpenRouter server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9381)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0)
+    parser.add_argument("--completion-tokens", type=int, default=100)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--max-concurrent-requests", type=int, default=None)
+    args = parser.parse_args()
+
+    fake = FakeOpenRouter(FakeOpenRouterConfig(
+        ttft=args.ttft,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        max_concurrent_requests=args.max_concurrent_requests,
+    ))
+    uvicorn.run(fake.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
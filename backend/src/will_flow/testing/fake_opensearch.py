@@ -0,0 +1,474 @@
+"""In-memory stand-in for the OpenSearch client.
+
+Implements the client methods the services call (``index``, ``get``,
+``mget``, ``update``, ``delete``, ``search``, ``count``, ``bulk`` and
+``indices.exists/create``) on plain dictionaries, with the query clauses the
+services build: ``match_all``, ``term``, ``terms``, ``ids``, ``range``,
+``exists``, ``match``, ``multi_match``, ``nested`` and ``bool``. Every hit
+scores 1.0 and highlights and inner hits are left out, so rankings are not
+meaningful; everything else round-trips like the real thing, including the
+painless scripts the services send, which are re-implemented in Python.
+
+Documents are stored as JSON, so datetimes come back as ISO strings just as
+they do from OpenSearch. Calls take ``latency`` seconds of blocking time,
+like the synchronous client they replace.
+
+Swap it in for every service with ``attach()``::
+
+    fake = FakeOpenSearch(FakeOpenSearchConfig(latency=0.002))
+    fake.attach()
+"""
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import date, datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from opensearchpy.exceptions import NotFoundError, RequestError
+from pydantic import BaseModel
+
+
+class FakeOpenSearchConfig(BaseModel):
+    """Behaviour of the fake OpenSearch client"""
+    latency: float = 0.0  # Seconds every call blocks for
+    jitter: float = 0.0  # Up to this many extra seconds, uniformly distributed
+    seed: int = 0
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _copy(value: Any) -> Any:
+    """Serialise like the real client does, which also copies"""
+    return json.loads(json.dumps(value, default=_json_default))
+
+
+def _field_values(source: Any, field: str) -> List[Any]:
+    """All values at a dotted path, flattening lists along the way"""
+    values = [source]
+    for part in field.split("."):
+        found = []
+        for value in values:
+            if isinstance(value, dict) and part in value:
+                found.append(value[part])
+        values = []
+        for value in found:
+            values.extend(value if isinstance(value, list) else [value])
+    if not values and field.endswith((".keyword", ".autocomplete")):
+        return _field_values(source, field.rsplit(".", 1)[0])
+    return values
+
+
+def _tokens(text: Any) -> List[str]:
+    return re.findall(r"\w+", str(text).lower())
+
+
+def _clause(body: Any, key: str = "query") -> Tuple[str, Any]:
+    """Field and options of a single-field clause like ``{"name": {"query": ...}}``"""
+    field, options = next(iter(body.items()))
+    if isinstance(options, dict):
+        return field, options
+    return field, {key: options}
+
+
+# Painless scripts the services send, keyed by a fragment of their source
+def _add_message(source: Dict[str, Any], params: Dict[str, Any]) -> None:
+    source.setdefault("messages", []).append(params["message"])
+    source["updated_at"] = params["updated_at"]
+
+
+def _add_documents(source: Dict[str, Any], params: Dict[str, Any]) -> None:
+    documents = [doc for doc in source.get("documents") or [] if doc.get("doc_id") not in params["remove_doc_ids"]]
+    source["documents"] = documents + params["documents"]
+    source["updated_at"] = params["updated_at"]
+
+
+def _update_statuses(source: Dict[str, Any], params: Dict[str, Any]) -> None:
+    for doc in source.get("documents") or []:
+        if doc.get("doc_id") in params["statuses"]:
+            doc["status"] = params["statuses"][doc["doc_id"]]
+    source["updated_at"] = params["updated_at"]
+
+
+def _thread_summary(source: Dict[str, Any], params: Dict[str, Any]) -> None:
+    if params.get("title") is not None and source.get("title") == params["default_title"]:
+        source["title"] = params["title"]
+    if params.get("summary") is not None:
+        source["summary"] = params["summary"]
+        source["summary_message_count"] = params["summary_message_count"]
+
+
+SCRIPTS: List[Tuple[str, Callable[[Dict[str, Any], Dict[str, Any]], None]]] = [
+    ("messages.add(params.message)", _add_message),
+    ("documents.addAll(params.documents)", _add_documents),
+    ("params.statuses.containsKey", _update_statuses),
+    ("params.default_title", _thread_summary),
+]
+
+
+class FakeIndices:
+    def __init__(self, fake: "FakeOpenSearch"):
+        self.fake = fake
+
+    def exists(self, index: str, **kwargs: Any) -> bool:
+        return index in self.fake.indices_created
+
+    def create(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        self.fake.indices_created[index] = body or {}
+        self.fake.docs.setdefault(index, {})
+        return {"acknowledged": True, "index": index}
+
+    def put_mapping(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return {"acknowledged": True}
+
+    def refresh(self, *args: Any, **kwargs: Any) -> Dict[str, Any]:
+        return {}
+
+
+class FakeOpenSearch:
+    """In-memory OpenSearch client; thread safe, as calls arrive via ``asyncio.to_thread``"""
+
+    def __init__(self, config: Optional[FakeOpenSearchConfig] = None):
+        self.config = config or FakeOpenSearchConfig()
+        self.docs: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.indices_created: Dict[str, Dict[str, Any]] = {}
+        self.indices = FakeIndices(self)
+        self.requests: Counter = Counter()  # Keyed by method
+        self.random = random.Random(self.config.seed)
+        self.lock = threading.RLock()
+
+    def reset(self) -> None:
+        """Drop all documents and request counts, keeping the indices"""
+        from will_flow.core.cache import shared_cache
+
+        with self.lock:
+            for index in self.docs:
+                self.docs[index] = {}
+            self.requests.clear()
+        # Cached flows and knowledge bases would outlive the documents
+        shared_cache.reset()
+
+    def attach(self) -> None:
+        """Point every service at this client instead of the configured cluster"""
+        from will_flow.core.cache import shared_cache
+        from will_flow.db.opensearch import initialize_indices, opensearch_client
+        from will_flow.services.kb_service import kb_service
+
+        opensearch_client.use(self)
+        kb_service.client.use(self)
+        shared_cache.reset()
+        initialize_indices(self)
+        kb_service._create_index_if_not_exists()
+
+    def _call(self, method: str) -> None:
+        self.requests[method] += 1
+        delay = self.config.latency
+        if self.config.jitter:
+            delay += self.random.uniform(0, self.config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _index(self, index: str) -> Dict[str, Dict[str, Any]]:
+        return self.docs.setdefault(index, {})
+
+    def _not_found(self, index: str, doc_id: str) -> NotFoundError:
+        return NotFoundError(404, "document_missing_exception", {"_index": index, "_id": doc_id, "found": False})
+
+    # Documents
+
+    def index(self, index: str, body: Dict[str, Any], id: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        self._call("index")
+        doc_id = id or uuid.uuid4().hex[:20]
+        with self.lock:
+            docs = self._index(index)
+            result = "updated" if doc_id in docs else "created"
+            docs[doc_id] = _copy(body)
+        return {"_index": index, "_id": doc_id, "result": result}
+
+    def get(self, index: str, id: str, **kwargs: Any) -> Dict[str, Any]:
+        self._call("get")
+        with self.lock:
+            source = self._index(index).get(id)
+            if source is None:
+                raise self._not_found(index, id)
+            return {"_index": index, "_id": id, "found": True, "_source": _copy(source)}
+
+    def mget(self, body: Dict[str, Any], index: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        self._call("mget")
+        includes = kwargs.get("_source_includes")
+        refs = [(index, doc_id) for doc_id in body.get("ids", [])]
+        refs += [(doc.get("_index", index), doc["_id"]) for doc in body.get("docs", [])]
+        docs = []
+        with self.lock:
+            for doc_index, doc_id in refs:
+                source = self._index(doc_index).get(doc_id)
+                if source is None:
+                    docs.append({"_index": doc_index, "_id": doc_id, "found": False})
+                else:
+                    docs.append({
+                        "_index": doc_index, "_id": doc_id, "found": True,
+                        "_source": self._project(source, includes)
+                    })
+        return {"docs": docs}
+
+    def _apply_update(self, index: str, doc_id: str, body: Dict[str, Any]) -> Dict[str, Any]:
+        body = _copy(body)
+        docs = self._index(index)
+        source = docs.get(doc_id)
+        if source is None:
+            if "upsert" in body:
+                docs[doc_id] = body["upsert"]
+                return {"_index": index, "_id": doc_id, "result": "created"}
+            if body.get("doc_as_upsert"):
+                docs[doc_id] = body["doc"]
+                return {"_index": index, "_id": doc_id, "result": "created"}
+            raise self._not_found(index, doc_id)
+
+        if "doc" in body:
+            _merge(source, body["doc"])
+        elif "script" in body:
+            script = body["script"]
+            script_source = script["source"] if isinstance(script, dict) else script
+            for fragment, apply in SCRIPTS:
+                if fragment in script_source:
+                    apply(source, script.get("params", {}))
+                    break
+            else:
+                raise RequestError(400, "illegal_argument_exception", f"Script not supported by the fake: {script_source}")
+        return {"_index": index, "_id": doc_id, "result": "updated"}
+
+    def update(self, index: str, id: str, body: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        self._call("update")
+        with self.lock:
+            return self._apply_update(index, id, body)
+
+    def delete(self, index: str, id: str, **kwargs: Any) -> Dict[str, Any]:
+        self._call("delete")
+        with self.lock:
+            if self._index(index).pop(id, None) is None:
+                raise self._not_found(index, id)
+        return {"_index": index, "_id": id, "result": "deleted"}
+
+    def bulk(self, body: Iterable[Any], index: Optional[str] = None, **kwargs: Any) -> Dict[str, Any]:
+        self._call("bulk")
+        lines = [json.loads(line) if isinstance(line, str) else line for line in body]
+        items = []
+        errors = False
+        with self.lock:
+            i = 0
+            while i < len(lines):
+                action, meta = next(iter(lines[i].items()))
+                doc_index = meta.get("_index", index)
+                doc_id = meta.get("_id")
+                try:
+                    if action == "delete":
+                        if self._index(doc_index).pop(doc_id, None) is None:
+                            raise self._not_found(doc_index, doc_id)
+                        result = {"_index": doc_index, "_id": doc_id, "result": "deleted", "status": 200}
+                        i += 1
+                    elif action in ("index", "create"):
+                        doc_id = doc_id or uuid.uuid4().hex[:20]
+                        self._index(doc_index)[doc_id] = _copy(lines[i + 1])
+                        result = {"_index": doc_index, "_id": doc_id, "result": "created", "status": 201}
+                        i += 2
+                    else:
+                        result = {**self._apply_update(doc_index, doc_id, lines[i + 1]), "status": 200}
+                        i += 2
+                except (NotFoundError, RequestError) as e:
+                    errors = True
+                    result = {"_index": doc_index, "_id": doc_id, "status": e.status_code, "error": {"type": e.error}}
+                    i += 1 if action == "delete" else 2
+                items.append({action: result})
+        return {"took": 0, "errors": errors, "items": items}
+
+    # Search
+
+    def search(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        self._call("search")
+        body = body or {}
+        size = body.get("size", kwargs.get("size", 10))
+        offset = body.get("from", kwargs.get("from_", 0))
+        sort = body.get("sort", [])
+        with self.lock:
+            hits = [
+                (doc_id, source) for doc_id, source in self._index(index).items()
+                if _matches(body.get("query", {"match_all": {}}), source, doc_id)
+            ]
+            hits = _sorted(hits, sort)
+            if "search_after" in body:
+                after = body["search_after"]
+                hits = [hit for hit in hits if _after(_sort_values(hit, sort), after, sort)]
+            total = len(hits)
+            page = hits[offset:offset + size]
+            return {
+                "took": 0,
+                "timed_out": False,
+                "hits": {
+                    "total": {"value": total, "relation": "eq"},
+                    "max_score": 1.0 if page else None,
+                    "hits": [
+                        {
+                            "_index": index,
+                            "_id": doc_id,
+                            "_score": 1.0,
+                            "_source": self._project(source, body.get("_source")),
+                            "sort": _sort_values((doc_id, source), sort)
+                        }
+                        for doc_id, source in page
+                    ]
+                }
+            }
+
+    def count(self, index: str, body: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        self._call("count")
+        query = (body or {}).get("query", {"match_all": {}})
+        with self.lock:
+            return {"count": sum(1 for doc_id, source in self._index(index).items() if _matches(query, source, doc_id))}
+
+    @staticmethod
+    def _project(source: Dict[str, Any], fields: Any) -> Dict[str, Any]:
+        if fields is None or fields is True:
+            return _copy(source)
+        if fields is False:
+            return {}
+        if isinstance(fields, dict):
+            fields = fields.get("includes", [])
+        if isinstance(fields, str):
+            fields = [fields]
+        projected: Dict[str, Any] = {}
+        for field in fields:
+            top = field.split(".")[0]
+            if top in source:
+                projected[top] = source[top]
+        return _copy(projected)
+
+
+def _merge(target: Dict[str, Any], changes: Dict[str, Any]) -> None:
+    """Partial document update: objects merge, everything else is replaced"""
+    for key, value in changes.items():
+        if isinstance(value, dict) and isinstance(target.get(key), dict):
+            _merge(target[key], value)
+        else:
+            target[key] = value
+
+
+def _matches(query: Dict[str, Any], source: Dict[str, Any], doc_id: str) -> bool:
+    kind, body = next(iter(query.items()))
+    if kind == "match_all":
+        return True
+    if kind == "ids":
+        return doc_id in body.get("values", [])
+    if kind == "term":
+        field, options = _clause(body, "value")
+        return options["value"] in _field_values(source, field)
+    if kind == "terms":
+        field, values = next((k, v) for k, v in body.items() if k != "boost")
+        return any(value in values for value in _field_values(source, field))
+    if kind == "exists":
+        return bool(_field_values(source, body["field"]))
+    if kind == "range":
+        field, bounds = next(iter(body.items()))
+        checks = {"gt": lambda v, b: v > b, "gte": lambda v, b: v >= b, "lt": lambda v, b: v < b, "lte": lambda v, b: v <= b}
+        return any(
+            all(check(value, bounds[op]) for op, check in checks.items() if op in bounds)
+            for value in _field_values(source, field)
+        )
+    if kind == "match":
+        field, options = _clause(body)
+        return _text_matches(options["query"], _field_values(source, field), options.get("operator", "or"))
+    if kind == "multi_match":
+        prefix = body.get("type") in ("bool_prefix", "phrase_prefix")
+        fields = [field.split("^")[0] for field in body.get("fields", [])]
+        return any(
+            _text_matches(body["query"], _field_values(source, field), body.get("operator", "or"), prefix)
+            for field in fields
+        )
+    if kind == "nested":
+        path = body["path"]
+        return any(
+            isinstance(item, dict) and _matches(body["query"], {path: item}, doc_id)
+            for item in _field_values(source, path)
+        )
+    if kind == "bool":
+        def clauses(name: str) -> List[Dict[str, Any]]:
+            value = body.get(name, [])
+            return value if isinstance(value, list) else [value]
+
+        if not all(_matches(q, source, doc_id) for q in clauses("must") + clauses("filter")):
+            return False
+        if any(_matches(q, source, doc_id) for q in clauses("must_not")):
+            return False
+        should = clauses("should")
+        required = body.get("minimum_should_match", 0 if clauses("must") or clauses("filter") else 1)
+        return not should or sum(_matches(q, source, doc_id) for q in should) >= min(int(required), len(should))
+    raise RequestError(400, "parsing_exception", f"Query not supported by the fake: {kind}")
+
+
+def _text_matches(query: str, values: List[Any], operator: str, prefix: bool = False) -> bool:
+    terms = _tokens(query)
+    if not terms:
+        return False
+    words = set()
+    for value in values:
+        words.update(_tokens(value))
+
+    def found(term: str, last: bool) -> bool:
+        if prefix and last:
+            return any(word.startswith(term) for word in words)
+        return term in words
+
+    hits = [found(term, i == len(terms) - 1) for i, term in enumerate(terms)]
+    return all(hits) if operator.lower() == "and" else any(hits)
+
+
+def _sort_spec(sort: List[Any]) -> List[Tuple[str, bool]]:
+    spec = []
+    for item in sort:
+        if isinstance(item, str):
+            spec.append((item, item == "_score"))
+        else:
+            field, options = next(iter(item.items()))
+            order = options.get("order", "asc") if isinstance(options, dict) else options
+            spec.append((field, order == "desc"))
+    return spec
+
+
+def _sort_values(hit: Tuple[str, Dict[str, Any]], sort: List[Any]) -> List[Any]:
+    doc_id, source = hit
+    values = []
+    for field, _ in _sort_spec(sort):
+        if field == "_score":
+            values.append(1.0)
+        elif field == "_id":
+            values.append(doc_id)
+        else:
+            found = _field_values(source, field)
+            values.append(found[0] if found else None)
+    return values
+
+
+def _sorted(hits: List[Tuple[str, Dict[str, Any]]], sort: List[Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    # Stable sorts from the last key to the first; missing values go last
+    for position, (field, descending) in reversed(list(enumerate(_sort_spec(sort)))):
+        present = [hit for hit in hits if _sort_values(hit, sort)[position] is not None]
+        missing = [hit for hit in hits if _sort_values(hit, sort)[position] is None]
+        present.sort(key=lambda hit: _sort_values(hit, sort)[position], reverse=descending)
+        hits = present + missing
+    return hits
+
+
+def _after(values: List[Any], after: List[Any], sort: List[Any]) -> bool:
+    for value, bound, (_, descending) in zip(values, after, _sort_spec(sort)):
+        if value == bound:
+            continue
+        if value is None or bound is None:
+            return bound is not None
+        return value < bound if descending else value > bound
+    return False
@@ -0,0 +1,358 @@
+"""In-process stand-in for the RAGFlow HTTP API.
+
+Implements the parts of ``/api/v1`` that ``RAGFlowService`` and the RAGFlow SDK
+use: datasets, document upload/list/delete/parse, document status and
+retrieval. Latency, error rates and payload sizes are configurable and can be
+changed while the server is running.
+
+In pytest::
+
+    @pytest.fixture
+    def fake_ragflow():
+        with FakeRAGFlowServer(FakeRAGFlowConfig(latency=0.01)) as server:
+            server.attach(ragflow_service)
+            yield server
+
+For load tests, run it standalone and point ``RAGFLOW_API_URL`` at it::
+
+    python -m will_flow.testing.fake_ragflow --port 9380 --latency 0.05
+"""
+import argparse
+import asyncio
+import random
+import time
+import uuid
+import zlib
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, Field
+
+from will_flow.testing.server import BackgroundServer
+
+WORDS = (
+    "system data model index query document policy service request response "
+    "cluster network storage memory latency throughput user account security "
+    "config deploy release version report metric event process thread cache"
+).split()
+
+
+class FakeRAGFlowConfig(BaseModel):
+    """Behaviour of the fake RAGFlow server"""
+    api_key: Optional[str] = None  # Require this bearer token when set
+    latency: float = 0.0  # Seconds added to every request
+    jitter: float = 0.0  # Up to this many extra seconds, uniformly distributed
+    endpoint_latency: Dict[str, float] = Field(default_factory=dict)  # Overrides ``latency`` per endpoint
+    error_rate: float = 0.0  # Fraction of requests answered with ``error_status``
+    endpoint_error_rate: Dict[str, float] = Field(default_factory=dict)  # Overrides ``error_rate`` per endpoint
+    error_status: int = 500
+    auto_parse: bool = True  # Start parsing documents as soon as they are uploaded
+    parse_seconds: float = 1.0  # Time a document takes to go from RUNNING to DONE
+    parse_failure_rate: float = 0.0  # Fraction of parsed documents that end up FAIL
+    chunks_per_retrieval: int = 10
+    chunk_chars: int = 500
+    chunks_per_document: int = 10
+    seed: int = 0
+
+
+class FakeRAGFlow:
+    """State and routes of the fake RAGFlow API
+
+    Endpoints are grouped under the same names as ``RAGFlowService``'s circuit
+    breakers (``retrieval``, ``upload``, ``status``, ``list``) plus ``datasets``
+    and ``parse``, and those names key ``endpoint_latency``,
+    ``endpoint_error_rate`` and the ``requests`` counter.
+    """
+
+    def __init__(self, config: Optional[FakeRAGFlowConfig] = None):
+        self.config = config or FakeRAGFlowConfig()
+        self.datasets: Dict[str, Dict[str, Any]] = {}
+        self.documents: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.requests: Counter = Counter()
+        self.random = random.Random(self.config.seed)
+        self.app = self._create_app()
+
+    def reset(self) -> None:
+        """Drop all datasets, documents and request counts"""
+        self.datasets.clear()
+        self.documents.clear()
+        self.requests.clear()
+
+    async def _enter(self, endpoint: str, request: Request) -> Optional[JSONResponse]:
+        """Apply latency, auth and error injection; returns a response to short-circuit with"""
+        self.requests[endpoint] += 1
+        config = self.config
+        delay = config.endpoint_latency.get(endpoint, config.latency)
+        if config.jitter:
+            delay += self.random.uniform(0, config.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if config.api_key and request.headers.get("authorization") != f"Bearer {config.api_key}":
+            return JSONResponse({"code": 109, "message": "Authentication error: API key is invalid!"})
+
+        error_rate = config.endpoint_error_rate.get(endpoint, config.error_rate)
+        if error_rate and self.random.random() < error_rate:
+            return JSONResponse(
+                {"code": 100, "message": f"Injected {endpoint} error"},
+                status_code=config.error_status
+            )
+        return None
+
+    def _document_view(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Document as returned by the API, advancing its parse state first"""
+        started = doc.get("process_begin_at")
+        if doc["run"] == "RUNNING" and started is not None:
+            elapsed = time.time() - started
+            if elapsed >= self.config.parse_seconds:
+                failed = self.random.random() < self.config.parse_failure_rate
+                doc["run"] = "FAIL" if failed else "DONE"
+                doc["progress"] = 1.0
+                doc["chunk_count"] = 0 if failed else self.config.chunks_per_document
+                doc["process_duration"] = self.config.parse_seconds
+            else:
+                doc["progress"] = round(elapsed / max(self.config.parse_seconds, 1e-9), 2)
+        return {key: value for key, value in doc.items() if key != "process_begin_at"}
+
+    def _start_parsing(self, doc: Dict[str, Any]) -> None:
+        doc["run"] = "RUNNING"
+        doc["progress"] = 0.0
+        doc["process_begin_at"] = time.time()
+
+    def _chunk_text(self, rng: random.Random, terms: List[str]) -> str:
+        words = []
+        length = 0
+        while length < self.config.chunk_chars:
+            word = rng.choice(terms) if terms and rng.random() < 0.1 else rng.choice(WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return " ".join(words)[:self.config.chunk_chars]
+
+    def _retrieve(self, question: str, dataset_ids: List[str], top_k: int, threshold: float) -> List[Dict[str, Any]]:
+        """Deterministic synthetic chunks for a question"""
+        rng = random.Random(zlib.crc32(question.encode("utf-8")) ^ self.config.seed)
+        terms = [term for term in question.lower().split() if len(term) > 2]
+        sources = [
+            (kb_id, doc)
+            for kb_id in dataset_ids
+            for doc in self.documents.get(kb_id, {}).values()
+        ] or [(kb_id, None) for kb_id in dataset_ids]
+
+        chunks = []
+        for i in range(min(top_k, self.config.chunks_per_retrieval)):
+            kb_id, doc = sources[i % len(sources)]
+            similarity = round(0.9 - i * (0.6 / max(self.config.chunks_per_retrieval, 1)), 4)
+            if similarity < threshold:
+                break
+            content = self._chunk_text(rng, terms)
+            chunks.append({
+                "id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                "content": content,
+                "content_ltks": content,
+                "document_id": doc["id"] if doc else f"doc-{i}",
+                "document_keyword": doc["name"] if doc else f"document-{i}.txt",
+                "highlight": content,
+                "image_id": "",
+                "important_keywords": [],
+                "kb_id": kb_id,
+                "positions": [],
+                "similarity": similarity,
+                "term_similarity": similarity,
+                "vector_similarity": similarity
+            })
+        return chunks
+
+    def _create_app(self) -> FastAPI:
+        app = FastAPI(title="Fake RAGFlow")
+
+        def ok(data: Any = None) -> JSONResponse:
+            return JSONResponse({"code": 0, "data": data})
+
+        def not_found(message: str) -> JSONResponse:
+            return JSONResponse({"code": 102, "message": message})
+
+        @app.get("/api/v1")
+        async def root(request: Request):
+            return ok({"name": "fake-ragflow"})
+
+        @app.post("/api/v1/datasets")
+        async def create_dataset(request: Request):
+            if error := await self._enter("datasets", request):
+                return error
+            payload = await request.json()
+            dataset_id = uuid.uuid4().hex
+            self.datasets[dataset_id] = {
+                "id": dataset_id,
+                "name": payload.get("name", ""),
+                "description": payload.get("description") or "",
+                "chunk_method": "naive",
+                "create_time": int(time.time() * 1000),
+                "document_count": 0,
+                "chunk_count": 0,
+            }
+            self.documents[dataset_id] = {}
+            return ok(self.datasets[dataset_id])
+
+        @app.get("/api/v1/datasets")
+        async def list_datasets(request: Request, id: Optional[str] = None, name: Optional[str] = None,
+                                page: int = 1, page_size: int = 30):
+            if error := await self._enter("list", request):
+                return error
+            datasets = [
+                {**dataset, "document_count": len(self.documents[dataset["id"]])}
+                for dataset in self.datasets.values()
+                if (id is None or dataset["id"] == id) and (name is None or dataset["name"] == name)
+            ]
+            if id and not datasets:
+                return not_found(f"You don't own the dataset {id}")
+            return ok(datasets[(page - 1) * page_size:page * page_size])
+
+        @app.delete("/api/v1/datasets")
+        async def delete_datasets(request: Request):
+            if error := await self._enter("datasets", request):
+                return error
+            payload = await request.json()
+            for dataset_id in payload.get("ids") or list(self.datasets):
+                self.datasets.pop(dataset_id, None)
+                self.documents.pop(dataset_id, None)
+            return ok()
+
+        @app.post("/api/v1/datasets/{dataset_id}/documents")
+        async def upload_documents(dataset_id: str, request: Request):
+            if error := await self._enter("upload", request):
+                return error
+            if dataset_id not in self.datasets:
+                return not_found(f"You don't own the dataset {dataset_id}")
+            form = await request.form()
+            uploaded = []
+            for file in form.getlist("file"):
+                content = await file.read()
+                doc = {
+                    "id": uuid.uuid4().hex,
+                    "name": file.filename,
+                    "dataset_id": dataset_id,
+                    "location": file.filename,
+                    "size": len(content),
+                    "type": (file.filename or "").rsplit(".", 1)[-1],
+                    "chunk_method": "naive",
+                    "run": "UNSTART",
+                    "progress": 0.0,
+                    "chunk_count": 0,
+                    "token_count": 0,
+                    "create_time": int(time.time() * 1000),
+                }
+                if self.config.auto_parse:
+                    self._start_parsing(doc)
+                self.documents[dataset_id][doc["id"]] = doc
+                uploaded.append(self._document_view(doc))
+            return ok(uploaded)
+
+        @app.get("/api/v1/datasets/{dataset_id}/documents")
+        async def list_documents(request: Request, dataset_id: str, id: Optional[str] = None,
+                                 name: Optional[str] = None, page: int = 1, page_size: int = 30):
+            if error := await self._enter("list", request):
+                return error
+            if dataset_id not in self.datasets:
+                return not_found(f"You don't own the dataset {dataset_id}")
+            docs = [
+                self._document_view(doc)
+                for doc in self.documents[dataset_id].values()
+                if (id is None or doc["id"] == id) and (name is None or doc["name"] == name)
+            ]
+            return ok({"docs": docs[(page - 1) * page_size:page * page_size], "total": len(docs)})
+
+        @app.get("/api/v1/datasets/{dataset_id}/documents/{document_id}")
+        async def get_document(dataset_id: str, document_id: str, request: Request):
+            if error := await self._enter("status", request):
+                return error
+            doc = self.documents.get(dataset_id, {}).get(document_id)
+            if doc is None:
+                return JSONResponse({"code": 102, "message": f"The dataset not own the document {document_id}"},
+                                    status_code=404)
+            return ok(self._document_view(doc))
+
+        @app.delete("/api/v1/datasets/{dataset_id}/documents")
+        async def delete_documents(dataset_id: str, request: Request):
+            if error := await self._enter("upload", request):
+                return error
+            payload = await request.json()
+            docs = self.documents.get(dataset_id, {})
+            for doc_id in payload.get("ids") or list(docs):
+                docs.pop(doc_id, None)
+            return ok()
+
+        @app.post("/api/v1/datasets/{dataset_id}/chunks")
+        async def parse_documents(dataset_id: str, request: Request):
+            if error := await self._enter("parse", request):
+                return error
+            payload = await request.json()
+            docs = self.documents.get(dataset_id, {})
+            for doc_id in payload.get("document_ids", []):
+                if doc_id in docs:
+                    self._start_parsing(docs[doc_id])
+            return ok()
+
+        @app.post("/api/v1/retrieval")
+        async def retrieval(request: Request):
+            if error := await self._enter("retrieval", request):
+                return error
+            payload = await request.json()
+            chunks = self._retrieve(
+                payload.get("question", ""),
+                payload.get("dataset_ids") or [],
+                int(payload.get("top_k") or 1024),
+                float(payload.get("similarity_threshold") or 0.0)
+            )
+            return ok({"chunks": chunks, "doc_aggs": [], "total": len(chunks)})
+
+        return app
+
+
+class FakeRAGFlowServer(BackgroundServer):
+    """Serves a ``FakeRAGFlow`` from a background thread
+
+    Both the httpx calls and the synchronous SDK in ``RAGFlowService`` can
+    reach it.
+    """
+
+    def __init__(self, config: Optional[FakeRAGFlowConfig] = None, host: str = "127.0.0.1", port: int = 0):
+        self.fake = FakeRAGFlow(config)
+        super().__init__(self.fake.app, host=host, port=port, name="fake-ragflow")
+
+    @property
+    def config(self) -> FakeRAGFlowConfig:
+        return self.fake.config
+
+    def attach(self, service) -> None:
+        """Point a ``RAGFlowService`` at this server"""
+        service.connect(self.url, self.config.api_key or "fake-ragflow-key")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a fake RAGFlow server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9380)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--parse-seconds", type=float, default=1.0)
+    parser.add_argument("--chunk-chars", type=int, default=500)
+    parser.add_argument("--chunks-per-retrieval", type=int, default=10)
+    args = parser.parse_args()
+
+    fake = FakeRAGFlow(FakeRAGFlowConfig(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_rate=args.error_rate,
+        parse_seconds=args.parse_seconds,
+        chunk_chars=args.chunk_chars,
+        chunks_per_retrieval=args.chunks_per_retrieval,
+    ))
+    uvicorn.run(fake.app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import pytest
+
+from will_flow.services.ragflow_service import RAGFlowService
+from will_flow.testing import FakeRAGFlowConfig, FakeRAGFlowServer
+
+
+@pytest.fixture
+def fake_ragflow():
+    """A fake RAGFlow server, empty at the start of each test"""
+    with FakeRAGFlowServer(FakeRAGFlowConfig(parse_seconds=0.05)) as server:
+        yield server
+
+
+@pytest.fixture
+def ragflow(fake_ragflow) -> RAGFlowService:
+    """A RAGFlowService of its own, talking to ``fake_ragflow``"""
+    service = RAGFlowService()
+    fake_ragflow.attach(service)
+    return service
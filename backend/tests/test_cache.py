@@ -0,0 +1,35 @@
+import asyncio
+
+import pytest
+
+from will_flow.core.cache import CacheBackend, MemoryBackend, NullBackend, SharedCache, create_backend
+from will_flow.core.config import settings
+
+
+def test_backend_is_abstract():
+    with pytest.raises(TypeError):
+        CacheBackend()
+
+
+def test_fill_after_invalidation_is_refused():
+    async def scenario():
+        cache = SharedCache(MemoryBackend(100))
+        [generation] = await cache.generations("flow", ["f1"])
+        # The value is read from the index, then updated and invalidated before it is cached
+        await cache.invalidate("flow", ["f1"])
+        await cache.set("flow", "f1", b"stale", 60, generation)
+        assert await cache.get("flow", "f1") is None
+
+        [generation] = await cache.generations("flow", ["f1"])
+        await cache.set("flow", "f1", b"fresh", 60, generation)
+        assert await cache.get("flow", "f1") == b"fresh"
+
+    asyncio.run(scenario())
+
+
+def test_default_backend_depends_on_worker_count(monkeypatch):
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 1)
+    assert isinstance(create_backend(None), MemoryBackend)
+    monkeypatch.setattr(settings, "WEB_CONCURRENCY", 4)
+    assert isinstance(create_backend(None), NullBackend)
+    assert isinstance(create_backend("memory"), MemoryBackend)
@@ -0,0 +1,22 @@
+import pytest
+
+from will_flow.services.chat_service import decode_cursor, encode_cursor
+
+
+def test_cursor_round_trip():
+    sort_values = [3.25, "2024-05-01T12:00:00", "session-1"]
+    cursor = encode_cursor(sort_values)
+    assert isinstance(cursor, str)
+    assert decode_cursor(cursor) == sort_values
+
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor(["???>>>", 1])
+    assert set(cursor) <= set("ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=")
+
+
+# Not base64, not JSON, not a list
+@pytest.mark.parametrize("cursor", ["not a cursor", "bm90IGpzb24=", "eyJhIjogMX0="])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
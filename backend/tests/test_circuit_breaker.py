@@ -0,0 +1,160 @@
+import asyncio
+
+import pytest
+
+from will_flow.models.knowledge_base import KnowledgeBaseCreate
+from will_flow.services import circuit_breaker
+from will_flow.services.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(circuit_breaker.time, "monotonic", clock)
+    return clock
+
+
+def fail(breaker: CircuitBreaker, times: int) -> None:
+    for _ in range(times):
+        breaker.before_call()
+        breaker.record_failure()
+
+
+def test_opens_after_consecutive_failures(clock):
+    breaker = CircuitBreaker("test", failure_threshold=3, recovery_timeout=30.0)
+    fail(breaker, 2)
+    breaker.before_call()
+    breaker.record_success(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.consecutive_failures == 0
+
+    fail(breaker, 3)
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    assert breaker.rejected_calls == 1
+
+
+def test_half_open_probe_closes_on_success(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30.0)
+    fail(breaker, 1)
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    clock.now += 1
+    breaker.before_call()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_half_open_probe_reopens_on_failure(clock):
+    breaker = CircuitBreaker("test", failure_threshold=5, recovery_timeout=30.0)
+    fail(breaker, 5)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.opened_at == clock.now
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_cancelled_probe_is_not_an_outcome(clock):
+    breaker = CircuitBreaker("test", failure_threshold=1, recovery_timeout=30.0)
+    fail(breaker, 1)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record_cancelled()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    assert breaker.total_failures == 1
+    # The next call probes instead
+    breaker.before_call()
+    breaker.record_success(0.01)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_latency_percentile():
+    breaker = CircuitBreaker("test")
+    assert breaker.latency_percentile(50) is None
+    for latency in range(1, 101):
+        breaker.record_success(latency / 1000)
+    assert breaker.latency_percentile(50) == pytest.approx(0.051)
+    assert breaker.latency_percentile(100) == pytest.approx(0.1)
+
+
+def test_sdk_and_fallback_failure_count_once(fake_ragflow, ragflow):
+    async def run():
+        kb = await ragflow.create_knowledge_base("user@example.com", KnowledgeBaseCreate(name="Breakers"))
+        fake_ragflow.config.error_rate = 1.0
+        for _ in range(3):
+            assert await ragflow.get_document_status(kb.id, "missing") == "failed"
+        return ragflow.breakers["status"]
+
+    breaker = asyncio.run(run())
+    assert breaker.total_failures == 3
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancellation_is_not_a_failure(fake_ragflow, ragflow):
+    async def run():
+        fake_ragflow.config.latency = 0.5
+        for _ in range(3):
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(ragflow.retrieve_chunks("kb", "question"), timeout=0.05)
+        return ragflow.breakers["retrieval"]
+
+    breaker = asyncio.run(run())
+    assert breaker.total_calls == 3
+    assert breaker.total_failures == 0
+
+
+
+def test_hedged_cancels_attempts_with_its_caller():
+    started = []
+
+    async def operation():
+        task = asyncio.current_task()
+        started.append(task)
+        await asyncio.sleep(10)
+
+    async def run():
+        caller = asyncio.ensure_future(circuit_breaker.hedged(operation, delay=1.0))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await caller
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert len(started) == 1
+    assert started[0].cancelled()
+
+
+def test_open_circuit_fails_uploads_fast(fake_ragflow, ragflow):
+    async def run():
+        kb = await ragflow.create_knowledge_base("user@example.com", KnowledgeBaseCreate(name="Open"))
+        breaker = ragflow.breakers["upload"]
+        fail(breaker, breaker.failure_threshold)
+        with pytest.raises(CircuitOpenError):
+            await ragflow.upload_document_content(kb.id, "a.txt", "text/plain", b"hello")
+        [result] = await ragflow.upload_documents(kb.id, [("a.txt", "text/plain", b"hello")])
+        return result
+
+    result = asyncio.run(run())
+    assert not result.success
+    assert result.document is None
@@ -0,0 +1,53 @@
+from fastapi import FastAPI, Request
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from will_flow.core.compression import CompressionMiddleware
+from will_flow.core.etag import conditional_response
+
+BODY = "x" * 4096
+
+
+def make_client() -> TestClient:
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware)
+
+    @app.get("/large")
+    async def large(request: Request):
+        return conditional_response(request, '"v1"', lambda: PlainTextResponse(BODY))
+
+    @app.get("/small")
+    async def small(request: Request):
+        return conditional_response(request, '"v1"', lambda: PlainTextResponse("x"))
+
+    return TestClient(app)
+
+
+def test_not_modified_keeps_the_compressed_validator():
+    client = make_client()
+    response = client.get("/large", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == '"v1-gzip"'
+
+    response = client.get("/large", headers={"Accept-Encoding": "gzip", "If-None-Match": '"v1-gzip"'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"v1-gzip"'
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_not_modified_keeps_the_identity_validator():
+    client = make_client()
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"v1"'
+
+    response = client.get("/small", headers={"Accept-Encoding": "gzip", "If-None-Match": '"v1"'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"v1"'
+
+
+def test_compressed_validator_without_that_encoding_is_not_reused():
+    client = make_client()
+    response = client.get("/large", headers={"Accept-Encoding": "identity", "If-None-Match": '"v1-gzip"'})
+    assert response.status_code == 304
+    assert response.headers["etag"] == '"v1"'
@@ -0,0 +1,29 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from will_flow.api.api_v1.endpoints import debug
+from will_flow.core.config import settings
+
+PATHS = ["/debug/traces", "/debug/slow-operations", "/debug/event-loop", "/debug/ragflow-breakers", "/debug/profiles"]
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(debug.router, prefix="/debug")
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_disabled_without_token(client, monkeypatch, path):
+    monkeypatch.setattr(settings, "PROFILING_ADMIN_TOKEN", None)
+    assert client.get(path, headers={"X-Profile-Token": ""}).status_code == 403
+
+
+@pytest.mark.parametrize("path", PATHS)
+def test_requires_token(client, monkeypatch, path):
+    monkeypatch.setattr(settings, "PROFILING_ADMIN_TOKEN", "secret")
+    assert client.get(path).status_code == 403
+    assert client.get(path, headers={"X-Profile-Token": "wrong"}).status_code == 403
+    assert client.get(path, headers={"X-Profile-Token": "secret"}).status_code == 200
@@ -0,0 +1,34 @@
+from will_flow.services.kb_chat_service import merge_chunks
+
+
+def test_merge_keeps_best_copy_of_same_content():
+    merged = merge_chunks([
+        [{"id": "1", "content": "Reset the  password\nfrom settings.", "similarity": 0.6, "kb_id": "a"}],
+        [{"id": "2", "content": "Reset the password from settings.", "similarity": 0.8, "kb_id": "b"}],
+    ])
+    assert [(chunk["id"], chunk["kb_id"]) for chunk in merged] == [("2", "b")]
+
+
+def test_merge_compares_content_before_ids():
+    merged = merge_chunks([
+        [{"id": "1", "content": "first", "similarity": 0.5}],
+        [{"id": "1", "content": "second", "similarity": 0.4}],
+    ])
+    assert [chunk["content"] for chunk in merged] == ["first", "second"]
+
+
+def test_merge_falls_back_to_ids_without_content():
+    merged = merge_chunks([
+        [{"id": "1", "similarity": 0.3}, {"id": "2", "content": "", "similarity": 0.2}],
+        [{"id": "1", "similarity": 0.7}, {"similarity": 0.9}],
+    ])
+    # The chunk with neither content nor ID is dropped
+    assert [(chunk["id"], chunk["similarity"]) for chunk in merged] == [("1", 0.7), ("2", 0.2)]
+
+
+def test_merge_orders_by_similarity():
+    merged = merge_chunks([
+        [{"id": "1", "content": "a", "similarity": 0.2}, {"id": "2", "content": "b", "similarity": 0.9}],
+        [{"id": "3", "content": "c", "similarity": 0.5}],
+    ])
+    assert [chunk["id"] for chunk in merged] == ["2", "3", "1"]
@@ -0,0 +1,46 @@
+from will_flow.services.prompt_builder import estimate_tokens, format_sources, select_chunks, trim_history
+
+
+def test_estimate_tokens():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 40) == 11
+
+
+def test_select_chunks_stops_at_budget():
+    chunks = [{"id": str(i), "content": "x" * 36} for i in range(5)]  # 10 tokens each
+    assert [chunk["id"] for chunk in select_chunks(chunks, 25)] == ["0", "1"]
+    assert [chunk["id"] for chunk in select_chunks(chunks, 50)] == ["0", "1", "2", "3", "4"]
+
+
+def test_select_chunks_skips_empty_content():
+    chunks = [{"id": "0", "content": ""}, {"id": "1", "content": "useful"}]
+    assert [chunk["id"] for chunk in select_chunks(chunks, 10)] == ["1"]
+
+
+def test_select_chunks_truncates_an_oversized_first_chunk():
+    chunks = [{"id": "0", "content": "word " * 100}, {"id": "1", "content": "short"}]
+    selected = select_chunks(chunks, 10)
+    assert [chunk["id"] for chunk in selected] == ["0"]
+    assert selected[0]["content"].endswith("...")
+    assert len(selected[0]["content"]) <= 10 * 4 + 3
+    # The caller's chunk is left alone
+    assert len(chunks[0]["content"]) == 500
+
+
+def test_trim_history_keeps_most_recent_messages():
+    history = [{"role": "user", "content": f"message {i} " + "x" * 30} for i in range(6)]  # 10 tokens each
+    kept = trim_history(history, 35)
+    assert [message["content"][:9] for message in kept] == ["message 3", "message 4", "message 5"]
+    assert trim_history(history, 5) == []
+
+
+def test_format_sources_numbers_chunks():
+    sources, citations = format_sources([
+        {"id": "c1", "content": " First ", "document_keyword": "guide.pdf", "kb_id": "a", "similarity": 0.9},
+        {"id": "c2", "content": "Second", "document_id": "d2"},
+    ])
+    assert sources == "[1] (guide.pdf)\nFirst\n\n[2]\nSecond"
+    assert [(c["index"], c["document_id"], c["document_name"]) for c in citations] == [
+        (1, "c1", "guide.pdf"),
+        (2, "d2", ""),
+    ]
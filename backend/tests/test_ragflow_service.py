@@ -0,0 +1,50 @@
+import asyncio
+import time
+
+from will_flow.models.knowledge_base import KnowledgeBaseCreate
+
+
+async def _create_kb(ragflow) -> str:
+    kb = await ragflow.create_knowledge_base("user@example.com", KnowledgeBaseCreate(name="Manuals"))
+    return kb.id
+
+
+def test_upload_documents(fake_ragflow, ragflow):
+    async def run():
+        kb_id = await _create_kb(ragflow)
+        results = await ragflow.upload_documents(kb_id, [
+            ("guide.txt", "text/plain", b"How to deploy the service"),
+            ("faq.txt", "text/plain", b"Frequently asked questions"),
+        ])
+        assert [result.file_name for result in results] == ["guide.txt", "faq.txt"]
+        assert all(result.success for result in results)
+        doc_ids = {result.document.doc_id for result in results}
+        assert doc_ids == set(fake_ragflow.fake.documents[kb_id])
+
+        # Parsing finishes after parse_seconds
+        deadline = time.monotonic() + 5
+        statuses = await ragflow.list_document_statuses(kb_id)
+        while set(statuses.values()) != {"ready"} and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+            statuses = await ragflow.list_document_statuses(kb_id)
+        assert statuses == {doc_id: "ready" for doc_id in doc_ids}
+
+    asyncio.run(run())
+
+
+def test_retrieve_chunks(fake_ragflow, ragflow):
+    async def run():
+        kb_id = await _create_kb(ragflow)
+        await ragflow.upload_documents(kb_id, [("guide.txt", "text/plain", b"How to deploy the service")])
+
+        chunks = await ragflow.retrieve_chunks(kb_id, "deploy the service", top_k=5, similarity_threshold=0.0)
+        assert len(chunks) == 5
+        assert all(chunk["kb_id"] == kb_id and chunk["content"] for chunk in chunks)
+        similarities = [chunk["similarity"] for chunk in chunks]
+        assert similarities == sorted(similarities, reverse=True)
+
+        # Deterministic for the same question
+        again = await ragflow.retrieve_chunks(kb_id, "deploy the service", top_k=5, similarity_threshold=0.0)
+        assert [chunk["content"] for chunk in again] == [chunk["content"] for chunk in chunks]
+
+    asyncio.run(run())
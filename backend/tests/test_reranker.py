@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from will_flow.services.reranker import bm25_scores, query_terms, rerank_chunks
+
+
+def test_query_terms_drop_stopwords_and_duplicates():
+    assert query_terms("How do I reset the Password, password?") == ["reset", "password"]
+    # A query made only of stopwords keeps them
+    assert query_terms("what is it") == ["what", "is", "it"]
+
+
+def test_bm25_orders_by_term_frequency_and_rarity():
+    texts = [
+        "billing invoices are sent monthly",
+        "reset your password from the login page. password rules apply",
+        "reset the router to factory settings",
+        "the weather is nice",
+    ]
+    scores = bm25_scores("reset password", texts)
+    assert scores[0] == 0 and scores[3] == 0
+    # Both terms beat one term, and the rarer "password" carries more weight
+    assert scores[1] > scores[2] > 0
+
+
+def test_bm25_matches_whole_terms_only():
+    scores = bm25_scores("cat", ["concatenate strings", "the cat sat", "cat, dog"])
+    assert scores[0] == 0
+    assert scores[1] > 0 and scores[2] > 0
+
+
+def test_rerank_blends_bm25_with_similarity():
+    chunks = [
+        {"id": "a", "content": "an unrelated paragraph about billing", "similarity": 0.9},
+        {"id": "b", "content": "reset your password from the login page", "similarity": 0.5},
+        {"id": "c", "content": "", "similarity": 1.0},
+    ]
+    lexical = rerank_chunks("reset password", chunks, lexical_weight=1.0)
+    assert [chunk["id"] for chunk in lexical] == ["b", "a"]
+    assert lexical[0]["rerank_score"] == pytest.approx(1.0)
+
+    semantic = rerank_chunks("reset password", chunks, lexical_weight=0.0)
+    assert [chunk["id"] for chunk in semantic] == ["a", "b"]
+
+
+def test_rerank_cuts_by_score_count_and_tokens():
+    chunks = [
+        {"id": str(i), "content": f"password reset step {i} " + "x" * 40, "similarity": 1.0 - i / 10}
+        for i in range(5)
+    ]
+    assert len(rerank_chunks("password", chunks, top_n=2)) == 2
+    assert [chunk["id"] for chunk in rerank_chunks("password", chunks, lexical_weight=0.0, min_score=0.75)] == ["0", "1", "2"]
+    # Each chunk is about 16 tokens; at least one is always kept
+    assert len(rerank_chunks("password", chunks, max_tokens=40)) == 2
+    assert len(rerank_chunks("password", chunks, max_tokens=1)) == 1
+
+
+def test_mmr_prefers_diverse_chunks():
+    duplicate = "To reset your password open the account settings page and choose reset password."
+    chunks = [
+        {"id": "a", "content": duplicate, "similarity": 0.95},
+        {"id": "b", "content": duplicate + " ", "similarity": 0.94},
+        {"id": "c", "content": "Password resets are rate limited to three per hour for security.", "similarity": 0.8},
+    ]
+    plain = rerank_chunks("reset password", chunks, top_n=2, lexical_weight=0.0)
+    assert [chunk["id"] for chunk in plain] == ["a", "b"]
+
+    diverse = rerank_chunks("reset password", chunks, top_n=2, lexical_weight=0.0, mmr_lambda=0.5)
+    assert [chunk["id"] for chunk in diverse] == ["a", "c"]
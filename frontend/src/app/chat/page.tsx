@@ -238,11 +238,14 @@ export default function ChatPage() {
         user_email: userEmail,
         message: userMessage.content,
         session_id: selectedThread || undefined,
-        new_thread: !selectedThread
+        new_thread: !selectedThread,
+        // Everything in messages came from the server, so its length is the cursor
+        delta: true,
+        cursor: selectedThread ? messages.length : undefined
       });
       
-      // Update messages and session ID
-      setMessages(response.messages);
+      // Replace the optimistic user message with the server's copy of this turn
+      setMessages(prev => [...prev.slice(0, response.offset), ...response.messages]);
       
       if (!selectedThread) {
         setSelectedThread(response.session_id);
@@ -9,7 +9,7 @@ import {
   KnowledgeBase, 
   DocumentInfo, 
   uploadDocument, 
-  getDocumentStatus, 
+  subscribeToDocumentEvents,
   chatWithKnowledgeBase,
   ChatWithKbResponse
 } from '@/lib/api';
@@ -46,12 +46,6 @@ export default function KnowledgeBaseDetailPage() {
       try {
         const kbData = await getKnowledgeBase(id as string);
         setKb(kbData);
-        
-        // Start polling for document statuses
-        const processingDocs = kbData.documents.filter(doc => doc.status === 'processing');
-        processingDocs.forEach(doc => {
-          pollDocumentStatus(kbData.id, doc.doc_id);
-        });
       } catch (error) {
         console.error('Failed to fetch knowledge base:', error);
       } finally {
@@ -67,34 +61,28 @@ export default function KnowledgeBaseDetailPage() {
     messagesEndRef.current?.scrollIntoView({ behavior: 'smooth' });
   }, [messages]);
 
-  const pollDocumentStatus = async (kbId: string, docId: string, attempts = 0) => {
-    if (attempts > 20) return; // Limit polling attempts
+  useEffect(() => {
+    if (!kb?.id) return;
 
-    try {
-      const docInfo = await getDocumentStatus(kbId, docId);
-      
-      // Update document status in state
+    // Document statuses are pushed by the server as they change
+    return subscribeToDocumentEvents(kb.id, (event) => {
       setKb(prevKb => {
         if (!prevKb) return null;
-        
-        const updatedDocs = prevKb.documents.map(doc => 
-          doc.doc_id === docId ? docInfo : doc
+
+        const exists = prevKb.documents.some(doc => doc.doc_id === event.doc_id);
+        if (!exists) return prevKb;
+
+        const updatedDocs = prevKb.documents.map(doc =>
+          doc.doc_id === event.doc_id ? { ...doc, status: event.status } : doc
         );
-        
+
         return {
           ...prevKb,
           documents: updatedDocs
         };
       });
-      
-      // Continue polling if still processing
-      if (docInfo.status === 'processing') {
-        setTimeout(() => pollDocumentStatus(kbId, docId, attempts + 1), 3000);
-      }
-    } catch (error) {
-      console.error('Error polling document status:', error);
-    }
-  };
+    });
+  }, [kb?.id]);
 
   const handleFileChange = (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files[0]) {
@@ -109,18 +97,16 @@ export default function KnowledgeBaseDetailPage() {
     try {
       const docInfo = await uploadDocument(kb.id, selectedFile);
       
-      // Update KB with new document
+      // Update KB with new document, unless the upload matched an existing one
       setKb(prevKb => {
         if (!prevKb) return null;
+        if (prevKb.documents.some(doc => doc.doc_id === docInfo.doc_id)) return prevKb;
         return {
           ...prevKb,
           documents: [...prevKb.documents, docInfo]
         };
       });
       
-      // Start polling for document status
-      pollDocumentStatus(kb.id, docInfo.doc_id);
-      
       // Reset file input
       setSelectedFile(null);
       if (fileInputRef.current) {
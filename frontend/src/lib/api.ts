@@ -6,6 +6,7 @@ export interface Flow {
   description?: string;
   system_prompt: string;
   model: string;
+  kb_ids?: string[];
   creator_email: string;
   created_at: string;
   updated_at: string;
@@ -16,6 +17,7 @@ export interface FlowCreate {
   description?: string;
   system_prompt: string;
   model: string;
+  kb_ids?: string[];
   creator_email: string;
 }
 
@@ -24,6 +26,17 @@ export interface FlowUpdate {
   description?: string;
   system_prompt?: string;
   model?: string;
+  kb_ids?: string[];
+}
+
+export interface FlowSearchResult {
+  id: string;
+  name: string;
+  description?: string;
+  model: string;
+  creator_email: string;
+  updated_at: string;
+  score?: number;
 }
 
 export interface Message {
@@ -38,6 +51,8 @@ export interface ChatSession {
   user_email: string;
   title: string;
   messages: Message[];
+  summary?: string;
+  summary_message_count?: number;
   created_at: string;
   updated_at: string;
 }
@@ -49,6 +64,30 @@ export interface ThreadInfo {
   created_at: string;
   updated_at: string;
   message_count: number;
+  summary?: string;
+}
+
+export interface ChatSearchMatch {
+  message_index: number;
+  role: string;
+  timestamp?: string;
+  snippet: string;
+}
+
+export interface ChatSearchHit {
+  session_id: string;
+  title: string;
+  flow_id: string;
+  updated_at: string;
+  score: number;
+  title_snippet?: string;
+  matches: ChatSearchMatch[];
+}
+
+export interface ChatSearchResponse {
+  hits: ChatSearchHit[];
+  total: number;
+  next_cursor?: string;
 }
 
 export interface ChatRequest {
@@ -57,12 +96,26 @@ export interface ChatRequest {
   message: string;
   session_id?: string;
   new_thread?: boolean;
+  delta?: boolean;  // Only return the messages the client doesn't have yet
+  cursor?: number;  // With delta, the cursor of the last response
+}
+
+export interface ChatCitation {
+  index: number;
+  text: string;
+  document_id: string;
+  document_name: string;
+  kb_id?: string;
+  similarity: number;
 }
 
 export interface ChatResponse {
   session_id: string;
   response: string;
-  messages: Message[];
+  messages: Message[];  // With delta, only the messages from offset on
+  citations?: ChatCitation[];
+  offset: number;
+  cursor: number;
 }
 
 // New interfaces for Knowledge Base
@@ -73,6 +126,7 @@ export interface DocumentInfo {
   status: string;
   upload_time: string;
   size_bytes: number;
+  content_hash?: string;
 }
 
 export interface KnowledgeBase {
@@ -104,6 +158,10 @@ export interface ChatWithKbResponse {
     file_name: string;
     page_number?: number;
   }>;
+  timings?: {
+    retrieval_ms: number;
+    generation_ms: number;
+  };
 }
 
 // User API
@@ -164,6 +222,24 @@ export const listFlows = async (creatorEmail?: string) => {
   return response.json() as Promise<Flow[]>;
 };
 
+export const searchFlows = async (
+  query: string,
+  options: { models?: string[]; creatorEmail?: string; limit?: number } = {}
+) => {
+  const params = new URLSearchParams({ q: query });
+  options.models?.forEach((model) => params.append('model', model));
+  if (options.creatorEmail) params.append('creator_email', options.creatorEmail);
+  if (options.limit) params.append('limit', String(options.limit));
+
+  const response = await fetch(`${API_URL}/api/v1/flows/search?${params.toString()}`);
+
+  if (!response.ok) {
+    throw new Error('Failed to search flows');
+  }
+
+  return response.json() as Promise<FlowSearchResult[]>;
+};
+
 export const updateFlow = async (flowId: string, update: FlowUpdate) => {
   const response = await fetch(`${API_URL}/api/v1/flows/${flowId}`, {
     method: 'PUT',
@@ -234,6 +310,25 @@ export const listUserThreads = async (userEmail: string, flowId?: string) => {
   return response.json() as Promise<ThreadInfo[]>;
 };
 
+export const searchChatHistory = async (
+  userEmail: string,
+  query: string,
+  options: { flowId?: string; limit?: number; cursor?: string } = {}
+) => {
+  const params = new URLSearchParams({ user_email: userEmail, q: query });
+  if (options.flowId) params.append('flow_id', options.flowId);
+  if (options.limit) params.append('limit', String(options.limit));
+  if (options.cursor) params.append('cursor', options.cursor);
+
+  const response = await fetch(`${API_URL}/api/v1/chat/search?${params.toString()}`);
+
+  if (!response.ok) {
+    throw new Error('Failed to search chat history');
+  }
+
+  return response.json() as Promise<ChatSearchResponse>;
+};
+
 export const updateThreadTitle = async (sessionId: string, title: string) => {
   const response = await fetch(`${API_URL}/api/v1/chat/session/${sessionId}/title?title=${encodeURIComponent(title)}`, {
     method: 'PUT',
@@ -353,6 +448,37 @@ export const getDocumentStatus = async (kbId: string, docId: string) => {
   return response.json() as Promise<DocumentInfo>;
 };
 
+export interface DocumentStatusEvent {
+  kb_id: string;
+  doc_id: string;
+  status: string;
+  previous_status?: string;
+  file_name?: string;
+  timestamp: string;
+}
+
+// Subscribe to document status changes instead of polling each document.
+// Returns a function that closes the stream.
+export const subscribeToDocumentEvents = (
+  kbId: string,
+  onStatus: (event: DocumentStatusEvent) => void,
+  onSnapshot?: (documents: DocumentInfo[]) => void
+) => {
+  const source = new EventSource(`${API_URL}/api/v1/knowledge-bases/${kbId}/events`);
+
+  source.addEventListener('status', (e) => {
+    onStatus(JSON.parse((e as MessageEvent).data) as DocumentStatusEvent);
+  });
+
+  if (onSnapshot) {
+    source.addEventListener('snapshot', (e) => {
+      onSnapshot(JSON.parse((e as MessageEvent).data) as DocumentInfo[]);
+    });
+  }
+
+  return () => source.close();
+};
+
 export const chatWithKnowledgeBase = async (kbId: string, query: string, userEmail: string, sessionId?: string) => {
   const formData = new FormData();
   formData.append('query', query);